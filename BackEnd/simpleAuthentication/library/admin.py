@@ -2,7 +2,9 @@ from django.contrib import admin
 
 # Register your models here.
 from django.contrib import admin
-from .models import Book, Borrow
+from .models import Book, Borrow, EmailOutbox, Hold
 
 admin.site.register(Book)
 admin.site.register(Borrow)
+admin.site.register(EmailOutbox)
+admin.site.register(Hold)
@@ -0,0 +1,210 @@
+# async_views.py
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponseForbidden, HttpResponseNotModified, JsonResponse, StreamingHttpResponse
+from django.utils.http import http_date, parse_etags
+from django.views import View
+from rest_framework import status
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+
+from .authentication import StatelessJWTAuthentication
+from .cache import aget_catalogue_modified, aget_catalogue_page, aget_catalogue_version, catalogue_etag, catalogue_page_key
+from .events import format_sse, get_broker
+from .file_access import get_file_url, get_file_urls
+from .models import Book, Borrow
+from .serializers import BookSerializer, BorrowSerializer
+from .views import BookListView
+
+# ─────────────────────────────────────────────
+# ASYNC VIEWS
+# ─────────────────────────────────────────────
+# Plain Django async views, served without a thread per request when
+# the project runs under ASGI (simpleAuthentication.asgi). DRF views are
+# sync, so authentication here reuses the stateless JWT class directly.
+# Each read view mirrors a DRF view in views.py, response for response,
+# and LIBRARY_ASYNC_ROUTES picks which implementation a route uses.
+
+
+def authenticate_token(request, allow_query_token=False):
+    """
+    LibraryTokenUser from the Authorization header, or None. ?token= is
+    only read when allow_query_token is set: query strings end up in
+    access logs, so only views that can't send headers take it.
+    """
+    auth = StatelessJWTAuthentication()
+    header = auth.get_header(request)
+    raw = auth.get_raw_token(header) if header else None
+    if raw is None and allow_query_token:
+        raw = request.GET.get("token")
+    if not raw:
+        return None
+    try:
+        return auth.get_user(auth.get_validated_token(raw))
+    except (InvalidToken, TokenError, AuthenticationFailed):
+        return None
+
+
+def unauthorized():
+    return json_response(
+        {"detail": "Authentication credentials were not provided or are invalid."},
+        status=status.HTTP_401_UNAUTHORIZED,
+    )
+
+
+def json_response(data, status=status.HTTP_200_OK):
+    # Same compact output as DRF's JSONRenderer
+    return JsonResponse(
+        data,
+        status=status,
+        safe=False,
+        json_dumps_params={"separators": (",", ":"), "ensure_ascii": False},
+    )
+
+
+def route_view(name, sync_view, async_view):
+    """The view for a urls.py route, per LIBRARY_ASYNC_ROUTES."""
+    if name in getattr(settings, "LIBRARY_ASYNC_ROUTES", ()):
+        return async_view.as_view()
+    return sync_view.as_view()
+
+
+# Signing may call the storage API; it shares no state with the ORM, so
+# it doesn't need to queue behind the thread that runs database work
+_file_url = sync_to_async(get_file_url, thread_sensitive=False)
+_file_urls = sync_to_async(get_file_urls, thread_sensitive=False)
+
+
+class AsyncBookListView(View):
+    """
+    Async BookListView. A cached page is answered without leaving the
+    event loop except for the borrow query; a miss is built once by the
+    sync view, which fills the cache this view reads.
+    """
+
+    async def get(self, request):
+        user = authenticate_token(request)
+        if user is None:
+            return unauthorized()
+
+        version = await aget_catalogue_version()
+        page_key = catalogue_page_key(version, request)
+        data = await aget_catalogue_page(page_key)
+        if data is None:
+            return await sync_to_async(BookListView.as_view())(request)
+
+        files = {
+            book_id: path
+            async for book_id, path in (
+                Borrow.objects
+                .filter(user_id=user.id, returned=False)
+                .values_list("book_id", "book__file")
+            )
+        }
+        borrowed = await _file_urls(user.id, files, request) if files else {}
+        etag = catalogue_etag(page_key, borrowed)
+
+        if etag in parse_etags(request.headers.get("If-None-Match", "")):
+            response = HttpResponseNotModified()
+        else:
+            books = data["results"] if isinstance(data, dict) else data
+            BookSerializer.merge_user_state(books, borrowed)
+            response = json_response(data)
+
+        response["ETag"] = etag
+        response["Last-Modified"] = http_date(await aget_catalogue_modified())
+        response["Cache-Control"] = "private, no-cache"
+        return response
+
+
+class AsyncBorrowedBooksView(View):
+    """Async BorrowedBooksView."""
+
+    async def get(self, request):
+        user = authenticate_token(request)
+        if user is None:
+            return unauthorized()
+
+        borrows = [
+            borrow
+            async for borrow in (
+                Borrow.objects
+                .filter(user_id=user.id, returned=False)
+                .select_related("book")
+                .aiterator()
+            )
+        ]
+        # Everything is loaded; serializing touches no database
+        return json_response(BorrowSerializer(borrows, many=True, context={"request": request}).data)
+
+
+class AsyncReadBookView(View):
+    """Async ReadBookView."""
+
+    async def get(self, request, book_id):
+        user = authenticate_token(request)
+        if user is None:
+            return unauthorized()
+
+        try:
+            book = await Book.objects.only("id", "file").aget(id=book_id)
+        except Book.DoesNotExist:
+            return json_response({"detail": "No Book matches the given query."}, status=status.HTTP_404_NOT_FOUND)
+
+        if not await Borrow.objects.filter(user_id=user.id, book=book, returned=False).aexists():
+            return HttpResponseForbidden("You must borrow this book to read it.")
+
+        if not book.file:
+            return json_response({"error": "Book file not available"}, status=status.HTTP_404_NOT_FOUND)
+
+        return json_response({"url": await _file_url(user.id, book.id, book.file, request)})
+
+
+class AvailabilityEventsView(View):
+    """
+    Server-Sent Events stream of availability deltas:
+        event: availability
+        data: [{"book_id": 7, "available": 0, "total": 2}, ...]
+    Only the latest delta per book is sent, batched as the client keeps
+    up. EventSource can't set headers, so ?token= is accepted as well.
+    The stream ends with an "expired" event when the access token does;
+    the client reconnects with a fresh one.
+    """
+    HEARTBEAT_SECONDS = 25
+    RETRY_MS = 5000
+
+    async def get(self, request):
+        # Under WSGI each open stream would pin a worker thread for good
+        if not isinstance(request, ASGIRequest):
+            return JsonResponse(
+                {"error": "Live updates need the ASGI server."},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE,
+            )
+        user = authenticate_token(request, allow_query_token=True)
+        if user is None:
+            return unauthorized()
+
+        response = StreamingHttpResponse(self.stream(user.token["exp"]), content_type="text/event-stream")
+        response["Cache-Control"] = "no-cache"
+        response["X-Accel-Buffering"] = "no"  # don't let a proxy buffer the stream
+        return response
+
+    async def stream(self, expires_at):
+        broker = get_broker()
+        subscription = broker.subscribe()
+        try:
+            yield f"retry: {self.RETRY_MS}\n\n".encode()
+            while True:
+                remaining = expires_at - time.time()
+                if remaining <= 0:
+                    yield format_sse("expired", {})
+                    return
+                batch = await subscription.next_batch(min(self.HEARTBEAT_SECONDS, remaining))
+                # A comment line keeps idle connections open through proxies
+                yield format_sse("availability", batch) if batch else b": ping\n\n"
+        finally:
+            # Django cancels the stream when the client disconnects
+            broker.unsubscribe(subscription)
@@ -0,0 +1,84 @@
+# authentication.py
+import copy
+import threading
+
+from cachetools import TTLCache
+from django.conf import settings
+from django.utils.functional import cached_property
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication, JWTStatelessUserAuthentication
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.settings import api_settings
+
+# ─────────────────────────────────────────────
+# STATELESS (NO DB) AUTHENTICATION
+# ─────────────────────────────────────────────
+# Tokens issued by StrictTokenObtainPairSerializer embed username,
+# is_staff and is_active, so read-only views that only need the user's
+# id can authenticate without touching auth_user.
+
+class LibraryTokenUser(TokenUser):
+
+    @cached_property
+    def is_active(self) -> bool:
+        # Tokens issued before these claims existed were only ever
+        # handed to active users
+        return self.token.get("is_active", True)
+
+
+class StatelessJWTAuthentication(JWTStatelessUserAuthentication):
+    """
+    Opt-in per view: builds a LibraryTokenUser from the token claims.
+    Only use it where request.user.id / is_staff is all the view needs.
+    """
+
+    def get_user(self, validated_token):
+        user = super().get_user(validated_token)
+        if not user.is_active:
+            raise AuthenticationFailed("User is inactive", code="user_inactive")
+        return user
+
+
+# ─────────────────────────────────────────────
+# CACHED FULL-USER AUTHENTICATION
+# ─────────────────────────────────────────────
+# Read-only views that need the real User row can opt in to a small
+# in-process LRU cache with a short TTL. Eviction only reaches the
+# current process, so other workers may serve a deactivated user until
+# the TTL runs out; everything else keeps the default JWTAuthentication.
+# Each request receives its own copy so one request can never mutate
+# another's user object.
+
+_user_cache = TTLCache(
+    maxsize=getattr(settings, "LIBRARY_AUTH_USER_CACHE_SIZE", 1024),
+    ttl=getattr(settings, "LIBRARY_AUTH_USER_CACHE_TTL", 30),
+)
+_user_cache_lock = threading.Lock()
+
+
+def evict_cached_user(user_id):
+    with _user_cache_lock:
+        _user_cache.pop(str(user_id), None)
+
+
+def clear_user_cache():
+    with _user_cache_lock:
+        _user_cache.clear()
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+
+    def get_user(self, validated_token):
+        # Claims may carry the id as int or str depending on the issuer
+        key = str(validated_token.get(api_settings.USER_ID_CLAIM))
+
+        with _user_cache_lock:
+            user = _user_cache.get(key)
+
+        if user is None:
+            # Runs the normal lookup plus the inactive / revoked checks
+            user = super().get_user(validated_token)
+            with _user_cache_lock:
+                _user_cache[key] = user
+
+        return copy.copy(user)
@@ -0,0 +1,604 @@
+# borrowing.py
+from datetime import timedelta
+from functools import partial
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Max, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+from django.shortcuts import get_object_or_404
+from django.utils import timezone
+from rest_framework import status
+
+from .events import publish_availability
+from .models import HOLD_CANCELLED, HOLD_FULFILLED, HOLD_WAITING, Book, Borrow, BorrowCounter, Hold
+from .stats import record_borrows, record_returns
+from .utils import send_email_async
+
+# ─────────────────────────────────────────────
+# BORROW / RETURN
+# ─────────────────────────────────────────────
+# Both flows run in one transaction and lean on the database for
+# correctness instead of check-then-act queries:
+#   - the per-user limit is claimed with a conditional UPDATE on
+#     BorrowCounter (which also row-locks it against concurrent borrows),
+#   - a copy of the book is taken with a conditional UPDATE on Book
+#     (available_copies > 0), which row-locks the title the same way,
+#   - duplicates are rejected by the partial unique constraint on Borrow.
+# Book.active_borrow_count and the statistics rollups (library.stats)
+# are updated in the same transaction. available_copies is generated by
+# the database from total_copies - active_borrow_count. A returned copy
+# goes straight to the head of the book's hold queue, if there is one.
+# Every count change is broadcast to live clients (library.events) once
+# the transaction commits.
+
+BORROW_LIMIT = 3
+LOAN_PERIOD = timedelta(days=14)
+
+
+class BorrowError(Exception):
+
+    def __init__(self, message, status_code=status.HTTP_400_BAD_REQUEST):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+
+
+def _ensure_counter(user_id):
+    # Idempotent, so racing first borrows of one user are fine
+    BorrowCounter.objects.bulk_create(
+        [BorrowCounter(
+            user_id=user_id,
+            active_borrows=Borrow.objects.filter(user_id=user_id, returned=False).count(),
+        )],
+        ignore_conflicts=True,
+    )
+
+
+def _claim_slot(user_id) -> bool:
+    claimed = BorrowCounter.objects.filter(
+        user_id=user_id,
+        active_borrows__lt=BORROW_LIMIT
+    ).update(active_borrows=F('active_borrows') + 1)
+
+    if claimed:
+        return True
+
+    # First borrow ever (no counter row yet) or the limit is reached
+    if not BorrowCounter.objects.filter(user_id=user_id).exists():
+        _ensure_counter(user_id)
+        return _claim_slot(user_id)
+
+    return False
+
+
+def _release_slot(user_id, count=1):
+    BorrowCounter.objects.filter(
+        user_id=user_id
+    ).update(active_borrows=Greatest(F('active_borrows') - count, 0))
+
+
+def _announce(book_ids):
+    transaction.on_commit(partial(publish_availability, list(book_ids)))
+
+
+def _claim_copy(book_id) -> bool:
+    claimed = (
+        Book.objects
+        .filter(id=book_id, available_copies__gt=0)
+        .update(active_borrow_count=F('active_borrow_count') + 1)
+    )
+    if claimed:
+        _announce([book_id])
+    return bool(claimed)
+
+
+def _adjust_active_count(book_ids, delta):
+    # One UPDATE for the whole list; the row lock serializes concurrent
+    # borrows of the same book until commit.
+    Book.objects.filter(id__in=book_ids).update(
+        active_borrow_count=Greatest(F('active_borrow_count') + delta, 0)
+    )
+    _announce(book_ids)
+
+
+def borrow_book(user, book_id) -> Borrow:
+    book = get_object_or_404(Book.objects.only('id', 'title'), id=book_id)
+
+    borrow_date = timezone.now()
+    borrow = Borrow(
+        user_id=user.id,
+        book=book,
+        borrow_date=borrow_date,
+        return_due=borrow_date + LOAN_PERIOD
+    )
+
+    try:
+        with transaction.atomic():
+            if not _claim_slot(user.id):
+                raise BorrowError(f'Borrow limit reached. Max {BORROW_LIMIT} books.', status.HTTP_403_FORBIDDEN)
+            # Insert first so a duplicate reports as such, not as out of stock
+            borrow.save(force_insert=True)
+            if not _claim_copy(book.id):
+                raise BorrowError('No copies of this book are available right now.', status.HTTP_409_CONFLICT)
+            # Checked with the book row locked by the claim above
+            hold = _hold_to_fulfil(user.id, book.id)
+            if hold is not None:
+                Hold.objects.filter(pk=hold.pk).update(status=HOLD_FULFILLED, resolved_at=borrow_date)
+            record_borrows(user.id, [book.id], borrow_date)
+    except IntegrityError:
+        # Unique constraint: the slot claim above is rolled back with it
+        raise BorrowError('You already borrowed this book.')
+
+    return borrow
+
+
+def return_book(user, book_id) -> Borrow:
+    book = get_object_or_404(Book.objects.only('id', 'title'), id=book_id)
+    returned_date = timezone.now()
+
+    with transaction.atomic():
+        borrow = (
+            Borrow.objects
+            .select_for_update()
+            .filter(user_id=user.id, book=book, returned=False)
+            .first()
+        )
+        if not borrow:
+            raise BorrowError('You have not borrowed this book or it has already been returned')
+
+        borrow.returned = True
+        borrow.returned_date = returned_date
+        borrow.save(update_fields=['returned', 'returned_date'])
+        _release_slot(user.id)
+        _adjust_active_count([book.id], -1)
+        record_returns([borrow])
+        promote_holds(book.id, 1, returned_date)
+        promote_for_holder(user.id, returned_date)
+
+    borrow.book = book
+    return borrow
+
+
+# ─────────────────────────────────────────────
+# BULK BORROW / RETURN
+# ─────────────────────────────────────────────
+# One transaction for the whole list: the user's counter row is locked
+# once, limits are checked once, and rows are written with
+# bulk_create/bulk_update. Each book gets its own result entry.
+
+def _error(book_id, message, status_code):
+    return {'book_id': book_id, 'status': status_code, 'error': message}
+
+
+def _lock_counter(user_id) -> BorrowCounter:
+    counter = BorrowCounter.objects.select_for_update().filter(user_id=user_id).first()
+    if counter is None:
+        _ensure_counter(user_id)
+        counter = BorrowCounter.objects.select_for_update().get(user_id=user_id)
+    return counter
+
+
+def bulk_borrow(user, book_ids):
+    book_ids = list(dict.fromkeys(book_ids))
+    titles = dict(Book.objects.filter(id__in=book_ids).values_list('id', 'title'))
+    borrow_date = timezone.now()
+    return_due = borrow_date + LOAN_PERIOD
+    results = []
+    to_create = []
+
+    with transaction.atomic():
+        counter = _lock_counter(user.id)
+        already = set(
+            Borrow.objects
+            .filter(user_id=user.id, book_id__in=book_ids, returned=False)
+            .values_list('book_id', flat=True)
+        )
+        free_slots = BORROW_LIMIT - counter.active_borrows
+        fulfilled = []
+        # Lock the titles in id order (concurrent bulk borrows of
+        # overlapping lists can't deadlock) and read their stock once
+        available = dict(
+            Book.objects
+            .select_for_update()
+            .filter(id__in=set(titles) - already)
+            .order_by('id')
+            .values_list('id', 'available_copies')
+        )
+
+        for book_id in book_ids:
+            if book_id not in titles:
+                results.append(_error(book_id, 'Book not found.', status.HTTP_404_NOT_FOUND))
+            elif book_id in already:
+                results.append(_error(book_id, 'You already borrowed this book.', status.HTTP_400_BAD_REQUEST))
+            elif len(to_create) >= free_slots:
+                results.append(_error(book_id, f'Borrow limit reached. Max {BORROW_LIMIT} books.', status.HTTP_403_FORBIDDEN))
+            elif available.get(book_id, 0) <= 0:
+                results.append(_error(book_id, 'No copies of this book are available right now.', status.HTTP_409_CONFLICT))
+            elif (queued := _queue_error(user.id, book_id, fulfilled)) is not None:
+                results.append(queued)
+            else:
+                to_create.append(Borrow(
+                    user_id=user.id,
+                    book_id=book_id,
+                    borrow_date=borrow_date,
+                    return_due=return_due
+                ))
+                results.append({
+                    'book_id': book_id,
+                    'status': status.HTTP_201_CREATED,
+                    'message': f'You have borrowed "{titles[book_id]}".',
+                    'borrow_date': borrow_date,
+                    'return_due': return_due,
+                })
+
+        if to_create:
+            Borrow.objects.bulk_create(to_create)
+            counter.active_borrows += len(to_create)
+            counter.save(update_fields=['active_borrows'])
+            _adjust_active_count([b.book_id for b in to_create], 1)
+            Hold.objects.filter(pk__in=fulfilled).update(status=HOLD_FULFILLED, resolved_at=borrow_date)
+            record_borrows(user.id, [b.book_id for b in to_create], borrow_date)
+
+    return results
+
+
+def _queue_error(user_id, book_id, fulfilled):
+    # bulk_borrow's per-book form of _hold_to_fulfil
+    try:
+        hold = _hold_to_fulfil(user_id, book_id)
+    except BorrowError as e:
+        return _error(book_id, e.message, e.status_code)
+    if hold is not None:
+        fulfilled.append(hold.pk)
+    return None
+
+
+def bulk_return(user, book_ids):
+    book_ids = list(dict.fromkeys(book_ids))
+    titles = dict(Book.objects.filter(id__in=book_ids).values_list('id', 'title'))
+    returned_date = timezone.now()
+
+    with transaction.atomic():
+        borrows = list(
+            Borrow.objects
+            .select_for_update()
+            .filter(user_id=user.id, book_id__in=book_ids, returned=False)
+        )
+        for borrow in borrows:
+            borrow.returned = True
+            borrow.returned_date = returned_date
+
+        if borrows:
+            Borrow.objects.bulk_update(borrows, ['returned', 'returned_date'])
+            _release_slot(user.id, len(borrows))
+            _adjust_active_count([b.book_id for b in borrows], -1)
+            record_returns(borrows)
+            for book_id in sorted({b.book_id for b in borrows}):
+                promote_holds(book_id, 1, returned_date)
+            promote_for_holder(user.id, returned_date)
+
+    returned_ids = {b.book_id for b in borrows}
+    results = []
+    for book_id in book_ids:
+        if book_id not in titles:
+            results.append(_error(book_id, 'Book not found.', status.HTTP_404_NOT_FOUND))
+        elif book_id not in returned_ids:
+            results.append(_error(book_id, 'You have not borrowed this book or it has already been returned', status.HTTP_400_BAD_REQUEST))
+        else:
+            results.append({
+                'book_id': book_id,
+                'status': status.HTTP_200_OK,
+                'message': f'You have successfully returned "{titles[book_id]}".',
+                'returned_date': returned_date,
+            })
+    return results
+
+
+# ─────────────────────────────────────────────
+# RECONCILIATION
+# ─────────────────────────────────────────────
+
+def find_count_drift():
+    """Books whose active_borrow_count disagrees with Borrow: (id, stored, actual)."""
+    active = (
+        Borrow.objects
+        .filter(book=OuterRef('pk'), returned=False)
+        .order_by()
+        .values('book')
+        .annotate(n=Count('id'))
+        .values('n')
+    )
+    return (
+        Book.objects
+        .annotate(actual=Coalesce(Subquery(active), 0))
+        .exclude(active_borrow_count=F('actual'))
+        .order_by('id')
+        .values_list('id', 'active_borrow_count', 'actual')
+    )
+
+
+def reconcile_active_counts(batch_size=1000, dry_run=False):
+    """Rewrite drifted counts in batches. Returns the drifted rows."""
+    drift = list(find_count_drift())
+    if dry_run:
+        return drift
+
+    for i in range(0, len(drift), batch_size):
+        with transaction.atomic():
+            ids = [book_id for book_id, _, _ in drift[i:i + batch_size]]
+            # Borrows and returns hold the book row until they commit, so
+            # counting after taking the locks can't miss one in flight
+            list(Book.objects.select_for_update().filter(id__in=ids).order_by('id').values_list('id'))
+            actual = dict(
+                Borrow.objects
+                .filter(book_id__in=ids, returned=False)
+                .values_list('book_id')
+                .annotate(n=Count('id'))
+                .order_by()
+            )
+            Book.objects.bulk_update(
+                [Book(id=book_id, active_borrow_count=actual.get(book_id, 0)) for book_id in ids],
+                ['active_borrow_count'],
+            )
+            _announce(ids)
+    return drift
+
+
+def find_counter_drift():
+    """BorrowCounters that disagree with open Borrows: (user_id, stored, actual)."""
+    active = (
+        Borrow.objects
+        .filter(user_id=OuterRef('user_id'), returned=False)
+        .order_by()
+        .values('user_id')
+        .annotate(n=Count('id'))
+        .values('n')
+    )
+    return (
+        BorrowCounter.objects
+        .annotate(actual=Coalesce(Subquery(active), 0))
+        .exclude(active_borrows=F('actual'))
+        .order_by('user_id')
+        .values_list('user_id', 'active_borrows', 'actual')
+    )
+
+
+def reconcile_borrow_counters(batch_size=1000, dry_run=False):
+    """
+    Rewrite drifted BorrowCounters in batches (a loan closed in the admin
+    leaves its reader's counter high). Returns the drifted rows.
+    """
+    drift = list(find_counter_drift())
+    if dry_run:
+        return drift
+
+    now = timezone.now()
+    for i in range(0, len(drift), batch_size):
+        with transaction.atomic():
+            user_ids = [user_id for user_id, _, _ in drift[i:i + batch_size]]
+            # Borrows claim the counter row first, so counting after
+            # taking the locks can't miss one in flight
+            before = dict(
+                BorrowCounter.objects
+                .select_for_update()
+                .filter(user_id__in=user_ids)
+                .order_by('user_id')
+                .values_list('user_id', 'active_borrows')
+            )
+            actual = dict(
+                Borrow.objects
+                .filter(user_id__in=user_ids, returned=False)
+                .values_list('user_id')
+                .annotate(n=Count('id'))
+                .order_by()
+            )
+            BorrowCounter.objects.bulk_update(
+                [BorrowCounter(user_id=user_id, active_borrows=actual.get(user_id, 0)) for user_id in before],
+                ['active_borrows'],
+            )
+            # Freed slots may let these readers take a held copy
+            for user_id, stored in before.items():
+                if actual.get(user_id, 0) < stored:
+                    promote_for_holder(user_id, now)
+    return drift
+
+
+# ─────────────────────────────────────────────
+# HOLDS
+# ─────────────────────────────────────────────
+# Readers queue for a book that has no copy left. Positions only grow,
+# so the next in line and a reader's place are both range scans on the
+# partial (book, position) index over waiting holds. When a copy comes
+# back, the return transaction borrows it for the first holder who has
+# a free slot and queues their email in the outbox. While anyone waits,
+# only that holder may borrow the title directly. A copy passed over
+# because every holder in reach was at the limit is offered again when
+# a holder's slot frees up or the queue changes.
+
+HOLD_PROMOTION_SCAN = 20
+
+
+def queue_position(hold) -> int:
+    """1-based place of a waiting hold in its book's queue."""
+    return Hold.objects.filter(
+        book_id=hold.book_id,
+        status=HOLD_WAITING,
+        position__lt=hold.position,
+    ).count() + 1
+
+
+def place_hold(user, book_id) -> Hold:
+    book = get_object_or_404(Book.objects.only('id', 'title'), id=book_id)
+
+    with transaction.atomic():
+        # The book row lock orders this against returns, so a copy can't
+        # come back between the check and the insert unnoticed
+        available = (
+            Book.objects
+            .select_for_update()
+            .filter(id=book.id)
+            .values_list('available_copies', flat=True)
+            .get()
+        )
+        # A free copy can still have a queue (every holder in reach was at
+        # the limit); then newcomers join it instead of borrowing
+        if available > 0 and not Hold.objects.filter(book_id=book.id, status=HOLD_WAITING).exists():
+            raise BorrowError('A copy is available; borrow it instead.', status.HTTP_409_CONFLICT)
+        if Borrow.objects.filter(user_id=user.id, book_id=book.id, returned=False).exists():
+            raise BorrowError('You already borrowed this book.')
+
+        last = Hold.objects.filter(book_id=book.id).aggregate(last=Max('position'))['last'] or 0
+        hold = Hold(user_id=user.id, book=book, position=last + 1)
+        try:
+            with transaction.atomic():
+                hold.save(force_insert=True)
+        except IntegrityError:
+            raise BorrowError('You are already in the queue for this book.')
+
+    return hold
+
+
+def get_hold(user, book_id) -> Hold:
+    hold = Hold.objects.filter(user_id=user.id, book_id=book_id, status=HOLD_WAITING).first()
+    if hold is None:
+        raise BorrowError('You are not in the queue for this book.', status.HTTP_404_NOT_FOUND)
+    return hold
+
+
+def cancel_hold(user, book_id):
+    now = timezone.now()
+    with transaction.atomic():
+        cancelled = Hold.objects.filter(
+            user_id=user.id,
+            book_id=book_id,
+            status=HOLD_WAITING,
+        ).update(status=HOLD_CANCELLED, resolved_at=now)
+
+        if not cancelled:
+            raise BorrowError('You are not in the queue for this book.', status.HTTP_404_NOT_FOUND)
+        # The next reader may be able to take a copy this one was holding up
+        _promote_free_copies(book_id, now)
+
+
+def _hold_to_fulfil(user_id, book_id) -> Hold | None:
+    """
+    While readers queue for a book, only the first holder with a free
+    slot may take a copy. Returns that reader's hold, or None when nobody
+    is waiting; raises BorrowError (409) for anyone else.
+    """
+    waiting = Hold.objects.filter(book_id=book_id, status=HOLD_WAITING)
+    if not waiting.exists():
+        return None
+
+    hold = waiting.filter(user_id=user_id).first()
+    if hold is not None:
+        # Holders ahead who are at the limit would be passed over anyway
+        ahead = (
+            waiting
+            .filter(position__lt=hold.position)
+            .exclude(user__borrow_counter__active_borrows__gte=BORROW_LIMIT)
+        )
+        if not ahead.exists():
+            return hold
+    raise BorrowError('Other readers are waiting for this book; join the queue.', status.HTTP_409_CONFLICT)
+
+
+def _lock_free_counter(user_id):
+    # skip_locked: a holder whose counter is held by another transaction
+    # (say, their own return promoting someone else) is passed over for
+    # this copy rather than risking a deadlock between the two returns
+    counters = BorrowCounter.objects.select_for_update(skip_locked=True).filter(user_id=user_id)
+    counter = counters.first()
+    if counter is None and not BorrowCounter.objects.filter(user_id=user_id).exists():
+        _ensure_counter(user_id)
+        counter = counters.first()
+    return counter
+
+
+def _notify_promoted(hold, borrow):
+    if not hold.user.email:
+        return
+    send_email_async(
+        subject='Your hold is ready',
+        message=(
+            f"Hello {hold.user.username},\n\n"
+            f'"{hold.book.title}" was returned and is now borrowed for you. '
+            f"It is due back on {timezone.localdate(borrow.return_due):%Y-%m-%d}."
+        ),
+        recipient_list=[hold.user.email],
+    )
+
+
+def promote_holds(book_id, copies, when) -> list[Hold]:
+    """
+    Hand up to `copies` free copies of a book to the front of its queue.
+    Must run inside the transaction that freed them.
+    """
+    promoted = []
+    candidates = (
+        Hold.objects
+        .filter(book_id=book_id, status=HOLD_WAITING)
+        .select_related('user', 'book')
+        .order_by('position')[:HOLD_PROMOTION_SCAN]
+    )
+
+    for hold in candidates:
+        if len(promoted) >= copies:
+            break
+
+        counter = _lock_free_counter(hold.user_id)
+        if counter is None or counter.active_borrows >= BORROW_LIMIT:
+            # Keeps their place; the copy goes to the next reader
+            continue
+
+        borrow = Borrow(user_id=hold.user_id, book_id=book_id, borrow_date=when, return_due=when + LOAN_PERIOD)
+        try:
+            with transaction.atomic():
+                borrow.save(force_insert=True)
+        except IntegrityError:
+            # Already has the book (borrowed while a copy was free)
+            Hold.objects.filter(pk=hold.pk).update(status=HOLD_CANCELLED, resolved_at=when)
+            continue
+
+        if not _claim_copy(book_id):
+            # Copies were reduced under us; nothing left to hand out
+            borrow.delete()
+            break
+
+        counter.active_borrows += 1
+        counter.save(update_fields=['active_borrows'])
+        Hold.objects.filter(pk=hold.pk).update(status=HOLD_FULFILLED, resolved_at=when)
+        record_borrows(hold.user_id, [book_id], when)
+        _notify_promoted(hold, borrow)
+        promoted.append(hold)
+
+    return promoted
+
+
+def _promote_free_copies(book_id, when):
+    # skip_locked: a book locked by another borrow or return is settled
+    # by that transaction, and waiting for it could deadlock
+    available = (
+        Book.objects
+        .select_for_update(skip_locked=True)
+        .filter(id=book_id)
+        .values_list('available_copies', flat=True)
+        .first()
+    )
+    if available is not None and available > 0:
+        promote_holds(book_id, available, when)
+
+
+def promote_for_holder(user_id, when):
+    """
+    Called when a reader's slot frees up: hand them (or whoever is ahead
+    of them) any copy of a book they wait for that was passed over.
+    """
+    book_ids = list(
+        Hold.objects
+        .filter(user_id=user_id, status=HOLD_WAITING, book__available_copies__gt=0)
+        .order_by('book_id')
+        .values_list('book_id', flat=True)[:HOLD_PROMOTION_SCAN]
+    )
+    for book_id in book_ids:
+        _promote_free_copies(book_id, when)
@@ -0,0 +1,100 @@
+# cache.py
+import hashlib
+import time
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.db.models import F
+from django.utils import timezone
+
+from .models import CatalogueVersion
+
+# ─────────────────────────────────────────────
+# CATALOGUE VERSION
+# ─────────────────────────────────────────────
+# Cached catalogue pages are keyed by a generation number. Writes never
+# delete pages; they bump the generation, so stale pages simply stop
+# being read and age out of the cache on their own. The generation is a
+# CatalogueVersion row, so bumps from commands reach every worker even on
+# local memory caches; each process re-reads it at most every
+# CATALOGUE_VERSION_TTL seconds.
+
+CATALOGUE_VERSION_KEY = "library:catalogue:version"
+CATALOGUE_VERSION_TTL = 5
+CATALOGUE_PAGE_TTL = 60 * 60
+
+
+def _load_catalogue_state() -> tuple[int, float]:
+    row = CatalogueVersion.objects.filter(pk=1).values_list("version", "modified").first()
+    if row is None:
+        # Seed from the clock so a new row never reuses a generation
+        # still held by an older shared cache
+        created, _ = CatalogueVersion.objects.get_or_create(pk=1, defaults={"version": time.time_ns() // 1_000_000})
+        row = (created.version, created.modified)
+
+    state = (row[0], row[1].timestamp())
+    cache.set(CATALOGUE_VERSION_KEY, state, CATALOGUE_VERSION_TTL)
+    return state
+
+
+def _catalogue_state() -> tuple[int, float]:
+    return cache.get(CATALOGUE_VERSION_KEY) or _load_catalogue_state()
+
+
+async def _acatalogue_state() -> tuple[int, float]:
+    return await cache.aget(CATALOGUE_VERSION_KEY) or await sync_to_async(_load_catalogue_state)()
+
+
+def get_catalogue_version() -> int:
+    return _catalogue_state()[0]
+
+
+def get_catalogue_modified() -> float:
+    return _catalogue_state()[1]
+
+
+async def aget_catalogue_version() -> int:
+    return (await _acatalogue_state())[0]
+
+
+async def aget_catalogue_modified() -> float:
+    return (await _acatalogue_state())[1]
+
+
+def bump_catalogue_version():
+    changes = {"version": F("version") + 1, "modified": timezone.now()}
+    if not CatalogueVersion.objects.filter(pk=1).update(**changes):
+        _load_catalogue_state()
+        CatalogueVersion.objects.filter(pk=1).update(**changes)
+    # Visible at once in this process (and everywhere on a shared cache)
+    _load_catalogue_state()
+
+
+# ─────────────────────────────────────────────
+# CATALOGUE PAGES
+# ─────────────────────────────────────────────
+
+def catalogue_page_key(version: int, request) -> str:
+    # Absolute URI covers host, path and every query parameter
+    digest = hashlib.md5(request.build_absolute_uri().encode()).hexdigest()
+    return f"library:catalogue:{version}:{digest}"
+
+
+def get_catalogue_page(key: str):
+    return cache.get(key)
+
+
+async def aget_catalogue_page(key: str):
+    return await cache.aget(key)
+
+
+def set_catalogue_page(key: str, page: dict, ttl: int = CATALOGUE_PAGE_TTL):
+    cache.set(key, page, ttl)
+
+
+def catalogue_etag(page_key: str, borrowed: dict) -> str:
+    # The page key already carries the version; the user's active borrows
+    # ({book_id: file URL}) are folded in so a borrow, return or re-signed
+    # URL changes the tag too.
+    raw = f"{page_key}:{sorted(borrowed.items())}"
+    return '"' + hashlib.md5(raw.encode()).hexdigest() + '"'
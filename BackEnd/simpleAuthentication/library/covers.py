@@ -0,0 +1,137 @@
+# covers.py
+import logging
+import multiprocessing
+import os
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from PIL import Image, ImageOps
+
+from .storage import file_sha256, get_storage_backend
+
+logger = logging.getLogger(__name__)
+
+# ─────────────────────────────────────────────
+# COVER VARIANTS
+# ─────────────────────────────────────────────
+# Each uploaded cover is re-encoded into a few widths as WebP and JPEG,
+# so the catalogue grid can download thumbnails instead of originals.
+# Variants are stored under the SHA-256 of the original, which makes the
+# work idempotent: an unchanged or duplicate cover reuses what exists.
+# Decoding and resizing are CPU bound, so they run in a process pool.
+
+COVER_WIDTHS = (160, 320, 640)
+COVER_FORMATS = (
+    ("webp", "WEBP", "image/webp", {"quality": 80, "method": 4}),
+    ("jpeg", "JPEG", "image/jpeg", {"quality": 82, "optimize": True, "progressive": True}),
+)
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn, not fork: the parent runs threads (uploads, outbox)
+            _pool = ProcessPoolExecutor(
+                max_workers=getattr(settings, "LIBRARY_COVER_WORKERS", 2),
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _pool
+
+
+def image_content_type(source) -> str:
+    """
+    Content type from the image bytes, not the uploaded file name. source
+    is a path or a seekable file, which is left open.
+    """
+    try:
+        with Image.open(source) as image:
+            return Image.MIME.get(image.format, "application/octet-stream")
+    except (OSError, ValueError):
+        return "application/octet-stream"
+
+
+def render_cover_variants(source: str, out_dir: str) -> list[dict]:
+    """
+    Runs in a worker process: write every width/format of source into
+    out_dir and describe them. Never upscales past the original width.
+    """
+    with Image.open(source) as image:
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA" if "transparency" in image.info else "RGB")
+
+        widths = [w for w in COVER_WIDTHS if w < image.width] or [image.width]
+        variants = []
+
+        for width in widths:
+            height = max(round(image.height * width / image.width), 1)
+            resized = image.resize((width, height), Image.Resampling.LANCZOS)
+
+            for ext, pil_format, content_type, options in COVER_FORMATS:
+                frame = resized
+                if pil_format == "JPEG" and frame.mode == "RGBA":
+                    # JPEG has no alpha; flatten onto white
+                    frame = Image.new("RGB", frame.size, "white")
+                    frame.paste(resized, mask=resized.getchannel("A"))
+
+                local = os.path.join(out_dir, f"{width}.{ext}")
+                frame.save(local, pil_format, **options)
+                variants.append({
+                    "width": width,
+                    "format": ext,
+                    "content_type": content_type,
+                    "local": local,
+                })
+
+    return variants
+
+
+def cover_variant_path(content_hash: str, width: int, ext: str) -> str:
+    return f"book_covers/{content_hash}/{width}.{ext}"
+
+
+def build_cover_variants(book_id: int, source: str):
+    """
+    Create, upload and record the variants for a book's freshly uploaded
+    cover. Called from the upload worker once the original is stored.
+    """
+    from .cache import bump_catalogue_version
+    from .models import Book
+
+    content_hash = file_sha256(source)
+
+    # Same bytes as this or another book's cover: nothing to encode
+    existing = (
+        Book.objects
+        .filter(photo_hash=content_hash)
+        .exclude(photo_variants=[])
+        .values_list("photo_variants", flat=True)
+        .first()
+    )
+
+    if existing:
+        variants = existing
+    else:
+        with tempfile.TemporaryDirectory(prefix="book-cover-") as out_dir:
+            if getattr(settings, "LIBRARY_UPLOADS_EAGER", False):
+                rendered = render_cover_variants(source, out_dir)
+            else:
+                rendered = _get_pool().submit(render_cover_variants, source, out_dir).result()
+
+            backend = get_storage_backend()
+            variants = []
+            for variant in rendered:
+                path = cover_variant_path(content_hash, variant["width"], variant["format"])
+                backend.upload(path, variant["local"], variant["content_type"])
+                variants.append({"width": variant["width"], "format": variant["format"], "path": path})
+
+    Book.objects.filter(pk=book_id).update(photo_hash=content_hash, photo_variants=variants)
+    # Queryset updates skip post_save, so refresh cached pages here
+    bump_catalogue_version()
+    logger.info(f"Cover variants ready for book {book_id} ({len(variants)} file(s))")
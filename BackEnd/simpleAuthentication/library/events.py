@@ -0,0 +1,185 @@
+# events.py
+import asyncio
+import json
+import logging
+import threading
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+# ─────────────────────────────────────────────
+# LIVE AVAILABILITY EVENTS
+# ─────────────────────────────────────────────
+# After a borrow, return or stock change commits, the new counts of the
+# touched books are published as small deltas. Each open event stream is
+# a Subscription living on the ASGI event loop: it keeps only the latest
+# delta per book until the client reads it, so a slow client costs at
+# most one entry per book and never a thread. A publish wakes each event
+# loop once, however many streams it serves. InProcessBroker fans out
+# inside one process; RedisBroker relays through Redis pub/sub so every
+# worker sees every change, with one Redis connection per worker.
+
+
+class Subscription:
+
+    def __init__(self, loop):
+        self.loop = loop
+        self._pending = {}
+        self._ready = asyncio.Event()
+
+    def merge(self, event: dict):
+        """Runs on self.loop."""
+        self._pending[event["book_id"]] = event
+        self._ready.set()
+
+    async def next_batch(self, timeout: float) -> list[dict]:
+        """Deltas since the last call, or [] after timeout."""
+        # asyncio.timeout, not wait_for: wait_for can swallow the
+        # cancellation that signals a client disconnect
+        try:
+            async with asyncio.timeout(timeout):
+                await self._ready.wait()
+        except TimeoutError:
+            return []
+        self._ready.clear()
+        batch = list(self._pending.values())
+        self._pending.clear()
+        return batch
+
+
+class InProcessBroker:
+    """Delivers to subscribers in this process only."""
+
+    def __init__(self):
+        self._loops = {}  # event loop -> its subscriptions
+        self._lock = threading.Lock()
+
+    def has_audience(self) -> bool:
+        return bool(self._loops)
+
+    def publish(self, event: dict):
+        """Thread safe; callable from sync code."""
+        self._deliver(event)
+
+    def _deliver(self, event: dict):
+        with self._lock:
+            loops = list(self._loops)
+        for loop in loops:
+            try:
+                loop.call_soon_threadsafe(self._fan_out, loop, event)
+            except RuntimeError:
+                pass  # loop already closed
+
+    def _fan_out(self, loop, event: dict):
+        with self._lock:
+            subscriptions = list(self._loops.get(loop, ()))
+        for subscription in subscriptions:
+            subscription.merge(event)
+
+    def subscribe(self) -> Subscription:
+        """Call from the event loop that will read the subscription."""
+        subscription = Subscription(asyncio.get_running_loop())
+        with self._lock:
+            self._loops.setdefault(subscription.loop, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            subscriptions = self._loops.get(subscription.loop, set())
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                self._loops.pop(subscription.loop, None)
+
+
+class RedisBroker(InProcessBroker):
+    """
+    Publishes through Redis (REDIS_URL); each process runs one listener
+    task that hands messages to its local subscribers.
+    """
+
+    channel = "library:availability"
+
+    def __init__(self):
+        super().__init__()
+        self._url = settings.REDIS_URL
+        self._client = None
+        self._listener = None
+
+    def has_audience(self) -> bool:
+        # Subscribers may be in any worker
+        return True
+
+    def publish(self, event: dict):
+        import redis
+
+        if self._client is None:
+            self._client = redis.Redis.from_url(self._url)
+        self._client.publish(self.channel, json.dumps(event, separators=(",", ":")))
+
+    def subscribe(self) -> Subscription:
+        if self._listener is None or self._listener.done():
+            self._listener = asyncio.get_running_loop().create_task(self._listen())
+        return super().subscribe()
+
+    async def _listen(self):
+        import redis.asyncio as aioredis
+
+        while True:
+            try:
+                client = aioredis.Redis.from_url(self._url)
+                async with client.pubsub() as pubsub:
+                    await pubsub.subscribe(self.channel)
+                    async for message in pubsub.listen():
+                        if message["type"] == "message":
+                            self._deliver(json.loads(message["data"]))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Availability listener lost Redis, retrying: {e}")
+                await asyncio.sleep(1)
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker() -> InProcessBroker:
+    global _broker
+    with _broker_lock:
+        if _broker is None:
+            backend_path = getattr(settings, "LIBRARY_EVENTS_BACKEND", "library.events.InProcessBroker")
+            _broker = import_string(backend_path)()
+        return _broker
+
+
+@receiver(setting_changed)
+def reset_broker(setting=None, **kwargs):
+    """Forget the cached broker when its setting changes (tests)."""
+    global _broker
+    if setting in (None, "LIBRARY_EVENTS_BACKEND"):
+        _broker = None
+
+
+def publish_availability(book_ids):
+    """Runs after commit: read the committed counts and broadcast them."""
+    from .models import Book
+
+    broker = get_broker()
+    if not broker.has_audience():
+        return
+
+    rows = Book.objects.filter(id__in=set(book_ids)).values_list("id", "available_copies", "total_copies")
+    try:
+        for book_id, available, total in rows:
+            broker.publish({"book_id": book_id, "available": max(available, 0), "total": total})
+    except Exception as e:
+        # The change is committed; a lost delta only delays the client
+        logger.warning(f"Could not publish availability for {sorted(set(book_ids))}: {e}")
+
+
+def format_sse(event: str, data) -> bytes:
+    return f"event: {event}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n".encode()
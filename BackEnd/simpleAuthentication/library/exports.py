@@ -0,0 +1,108 @@
+# exports.py
+import csv
+from datetime import datetime, time
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from .models import Borrow
+
+# ─────────────────────────────────────────────
+# BORROW HISTORY EXPORT
+# ─────────────────────────────────────────────
+# Rows come off QuerySet.iterator() (a server-side cursor on PostgreSQL)
+# as flat tuples and are encoded straight into output chunks, so an
+# export of any size runs in constant memory. The generator is sync, so
+# the route belongs on the WSGI service: under ASGI Django would drain it
+# into memory before sending.
+
+EXPORT_COLUMNS = (
+    ("id", "id"),
+    ("user_id", "user_id"),
+    ("username", "user__username"),
+    ("book_id", "book_id"),
+    ("title", "book__title"),
+    ("author", "book__author"),
+    ("borrow_date", "borrow_date"),
+    ("return_due", "return_due"),
+    ("returned", "returned"),
+    ("returned_date", "returned_date"),
+)
+EXPORT_FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+EXPORT_CHUNK_SIZE = 2000
+EXPORT_FLUSH_BYTES = 64 * 1024
+
+
+def parse_export_bound(value, name):
+    """Accept a date or datetime; naive values are taken as local time."""
+    if not value:
+        return None
+    parsed = parse_datetime(value)
+    if parsed is None:
+        date = parse_date(value)
+        if date is None:
+            raise ValueError(f"Invalid {name}: {value!r}. Use YYYY-MM-DD or an ISO datetime.")
+        parsed = datetime.combine(date, time.min)
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def export_rows(start=None, end=None, chunk_size=EXPORT_CHUNK_SIZE):
+    """Borrow rows with borrow_date in [start, end), oldest first."""
+    borrows = Borrow.objects.all()
+    if start:
+        borrows = borrows.filter(borrow_date__gte=start)
+    if end:
+        borrows = borrows.filter(borrow_date__lt=end)
+
+    return (
+        borrows
+        .order_by("borrow_date", "id")
+        .values_list(*(path for _, path in EXPORT_COLUMNS))
+        .iterator(chunk_size=chunk_size)
+    )
+
+
+class _LineBuffer:
+    """File-like sink for csv.writer that hands back what was written."""
+
+    def write(self, value):
+        return value
+
+
+def _encode_ndjson(rows):
+    names = [name for name, _ in EXPORT_COLUMNS]
+    encoder = DjangoJSONEncoder(separators=(",", ":"))
+    for row in rows:
+        yield encoder.encode(dict(zip(names, row))) + "\n"
+
+
+def _encode_csv(rows):
+    writer = csv.writer(_LineBuffer())
+    yield writer.writerow([name for name, _ in EXPORT_COLUMNS])
+    for row in rows:
+        yield writer.writerow(
+            [value.isoformat() if hasattr(value, "isoformat") else value for value in row]
+        )
+
+
+def stream_export(fmt, rows):
+    """
+    Yield the export as byte chunks of roughly EXPORT_FLUSH_BYTES, so the
+    response isn't one tiny write per row.
+    """
+    encode = _encode_csv if fmt == "csv" else _encode_ndjson
+    buffer, size = [], 0
+    for line in encode(rows):
+        buffer.append(line)
+        size += len(line)
+        if size >= EXPORT_FLUSH_BYTES:
+            yield "".join(buffer).encode()
+            buffer, size = [], 0
+    if buffer:
+        yield "".join(buffer).encode()
@@ -0,0 +1,56 @@
+# file_access.py
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .storage import get_storage_backend
+
+# ─────────────────────────────────────────────
+# SIGNED FILE URLS
+# ─────────────────────────────────────────────
+# Book files are never handed out as public URLs. Borrowers get a signed
+# URL that expires after LIBRARY_FILE_URL_TTL seconds. Each URL is cached
+# per (user, book) and dropped a little before it expires, so repeated
+# reads and catalogue pages reuse it instead of signing again.
+
+FILE_URL_REFRESH_MARGIN = 60
+
+
+def _file_url_ttl() -> int:
+    return getattr(settings, "LIBRARY_FILE_URL_TTL", 15 * 60)
+
+
+def _file_url_key(user_id, book_id, path: str) -> str:
+    # The path is part of the key so a replaced file gets a new URL
+    digest = hashlib.md5(path.encode()).hexdigest()
+    return f"library:file-url:{user_id}:{book_id}:{digest}"
+
+
+def get_file_url(user_id, book_id, path, request=None) -> str | None:
+    if not path:
+        return None
+
+    path = str(path).lstrip("/")
+
+    # Legacy rows may store a full URL; there is nothing to sign
+    if path.startswith("http"):
+        return path
+
+    key = _file_url_key(user_id, book_id, path)
+    url = cache.get(key)
+    if url is None:
+        ttl = _file_url_ttl()
+        url = get_storage_backend().signed_url(path, ttl)
+        cache.set(key, url, max(ttl - FILE_URL_REFRESH_MARGIN, 1))
+
+    # Local signed URLs are relative to this API; clients may live elsewhere
+    return request.build_absolute_uri(url) if request else url
+
+
+def get_file_urls(user_id, files: dict, request=None) -> dict:
+    """Map {book_id: file path} to {book_id: signed URL or None}."""
+    return {
+        book_id: get_file_url(user_id, book_id, path, request)
+        for book_id, path in files.items()
+    }
@@ -0,0 +1,115 @@
+# file_cache.py
+import hashlib
+import os
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from django.conf import settings
+
+from .storage import get_storage_backend
+
+# ─────────────────────────────────────────────
+# LOCAL BOOK FILE CACHE
+# ─────────────────────────────────────────────
+# The stream endpoint serves byte ranges from local disk. Objects that
+# only exist in remote storage are downloaded once into a bounded
+# directory and evicted least recently used first. Recency is the file
+# mtime, so every worker process on the machine shares one cache.
+
+FILE_CACHE_TOUCH_INTERVAL = 60
+FILL_LOCK_STRIPES = 64
+
+# A fixed set of locks, picked by entry name: memory stays bounded however
+# many objects are fetched, at the cost of rare waits on unrelated fills
+_fill_locks = [threading.Lock() for _ in range(FILL_LOCK_STRIPES)]
+
+
+def _cache_dir() -> Path:
+    root = Path(getattr(settings, "LIBRARY_FILE_CACHE_DIR", None) or Path(tempfile.gettempdir()) / "library-book-cache")
+    root.mkdir(parents=True, exist_ok=True)
+    return root
+
+
+def _max_bytes() -> int:
+    return getattr(settings, "LIBRARY_FILE_CACHE_MAX_BYTES", 2 * 1024 ** 3)
+
+
+def _entry_path(path: str) -> Path:
+    digest = hashlib.sha1(path.encode()).hexdigest()
+    return _cache_dir() / (digest + Path(path).suffix)
+
+
+def _fill_lock(entry: Path) -> threading.Lock:
+    # One download per object even when many readers miss at once
+    return _fill_locks[int(entry.stem[:8], 16) % FILL_LOCK_STRIPES]
+
+
+def _touch(entry: Path):
+    # Skip the syscall for files that were touched recently anyway
+    try:
+        if time.time() - entry.stat().st_mtime > FILE_CACHE_TOUCH_INTERVAL:
+            os.utime(entry)
+    except FileNotFoundError:
+        pass
+
+
+def get_local_file(path) -> Path:
+    """
+    Return a local path holding the stored object at path. Raises
+    FileNotFoundError (an OSError) when the object isn't stored yet.
+    """
+    path = str(path).lstrip("/")
+    backend = get_storage_backend()
+
+    local = backend.local_path(path)
+    if local is not None:
+        # The upload may still be pending, or the file gone
+        if not local.is_file():
+            raise FileNotFoundError(path)
+        return local
+
+    entry = _entry_path(path)
+    if entry.exists():
+        _touch(entry)
+        return entry
+
+    with _fill_lock(entry):
+        if entry.exists():
+            return entry
+
+        partial = entry.with_name(f"{entry.name}.{os.getpid()}.{threading.get_ident()}.part")
+        try:
+            backend.download(path, str(partial))
+            os.replace(partial, entry)
+        finally:
+            partial.unlink(missing_ok=True)
+
+    evict_file_cache(keep=entry)
+    return entry
+
+
+def evict_file_cache(keep: Path | None = None):
+    """Delete least recently used entries until the cache fits its budget."""
+    entries = []
+    for item in _cache_dir().iterdir():
+        if item.name.endswith(".part"):
+            continue
+        try:
+            stat = item.stat()
+        except FileNotFoundError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, item))
+
+    total = sum(size for _, size, _ in entries)
+    limit = _max_bytes()
+
+    # Unlinking is safe while a response still streams from the file
+    for _, size, item in sorted(entries, key=lambda e: e[0]):
+        if total <= limit:
+            break
+        if item == keep:
+            continue
+        item.unlink(missing_ok=True)
+        total -= size
@@ -0,0 +1,106 @@
+import os
+import tempfile
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand
+
+from library.cache import bump_catalogue_version
+from library.models import Book, book_file_path
+from library.storage import file_sha256, get_storage_backend
+
+
+class Command(BaseCommand):
+    help = (
+        "Hash book files stored before content addressing, report duplicate bytes, "
+        "and with --relink move books onto shared content-addressed objects."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--relink",
+            action="store_true",
+            help="Point books at books/<sha256> and delete the superseded objects.",
+        )
+
+    def handle(self, *args, **options):
+        backend = get_storage_backend()
+        books = (
+            Book.objects
+            .filter(file_hash="")
+            .exclude(file="")
+            .exclude(file__isnull=True)
+            .values_list("id", "file")
+        )
+
+        # hash -> [(book id, stored path, size)]
+        groups = defaultdict(list)
+        failed = 0
+
+        for book_id, path in books.iterator():
+            path = str(path).lstrip("/")
+            try:
+                file_hash, size = self.hash_object(backend, path)
+            except Exception as e:
+                failed += 1
+                self.stderr.write(f"Book {book_id} ({path}): {e}")
+                continue
+            Book.objects.filter(pk=book_id).update(file_hash=file_hash)
+            groups[file_hash].append((book_id, path, size))
+
+        hashed = sum(len(members) for members in groups.values())
+        duplicate_bytes = sum(
+            members[0][2] * (len(members) - 1)
+            for members in groups.values()
+        )
+        self.stdout.write(f"Hashed {hashed} file(s), {failed} failed.")
+        self.stdout.write(
+            f"{len(groups)} distinct file(s); {duplicate_bytes / 1024 / 1024:.1f} MB held in duplicate copies."
+        )
+
+        if options["relink"]:
+            reclaimed = self.relink(backend, groups)
+            self.stdout.write(self.style.SUCCESS(f"Reclaimed {reclaimed / 1024 / 1024:.1f} MB."))
+
+    def hash_object(self, backend, path):
+        local = backend.local_path(path)
+        if local is not None:
+            return file_sha256(str(local)), os.path.getsize(local)
+
+        fd, tmp = tempfile.mkstemp(prefix="book-hash-")
+        os.close(fd)
+        try:
+            backend.download(path, tmp)
+            return file_sha256(tmp), os.path.getsize(tmp)
+        finally:
+            os.remove(tmp)
+
+    def relink(self, backend, groups):
+        reclaimed = 0
+        for file_hash, members in groups.items():
+            _, first_path, size = members[0]
+            target = book_file_path(file_hash, first_path)
+
+            if not backend.exists(target):
+                # Server-side copies aren't in the backend API; round-trip
+                # through a temp file once per distinct file.
+                fd, tmp = tempfile.mkstemp(prefix="book-relink-")
+                os.close(fd)
+                try:
+                    backend.download(first_path, tmp)
+                    backend.upload(target, tmp, "application/pdf")
+                finally:
+                    os.remove(tmp)
+                reclaimed -= size
+
+            for book_id, path, _ in members:
+                if path == target:
+                    continue
+                Book.objects.filter(pk=book_id).update(file=target)
+                # Only drop the old object once nothing references it
+                if not Book.objects.filter(file=path).exists():
+                    backend.delete(path)
+                    reclaimed += size
+
+        # Queryset updates skip post_save
+        bump_catalogue_version()
+        return max(reclaimed, 0)
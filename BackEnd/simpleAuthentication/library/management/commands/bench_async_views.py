@@ -0,0 +1,164 @@
+import asyncio
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings
+from django.urls import path
+
+from library.async_views import AsyncBookListView, AsyncBorrowedBooksView, AsyncReadBookView
+from library.borrowing import borrow_book
+from library.models import Book, Borrow, BorrowCounter
+from library.views import BookListView, BorrowedBooksView, ReadBookView, StrictTokenObtainPairSerializer
+
+# In-process runs mount both implementations side by side
+urlpatterns = [
+    path("sync/books/", BookListView.as_view()),
+    path("async/books/", AsyncBookListView.as_view()),
+    path("sync/borrowed/", BorrowedBooksView.as_view()),
+    path("async/borrowed/", AsyncBorrowedBooksView.as_view()),
+    path("sync/books/<int:book_id>/read/", ReadBookView.as_view()),
+    path("async/books/<int:book_id>/read/", AsyncReadBookView.as_view()),
+]
+
+MODES = (
+    # label, server interface, implementation
+    ("sync view, WSGI threads", "wsgi", "sync"),
+    ("sync view on ASGI", "asgi", "sync"),
+    ("async view on ASGI", "asgi", "async"),
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the hot read endpoints (book list, borrowed books, read) as sync WSGI, "
+        "sync-on-ASGI and native async views under concurrent load. By default the "
+        "Django handlers run in process behind httpx; --base-url instead loads a real "
+        "server started separately, e.g.\n"
+        "  gunicorn -w 1 --threads 32 simpleAuthentication.wsgi:application\n"
+        "  uvicorn simpleAuthentication.asgi:application\n"
+        "  LIBRARY_ASYNC_ROUTES=books,borrowed-books,read-book uvicorn simpleAuthentication.asgi:application"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=2000, help="Per mode and endpoint.")
+        parser.add_argument("--concurrency", type=int, default=32)
+        parser.add_argument("--books", type=int, default=40)
+        parser.add_argument("--base-url", help="Load this running server instead of the in-process handlers.")
+
+    def handle(self, *args, **options):
+        if connection.vendor == "sqlite" and connection.is_in_memory_db():
+            raise CommandError("bench_async_views needs a database other threads can see, not in-memory SQLite.")
+
+        # Seeded rows are committed (servers and worker threads read them
+        # on their own connections) and deleted at the end
+        user = User.objects.create_user(username=f"bench_async_{time.time_ns()}", password=None)
+        books = Book.objects.bulk_create(
+            Book(title=f"Bench book {i}", author="Bench", file="https://example.com/bench.pdf")
+            for i in range(options["books"])
+        )
+        for book in books[:3]:
+            borrow_book(user, book.id)
+        token = str(StrictTokenObtainPairSerializer.get_token(user).access_token)
+
+        # name, path in this module's urlpatterns, path on a real server
+        endpoints = (
+            ("books", "books/?page_size=20", "api/books/?page_size=20"),
+            ("borrowed", "borrowed/", "api/borrowed/"),
+            ("read", f"books/{books[0].id}/read/", f"api/books/{books[0].id}/read/"),
+        )
+        try:
+            if options["base_url"]:
+                self.run_external(options, endpoints, token)
+            else:
+                self.run_in_process(options, endpoints, token)
+        finally:
+            Borrow.objects.filter(user=user).delete()
+            BorrowCounter.objects.filter(user=user).delete()
+            Book.objects.filter(pk__in=[b.pk for b in books]).delete()
+            user.delete()
+
+    def run_in_process(self, options, endpoints, token):
+        host = next((h.lstrip(".") for h in settings.ALLOWED_HOSTS if h != "*"), "localhost")
+        headers = {"Authorization": f"Bearer {token}", "Host": host}
+
+        with override_settings(ROOT_URLCONF=__name__):
+            for label, interface, implementation in MODES:
+                for name, local_path, _ in endpoints:
+                    url = f"http://{host}/{implementation}/{local_path}"
+                    if interface == "wsgi":
+                        timings = self.load_wsgi(url, headers, options)
+                    else:
+                        transport = httpx.ASGITransport(app=ASGIHandler())
+                        timings = asyncio.run(self.load_async(url, headers, options, transport))
+                    self.report(label, name, timings)
+
+    def run_external(self, options, endpoints, token):
+        base = options["base_url"].rstrip("/")
+        headers = {"Authorization": f"Bearer {token}"}
+        for name, _, remote_path in endpoints:
+            timings = asyncio.run(self.load_async(f"{base}/{remote_path}", headers, options))
+            self.report(base, name, timings)
+
+    def load_wsgi(self, url, headers, options):
+        # One thread per in-flight request, like a threaded WSGI server
+        app = WSGIHandler()
+        local = threading.local()
+
+        def one(_):
+            if not hasattr(local, "client"):
+                local.client = httpx.Client(transport=httpx.WSGITransport(app=app))
+            start = time.perf_counter()
+            response = local.client.get(url, headers=headers)
+            assert response.status_code == 200, (url, response.status_code)
+            return time.perf_counter() - start
+
+        one(None)  # warm the catalogue cache
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options["concurrency"]) as pool:
+            latencies = list(pool.map(one, range(options["requests"])))
+        return time.perf_counter() - start, latencies
+
+    async def load_async(self, url, headers, options, transport=None):
+        # Concurrent requests from one event loop; over the network unless
+        # an in-process ASGI transport is given
+        latencies = []
+
+        async with httpx.AsyncClient(transport=transport, timeout=60) as client:
+            async def one():
+                started = time.perf_counter()
+                response = await client.get(url, headers=headers)
+                assert response.status_code == 200, (url, response.status_code)
+                latencies.append(time.perf_counter() - started)
+
+            await one()  # warm the catalogue cache
+            latencies.clear()
+
+            remaining = options["requests"]
+
+            async def worker():
+                nonlocal remaining
+                while remaining > 0:
+                    remaining -= 1
+                    await one()
+
+            start = time.perf_counter()
+            await asyncio.gather(*(worker() for _ in range(options["concurrency"])))
+        return time.perf_counter() - start, latencies
+
+    def report(self, label, name, timings):
+        elapsed, latencies = timings
+        latencies.sort()
+        p95 = latencies[int(len(latencies) * 0.95) - 1] if latencies else 0
+        self.stdout.write(
+            f"{label:<26} {name:<9} {len(latencies) / elapsed:8.0f} req/s"
+            f"  p50 {statistics.median(latencies) * 1000:6.1f} ms  p95 {p95 * 1000:6.1f} ms"
+        )
@@ -0,0 +1,66 @@
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from rest_framework_simplejwt.authentication import JWTAuthentication
+
+from library.authentication import CachedJWTAuthentication, StatelessJWTAuthentication, clear_user_cache
+from library.models import Book
+from library.views import BookListView, StrictTokenObtainPairSerializer
+
+AUTH_CLASSES = (
+    ("JWTAuthentication", JWTAuthentication),
+    ("CachedJWTAuthentication", CachedJWTAuthentication),
+    ("StatelessJWTAuthentication", StatelessJWTAuthentication),
+)
+
+
+class Command(BaseCommand):
+    help = "Compare requests/sec of /api/books/ under each JWT authentication class."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=2000)
+        parser.add_argument("--books", type=int, default=24)
+
+    def handle(self, *args, **options):
+        # Seeded rows are rolled back at the end
+        with transaction.atomic():
+            user = User.objects.create_user(username=f"bench_auth_{time.time_ns()}", password=None)
+            Book.objects.bulk_create(
+                Book(title=f"Bench book {i}", author="Bench") for i in range(options["books"])
+            )
+            token = str(StrictTokenObtainPairSerializer.get_token(user).access_token)
+            host = next((h.lstrip(".") for h in settings.ALLOWED_HOSTS if h != "*"), "localhost")
+            factory = RequestFactory(HTTP_HOST=host)
+
+            baseline = None
+            for label, auth_class in AUTH_CLASSES:
+                clear_user_cache()
+                view = BookListView.as_view(authentication_classes=[auth_class])
+
+                def call():
+                    request = factory.get("/api/books/", HTTP_AUTHORIZATION=f"Bearer {token}")
+                    response = view(request)
+                    assert response.status_code == 200, response.status_code
+
+                # Warm up: fills the catalogue page cache and the user cache
+                call()
+                with CaptureQueriesContext(connection) as ctx:
+                    call()
+
+                start = time.perf_counter()
+                for _ in range(options["requests"]):
+                    call()
+                rps = options["requests"] / (time.perf_counter() - start)
+                baseline = baseline or rps
+
+                self.stdout.write(
+                    f"{label:<28} {rps:8.0f} req/s  {len(ctx.captured_queries)} queries/request"
+                    f"  ({rps / baseline:.2f}x)"
+                )
+
+            transaction.set_rollback(True)
@@ -0,0 +1,127 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+# Hot-path queries, written the way the ORM issues them
+QUERIES = {
+    "active borrow (user, book)": (
+        "SELECT 1 FROM library_borrow WHERE user_id = %(user)s AND book_id = %(book)s AND NOT returned LIMIT 1"
+    ),
+    "active count (user)": (
+        "SELECT COUNT(*) FROM library_borrow WHERE user_id = %(user)s AND NOT returned"
+    ),
+    "book is borrowed (book)": (
+        "SELECT 1 FROM library_borrow WHERE book_id = %(book)s AND NOT returned LIMIT 1"
+    ),
+    "overdue page (return_due)": (
+        "SELECT id FROM library_borrow WHERE NOT returned AND return_due < now() ORDER BY return_due, id LIMIT 50"
+    ),
+}
+
+INDEXES = (
+    "borrow_one_active_per_user_book",
+    "borrow_active_book_idx",
+    "borrow_active_due_idx",
+)
+
+
+class Command(BaseCommand):
+    help = "Seed a large Borrow table and compare hot-path plans and latency with and without the partial indexes."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--borrows", type=int, default=1_000_000)
+        parser.add_argument("--users", type=int, default=20_000)
+        parser.add_argument("--books", type=int, default=50_000)
+        parser.add_argument("--runs", type=int, default=200)
+
+    def handle(self, *args, **options):
+        if connection.vendor != "postgresql":
+            raise CommandError("bench_borrow_indexes needs PostgreSQL.")
+
+        # Seed, measure, drop the indexes, measure again, then roll back
+        # everything so the real tables are untouched.
+        with transaction.atomic(), connection.cursor() as cursor:
+            self.seed(cursor, options)
+            params = self.sample_params(cursor)
+
+            self.stdout.write(self.style.MIGRATE_HEADING("With partial indexes"))
+            with_idx = self.measure(cursor, params, options["runs"])
+
+            for name in INDEXES:
+                cursor.execute(f'ALTER TABLE library_borrow DROP CONSTRAINT IF EXISTS "{name}"')
+                cursor.execute(f'DROP INDEX IF EXISTS "{name}"')
+            cursor.execute("ANALYZE library_borrow")
+
+            self.stdout.write(self.style.MIGRATE_HEADING("Without partial indexes"))
+            without_idx = self.measure(cursor, params, options["runs"])
+
+            self.stdout.write(self.style.MIGRATE_HEADING("Summary (ms/query)"))
+            for label in QUERIES:
+                self.stdout.write(
+                    f"  {label:<28} {with_idx[label]:8.3f}  vs {without_idx[label]:8.3f}"
+                    f"  ({without_idx[label] / with_idx[label]:.0f}x)"
+                )
+
+            transaction.set_rollback(True)
+
+    def seed(self, cursor, options):
+        start = time.perf_counter()
+        cursor.execute(
+            """
+            INSERT INTO auth_user (password, is_superuser, username, first_name, last_name,
+                                   email, is_staff, is_active, date_joined)
+            SELECT '!', false, 'bench_' || g, '', '', '', false, true, now()
+            FROM generate_series(1, %s) g
+            """,
+            [options["users"]],
+        )
+        cursor.execute(
+            """
+            INSERT INTO library_book (title, author, description, created_at, upload_status, upload_error,
+                                      photo_hash, photo_variants, file_hash, active_borrow_count,
+                                      total_copies)
+            SELECT 'Bench book ' || g, 'Bench', '', now(), '', '', '', '[]', '', 0, 1
+            FROM generate_series(1, %s) g
+            """,
+            [options["books"]],
+        )
+        # ~3% of rows are active, like a real library where most loans
+        # have been returned long ago.
+        cursor.execute(
+            """
+            WITH u AS (SELECT array_agg(id) ids FROM auth_user WHERE username LIKE 'bench\\_%%'),
+                 b AS (SELECT array_agg(id) ids FROM library_book WHERE author = 'Bench')
+            INSERT INTO library_borrow (user_id, book_id, borrow_date, return_due, returned, returned_date)
+            SELECT u.ids[1 + (g %% array_length(u.ids, 1))],
+                   b.ids[1 + ((g * 7919) %% array_length(b.ids, 1))],
+                   now() - (g %% 400) * interval '1 day',
+                   now() - (g %% 400) * interval '1 day' + interval '14 days',
+                   g %% 33 <> 0,
+                   CASE WHEN g %% 33 <> 0 THEN now() END
+            FROM generate_series(1, %s) g, u, b
+            ON CONFLICT DO NOTHING
+            """,
+            [options["borrows"]],
+        )
+        cursor.execute("ANALYZE auth_user; ANALYZE library_book; ANALYZE library_borrow")
+        self.stdout.write(f"Seeded {options['borrows']} borrows in {time.perf_counter() - start:.1f}s")
+
+    def sample_params(self, cursor):
+        cursor.execute("SELECT user_id, book_id FROM library_borrow WHERE NOT returned LIMIT 1")
+        user, book = cursor.fetchone()
+        return {"user": user, "book": book}
+
+    def measure(self, cursor, params, runs):
+        results = {}
+        for label, sql in QUERIES.items():
+            cursor.execute("EXPLAIN " + sql, params)
+            plan = "\n".join(f"      {row[0]}" for row in cursor.fetchall())
+            self.stdout.write(f"  {label}\n{plan}")
+
+            start = time.perf_counter()
+            for _ in range(runs):
+                cursor.execute(sql, params)
+                cursor.fetchall()
+            results[label] = (time.perf_counter() - start) / runs * 1000
+        return results
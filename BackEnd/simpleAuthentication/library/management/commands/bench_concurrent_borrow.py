@@ -0,0 +1,107 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from library.borrowing import BORROW_LIMIT, BorrowError, borrow_book, return_book
+from library.models import Book, Borrow, BorrowCounter
+
+
+class Command(BaseCommand):
+    help = (
+        "Hammer borrow/return from many threads and check the per-user limit, uniqueness "
+        "and per-title copy counts hold."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--threads", type=int, default=16)
+        parser.add_argument("--users", type=int, default=4)
+        parser.add_argument("--books", type=int, default=8)
+        parser.add_argument("--copies", type=int, default=2, help="Copies of each book; fewer than --users means contention.")
+        parser.add_argument("--seconds", type=float, default=10.0)
+
+    def handle(self, *args, **options):
+        if connection.vendor != "postgresql":
+            raise CommandError("bench_concurrent_borrow needs PostgreSQL (row locks).")
+
+        users = [
+            User.objects.create_user(username=f"bench_borrower_{i}_{time.time_ns()}", password=None)
+            for i in range(options["users"])
+        ]
+        books = [
+            Book.objects.create(title=f"Bench book {i}", author="Bench", total_copies=options["copies"])
+            for i in range(options["books"])
+        ]
+
+        stop_at = time.perf_counter() + options["seconds"]
+        counts = {"borrowed": 0, "returned": 0, "rejected": 0, "no_copy": 0}
+        violations = []
+        lock = threading.Lock()
+
+        def worker(n):
+            # Each thread keeps cycling one user through every book, so
+            # threads sharing a user constantly race each other.
+            user = users[n % len(users)]
+            i = n
+            try:
+                while time.perf_counter() < stop_at:
+                    book = books[i % len(books)]
+                    i += 1
+                    try:
+                        borrow_book(user, book.id)
+                        outcome = "borrowed"
+                    except BorrowError as e:
+                        try:
+                            return_book(user, book.id)
+                            outcome = "returned"
+                        except BorrowError:
+                            outcome = "no_copy" if e.status_code == 409 else "rejected"
+
+                    active = Borrow.objects.filter(user=user, returned=False).count()
+                    on_loan = Borrow.objects.filter(book=book, returned=False).count()
+                    with lock:
+                        counts[outcome] += 1
+                        if active > BORROW_LIMIT:
+                            violations.append((user.username, active))
+                        if on_loan > options["copies"]:
+                            violations.append((book.title, on_loan))
+            finally:
+                connection.close()
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options["threads"]) as pool:
+            list(pool.map(worker, range(options["threads"])))
+        elapsed = time.perf_counter() - start
+
+        try:
+            self.report(users, books, counts, violations, elapsed)
+        finally:
+            Borrow.objects.filter(user__in=users).delete()
+            BorrowCounter.objects.filter(user__in=users).delete()
+            Book.objects.filter(pk__in=[b.pk for b in books]).delete()
+            User.objects.filter(pk__in=[u.pk for u in users]).delete()
+
+    def report(self, users, books, counts, violations, elapsed):
+        ops = sum(counts.values())
+        self.stdout.write(f"operations: {ops} in {elapsed:.1f}s ({ops / elapsed:.0f} ops/s)")
+        for name, n in counts.items():
+            self.stdout.write(f"  {name:<9} {n}")
+
+        for user in users:
+            active = Borrow.objects.filter(user=user, returned=False)
+            distinct = active.values("book").distinct().count()
+            counter = BorrowCounter.objects.get(user=user).active_borrows
+            if active.count() > BORROW_LIMIT or distinct != active.count() or counter != active.count():
+                violations.append((user.username, active.count()))
+
+        for book in Book.objects.filter(pk__in=[b.pk for b in books]):
+            actual = Borrow.objects.filter(book=book, returned=False).count()
+            if book.active_borrow_count != actual or actual > book.total_copies:
+                violations.append((book.title, book.active_borrow_count, actual))
+
+        if violations:
+            raise CommandError(f"Invariant violated: {violations[:10]}")
+        self.stdout.write(self.style.SUCCESS(f"Limit of {BORROW_LIMIT}, one-active-per-book, copy counts and book active counts held throughout."))
@@ -0,0 +1,64 @@
+import asyncio
+import resource
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+
+from library.events import InProcessBroker
+
+
+class Command(BaseCommand):
+    help = (
+        "Hold many idle availability subscriptions on one event loop, publish deltas from "
+        "another thread and report fan-out latency and memory per subscriber."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--subscribers", type=int, default=5000)
+        parser.add_argument("--events", type=int, default=200)
+        parser.add_argument("--books", type=int, default=50)
+
+    def handle(self, *args, **options):
+        asyncio.run(self.run(options["subscribers"], options["events"], options["books"]))
+
+    async def run(self, subscribers, events, books):
+        broker = InProcessBroker()
+        before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        threads_before = threading.active_count()
+        received = 0
+
+        async def reader(subscription):
+            # Stands in for one open /api/events/availability/ stream
+            nonlocal received
+            while True:
+                batch = await subscription.next_batch(60)
+                received += len(batch)
+
+        readers = [asyncio.create_task(reader(broker.subscribe())) for _ in range(subscribers)]
+        await asyncio.sleep(0)
+        held_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - before
+
+        start = time.perf_counter()
+        publisher = threading.Thread(target=lambda: [
+            broker.publish({"book_id": i % books, "available": i, "total": events})
+            for i in range(events)
+        ])
+        publisher.start()
+        await asyncio.to_thread(publisher.join)
+
+        # Every subscriber ends up with the latest delta of every book
+        while received < subscribers * min(books, events):
+            await asyncio.sleep(0.001)
+            if time.perf_counter() - start > 60:
+                break
+        elapsed = time.perf_counter() - start
+
+        for task in readers:
+            task.cancel()
+        await asyncio.gather(*readers, return_exceptions=True)
+
+        self.stdout.write(f"subscribers: {subscribers} on one loop, threads added: {threading.active_count() - threads_before}")
+        self.stdout.write(f"memory:      ~{held_kb * 1024 / subscribers:.0f} bytes per idle subscriber (max RSS delta)")
+        self.stdout.write(f"fan-out:     {events} events x {subscribers} subscribers in {elapsed * 1000:.0f} ms")
+        self.stdout.write(f"delivered:   {received} deltas after per-book coalescing")
@@ -0,0 +1,86 @@
+import random
+import time
+
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import F, Q
+
+from library.models import Book
+
+WORDS = (
+    "python django angular react docker kubernetes cloud data science "
+    "machine learning deep network security design pattern testing "
+    "database postgres linux rust golang java spring algorithms"
+).split()
+
+
+class Command(BaseCommand):
+    help = "Compare tsvector search latency against an icontains scan on a seeded catalogue."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--books", type=int, default=100_000)
+        parser.add_argument("--runs", type=int, default=20)
+        parser.add_argument("--query", default="pyth dja")
+
+    def handle(self, *args, **options):
+        if connection.vendor != "postgresql":
+            raise CommandError("bench_search needs PostgreSQL.")
+
+        # Everything runs in a transaction that is rolled back at the end,
+        # so the seeded rows never reach the real catalogue.
+        with transaction.atomic():
+            self.seed(options["books"])
+            terms = options["query"].split()
+
+            fts = self.time_query(options["runs"], lambda: self.fts_query(terms))
+            naive = self.time_query(options["runs"], lambda: self.icontains_query(terms))
+
+            self.stdout.write(f"books:      {options['books']}")
+            self.stdout.write(f"tsvector:   {fts * 1000:.2f} ms/query")
+            self.stdout.write(f"icontains:  {naive * 1000:.2f} ms/query")
+            self.stdout.write(f"speedup:    {naive / fts:.1f}x")
+
+            transaction.set_rollback(True)
+
+    def seed(self, count):
+        rng = random.Random(42)
+        batch = []
+        for i in range(count):
+            batch.append(Book(
+                title=" ".join(rng.choices(WORDS, k=4)).title(),
+                author=f"Author {i % 5000}",
+                description=" ".join(rng.choices(WORDS, k=60)),
+            ))
+            if len(batch) == 5000:
+                Book.objects.bulk_create(batch)
+                batch = []
+        # search_vector is filled in by the database trigger
+        Book.objects.bulk_create(batch)
+
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE library_book")
+
+    def fts_query(self, terms):
+        query = SearchQuery(" & ".join(f"{t}:*" for t in terms), search_type="raw", config="english")
+        qs = (
+            Book.objects.filter(search_vector=query)
+            .annotate(rank=SearchRank(F("search_vector"), query))
+            .order_by("-rank", "-id")
+        )
+        return list(qs.values_list("id", flat=True)[:24])
+
+    def icontains_query(self, terms):
+        qs = Book.objects.all()
+        for term in terms:
+            qs = qs.filter(
+                Q(title__icontains=term) | Q(author__icontains=term) | Q(description__icontains=term)
+            )
+        return list(qs.order_by("-created_at", "-id").values_list("id", flat=True)[:24])
+
+    def time_query(self, runs, fn):
+        fn()  # warm up
+        start = time.perf_counter()
+        for _ in range(runs):
+            fn()
+        return (time.perf_counter() - start) / runs
@@ -0,0 +1,71 @@
+import os
+import statistics
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+SETUP_SNIPPET = "import django; django.setup()"
+
+# Modules that must never load just because Django started
+LAZY_MODULES = ("supabase", "storage3", "postgrest", "realtime")
+
+
+class Command(BaseCommand):
+    help = "Measure django.setup() import time with `python -X importtime` and guard lazy imports."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--runs", type=int, default=5)
+        parser.add_argument("--top", type=int, default=15, help="Slowest modules to list.")
+        parser.add_argument("--max-ms", type=float, default=None, help="Fail if the median startup exceeds this.")
+
+    def handle(self, *args, **options):
+        totals = []
+        modules = {}
+
+        for _ in range(options["runs"]):
+            total, cumulative = self.measure()
+            totals.append(total)
+            for name, us in cumulative.items():
+                modules.setdefault(name, []).append(us)
+
+        median_ms = statistics.median(totals) / 1000
+        self.stdout.write(f"django.setup() import time: {median_ms:.1f} ms (median of {len(totals)})")
+
+        slowest = sorted(modules.items(), key=lambda kv: statistics.median(kv[1]), reverse=True)
+        for name, samples in slowest[: options["top"]]:
+            self.stdout.write(f"  {statistics.median(samples) / 1000:8.1f} ms  {name}")
+
+        eager = sorted(
+            name for name in modules
+            if name.split(".")[0] in LAZY_MODULES
+        )
+        if eager:
+            raise CommandError(f"Startup imported lazy modules: {', '.join(eager)}")
+
+        if options["max_ms"] is not None and median_ms > options["max_ms"]:
+            raise CommandError(f"Startup took {median_ms:.1f} ms, budget is {options['max_ms']:.1f} ms")
+
+    def measure(self):
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE=settings.SETTINGS_MODULE)
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", SETUP_SNIPPET],
+            cwd=settings.BASE_DIR,
+            env=env,
+            capture_output=True,
+            text=True,
+        )
+        if result.returncode != 0:
+            raise CommandError(result.stderr[-2000:])
+
+        # Lines look like: "import time:  self [us] | cumulative | imported package"
+        cumulative = {}
+        total = 0
+        for line in result.stderr.splitlines():
+            if not line.startswith("import time:") or "self [us]" in line:
+                continue
+            _, self_us, cumulative_us, name = [part.strip() for part in line.replace("import time:", "|", 1).split("|")]
+            cumulative[name.strip()] = int(cumulative_us)
+            total += int(self_us)
+        return total, cumulative
@@ -0,0 +1,102 @@
+import os
+import shutil
+import tempfile
+import time
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test.utils import override_settings
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from library.models import Book, Borrow
+from library.storage import LocalStorage
+from library.views import BookStreamView
+
+# What pdf.js asks for before it can paint page one: the trailer and
+# cross-reference table at the end, then the first objects.
+FIRST_PAGE_RANGES = ("bytes=-{tail}", "bytes=0-{head}")
+
+
+class Command(BaseCommand):
+    help = "Time-to-first-page of a large PDF: whole download vs ranged reads, cold and warm file cache."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--size-mb", type=int, default=50)
+        parser.add_argument("--chunk-kb", type=int, default=1024, help="Size of each ranged read.")
+        parser.add_argument("--runs", type=int, default=5)
+
+    def handle(self, *args, **options):
+        storage_root = tempfile.mkdtemp()
+        cache_root = tempfile.mkdtemp()
+        try:
+            with override_settings(
+                LIBRARY_STORAGE_BACKEND="library.storage.LocalStorage",
+                LIBRARY_LOCAL_STORAGE_ROOT=storage_root,
+                LIBRARY_FILE_CACHE_DIR=cache_root,
+            ), transaction.atomic():
+                self.run(storage_root, cache_root, options)
+                transaction.set_rollback(True)
+        finally:
+            shutil.rmtree(storage_root, ignore_errors=True)
+            shutil.rmtree(cache_root, ignore_errors=True)
+
+    def run(self, storage_root, cache_root, options):
+        path = "books/bench.pdf"
+        target = os.path.join(storage_root, path)
+        os.makedirs(os.path.dirname(target))
+        with open(target, "wb") as fh:
+            fh.write(b"%PDF-1.4\n")
+            for _ in range(options["size_mb"]):
+                fh.write(os.urandom(1024 * 1024))
+
+        user = User.objects.create_user(username=f"bench_stream_{time.time_ns()}", password=None)
+        book = Book.objects.create(title="Bench stream", author="Bench")
+        Book.objects.filter(pk=book.pk).update(file=path)
+        Borrow.objects.create(user=user, book=book)
+
+        host = next((h.lstrip(".") for h in settings.ALLOWED_HOSTS if h != "*"), "localhost")
+        factory = APIRequestFactory(HTTP_HOST=host)
+        view = BookStreamView.as_view()
+        chunk = options["chunk_kb"] * 1024 - 1
+
+        def fetch(range_header=None):
+            extra = {"HTTP_RANGE": range_header} if range_header else {}
+            request = factory.get(f"/api/books/{book.id}/stream/", **extra)
+            force_authenticate(request, user=user)
+            response = view(request, book_id=book.id)
+            received = sum(len(part) for part in response.streaming_content)
+            response.close()
+            return received
+
+        def first_page():
+            return sum(fetch(r.format(tail=chunk + 1, head=chunk)) for r in FIRST_PAGE_RANGES)
+
+        def cold_first_page():
+            # Pretend the object is remote so every run fills the cache
+            for entry in os.listdir(cache_root):
+                os.unlink(os.path.join(cache_root, entry))
+            with mock.patch.object(LocalStorage, "local_path", return_value=None):
+                return first_page()
+
+        def warm_first_page():
+            with mock.patch.object(LocalStorage, "local_path", return_value=None):
+                return first_page()
+
+        scenarios = (
+            ("whole file (200)", fetch),
+            ("first page, cold cache", cold_first_page),
+            ("first page, warm cache", warm_first_page),
+        )
+
+        self.stdout.write(f"PDF size: {options['size_mb']} MB, {options['runs']} run(s) each")
+        for label, scenario in scenarios:
+            timings = []
+            for _ in range(options["runs"]):
+                start = time.perf_counter()
+                received = scenario()
+                timings.append(time.perf_counter() - start)
+            best = min(timings) * 1000
+            self.stdout.write(f"  {label:<24} {best:9.1f} ms  {received / 1024 / 1024:7.1f} MB transferred")
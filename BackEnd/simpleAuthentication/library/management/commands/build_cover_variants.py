@@ -0,0 +1,38 @@
+import os
+import tempfile
+
+from django.core.management.base import BaseCommand
+
+from library.covers import build_cover_variants
+from library.models import Book
+from library.storage import get_storage_backend
+
+
+class Command(BaseCommand):
+    help = "Build resized cover variants for books whose cover predates the variant pipeline."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--all", action="store_true", help="Rebuild books that already have variants too.")
+
+    def handle(self, *args, **options):
+        books = Book.objects.exclude(photo="").exclude(photo__isnull=True)
+        if not options["all"]:
+            books = books.filter(photo_variants=[])
+
+        backend = get_storage_backend()
+        done = failed = 0
+
+        for book_id, photo in books.values_list("id", "photo").iterator():
+            fd, local = tempfile.mkstemp(prefix="book-cover-")
+            os.close(fd)
+            try:
+                backend.download(str(photo).lstrip("/"), local)
+                build_cover_variants(book_id, local)
+                done += 1
+            except Exception as e:
+                failed += 1
+                self.stderr.write(f"Book {book_id}: {e}")
+            finally:
+                os.remove(local)
+
+        self.stdout.write(self.style.SUCCESS(f"Built variants for {done} book(s), {failed} failed."))
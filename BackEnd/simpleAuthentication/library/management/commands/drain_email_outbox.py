@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from library.utils import OUTBOX_BATCH_SIZE, drain_outbox
+
+
+class Command(BaseCommand):
+    help = "Send queued emails from the outbox, batch by batch."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=OUTBOX_BATCH_SIZE)
+        parser.add_argument("--interval", type=float, default=5.0, help="Seconds to sleep when the outbox is empty.")
+        parser.add_argument("--once", action="store_true", help="Drain what is due now and exit.")
+
+    def handle(self, *args, **options):
+        total = 0
+        while True:
+            sent = drain_outbox(options["batch_size"])
+            total += sent
+
+            if sent:
+                continue
+            if options["once"]:
+                break
+            time.sleep(options["interval"])
+
+        self.stdout.write(self.style.SUCCESS(f"Processed {total} email(s)."))
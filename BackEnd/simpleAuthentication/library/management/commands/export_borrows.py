@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from library.exports import EXPORT_CHUNK_SIZE, EXPORT_FORMATS, export_rows, parse_export_bound, stream_export
+
+
+class Command(BaseCommand):
+    help = "Stream borrow history (joined to book and user) as NDJSON or CSV, in constant memory."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--format", choices=sorted(EXPORT_FORMATS), default="ndjson")
+        parser.add_argument("--from", dest="start", help="Earliest borrow_date (inclusive), date or ISO datetime.")
+        parser.add_argument("--to", dest="end", help="Latest borrow_date (exclusive), date or ISO datetime.")
+        parser.add_argument("--output", "-o", help="File to write. Defaults to stdout.")
+        parser.add_argument("--chunk-size", type=int, default=EXPORT_CHUNK_SIZE, help="Rows fetched per database round-trip.")
+
+    def handle(self, *args, **options):
+        try:
+            start = parse_export_bound(options["start"], "--from")
+            end = parse_export_bound(options["end"], "--to")
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        rows = export_rows(start, end, chunk_size=options["chunk_size"])
+        chunks = stream_export(options["format"], rows)
+
+        if options["output"]:
+            with open(options["output"], "wb") as out:
+                for chunk in chunks:
+                    out.write(chunk)
+        else:
+            for chunk in chunks:
+                self.stdout.write(chunk.decode(), ending="")
@@ -0,0 +1,211 @@
+import csv
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from library.cache import bump_catalogue_version
+from library.covers import image_content_type
+from library.models import UPLOAD_FAILED, UPLOAD_UPLOADED, Book, book_file_path, book_photo_path
+from library.storage import file_sha256
+from library.uploads import upload_with_retry
+
+
+class Command(BaseCommand):
+    help = (
+        "Import books from a CSV or JSONL manifest (title, author, description, file, photo) "
+        "plus a directory of PDFs and covers. Resumable via a checkpoint file."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("manifest")
+        parser.add_argument("--files-dir", help="Base directory for relative file/photo paths. Defaults to the manifest's directory.")
+        parser.add_argument("--batch-size", type=int, default=500)
+        parser.add_argument("--workers", type=int, default=8, help="Concurrent uploads.")
+        parser.add_argument("--checkpoint", help="Defaults to <manifest>.checkpoint")
+        parser.add_argument("--restart", action="store_true", help="Ignore an existing checkpoint.")
+
+    def handle(self, *args, **options):
+        manifest = Path(options["manifest"]).resolve()
+        if not manifest.is_file():
+            raise CommandError(f"No such manifest: {manifest}")
+
+        self.files_dir = Path(options["files_dir"] or manifest.parent)
+        checkpoint = Path(options["checkpoint"] or f"{manifest}.checkpoint")
+
+        done = 0 if options["restart"] else self.read_checkpoint(checkpoint, manifest)
+        if done:
+            self.stdout.write(f"Resuming after row {done}")
+
+        imported = failed = 0
+        start = time.perf_counter()
+
+        with open(manifest, newline="", encoding="utf-8") as fh, \
+                ThreadPoolExecutor(max_workers=options["workers"], thread_name_prefix="book-import") as pool:
+            rows = islice(self.read_rows(fh, manifest.suffix.lower()), done, None)
+            # The batch in flight when a previous run died may already be in
+            # the database; only that one needs checking for duplicates.
+            check_existing = done > 0
+
+            while batch := list(islice(rows, options["batch_size"])):
+                ok, bad = self.import_batch(batch, pool, check_existing)
+                check_existing = False
+
+                done += len(batch)
+                imported += ok
+                failed += bad
+                self.write_checkpoint(checkpoint, manifest, done)
+
+                rate = imported / (time.perf_counter() - start)
+                self.stdout.write(f"  {done} rows read, {imported} imported, {failed} failed ({rate:.0f} books/s)")
+
+        checkpoint.unlink(missing_ok=True)
+        self.stdout.write(self.style.SUCCESS(f"Imported {imported} book(s), {failed} row(s) failed."))
+        self.stdout.write("Run build_cover_variants to create thumbnails for the imported covers.")
+
+    # ─────────────────────────────
+    # MANIFEST
+    # ─────────────────────────────
+
+    def read_rows(self, fh, suffix):
+        """
+        Manifest rows as dicts. A row that can't be parsed is logged and
+        yielded as None, so it counts as failed and the checkpoint still
+        moves past it.
+        """
+        # Both readers pull one line at a time, so memory stays flat
+        if suffix == ".csv":
+            reader = csv.DictReader(fh)
+            while True:
+                try:
+                    yield next(reader)
+                except StopIteration:
+                    return
+                except csv.Error as e:
+                    self.stderr.write(f"Skipping line {reader.line_num}: {e}")
+                    yield None
+        elif suffix in (".jsonl", ".ndjson"):
+            for line_num, line in enumerate(fh, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    row = json.loads(line)
+                except ValueError as e:
+                    self.stderr.write(f"Skipping line {line_num}: {e}")
+                    yield None
+                    continue
+                if not isinstance(row, dict):
+                    self.stderr.write(f"Skipping line {line_num}: not a JSON object")
+                    row = None
+                yield row
+        else:
+            raise CommandError("Manifest must be .csv or .jsonl")
+
+    def read_checkpoint(self, checkpoint, manifest):
+        try:
+            state = json.loads(checkpoint.read_text())
+        except (FileNotFoundError, ValueError):
+            return 0
+        if state.get("manifest") != str(manifest):
+            return 0
+        return int(state.get("rows_done", 0))
+
+    def write_checkpoint(self, checkpoint, manifest, done):
+        partial = checkpoint.with_name(checkpoint.name + ".part")
+        partial.write_text(json.dumps({"manifest": str(manifest), "rows_done": done}))
+        os.replace(partial, checkpoint)
+
+    # ─────────────────────────────
+    # BATCH
+    # ─────────────────────────────
+
+    def resolve(self, value):
+        if not value:
+            return None
+        path = Path(value)
+        return path if path.is_absolute() else self.files_dir / path
+
+    def prepare(self, row):
+        """Build the Book and its upload jobs for one manifest row."""
+        title = (row.get("title") or "").strip()
+        if not title:
+            raise ValueError("missing title")
+
+        book = Book(
+            title=title[:200],
+            author=(row.get("author") or "").strip()[:100],
+            description=row.get("description") or "",
+        )
+        jobs = []
+
+        file_path = self.resolve(row.get("file"))
+        if file_path:
+            book.file_hash = file_sha256(str(file_path))
+            book.file = book_file_path(book.file_hash, file_path.name)
+            jobs.append((str(book.file), str(file_path), "application/pdf", True))
+
+        photo_path = self.resolve(row.get("photo"))
+        if photo_path:
+            # Content addressed like the PDFs: covers named alike in
+            # different directories must not overwrite each other
+            book.photo = book_photo_path(file_sha256(str(photo_path)), photo_path.name)
+            jobs.append((str(book.photo), str(photo_path), image_content_type(str(photo_path)), True))
+
+        return book, jobs
+
+    def import_batch(self, rows, pool, check_existing):
+        books, failed = [], 0
+        for row in rows:
+            if row is None:
+                failed += 1  # unparseable, already reported by read_rows
+                continue
+            try:
+                books.append(self.prepare(row))
+            except (OSError, ValueError) as e:
+                failed += 1
+                self.stderr.write(f"Skipping {row.get('title')!r}: {e}")
+
+        if check_existing:
+            books = self.drop_existing(books)
+
+        # Upload before inserting, so every row lands with its final status.
+        # Identical files inside a batch are uploaded once.
+        unique_jobs = {job[0]: job for _, jobs in books for job in jobs}
+        results = dict(zip(unique_jobs, pool.map(self.upload, unique_jobs.values())))
+
+        for book, jobs in books:
+            errors = [results[job[0]] for job in jobs if results[job[0]]]
+            if jobs:
+                book.upload_status = UPLOAD_FAILED if errors else UPLOAD_UPLOADED
+                book.upload_error = "; ".join(errors)[:1000]
+
+        with transaction.atomic():
+            created = Book.objects.bulk_create([book for book, _ in books])
+            # bulk_create skips post_save, so invalidate the catalogue here
+            transaction.on_commit(bump_catalogue_version)
+
+        return len(created), failed
+
+    def upload(self, job):
+        try:
+            upload_with_retry(*job)
+            return ""
+        except Exception as e:
+            self.stderr.write(f"Upload failed for {job[1]}: {e}")
+            return f"{job[0]}: {e}"
+
+    def drop_existing(self, books):
+        existing = set(
+            Book.objects
+            .filter(title__in=[book.title for book, _ in books])
+            .values_list("title", "author", "file_hash")
+        )
+        return [
+            (book, jobs) for book, jobs in books
+            if (book.title, book.author, book.file_hash) not in existing
+        ]
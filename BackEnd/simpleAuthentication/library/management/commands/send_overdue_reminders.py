@@ -0,0 +1,89 @@
+from datetime import timedelta
+from itertools import groupby
+from operator import itemgetter
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from django.utils import timezone
+
+from library.models import Borrow
+
+
+class Command(BaseCommand):
+    help = "Email every user with overdue books, one message per user, over a single mail connection."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=100, help="Messages per send_messages() call.")
+        parser.add_argument("--chunk-size", type=int, default=2000, help="Rows fetched per database round-trip.")
+        parser.add_argument(
+            "--min-interval-hours",
+            type=float,
+            default=24,
+            help="Skip borrows reminded more recently than this, so reruns don't double-send.",
+        )
+        parser.add_argument("--dry-run", action="store_true")
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        remind_before = now - timedelta(hours=options["min_interval_hours"])
+
+        # values() + iterator() keeps memory flat: rows are streamed from a
+        # server-side cursor and grouped per user as they arrive.
+        rows = (
+            Borrow.objects
+            .filter(returned=False, return_due__lt=now)
+            .filter(Q(reminder_sent_at__isnull=True) | Q(reminder_sent_at__lt=remind_before))
+            .exclude(user__email="")
+            .order_by("user_id", "return_due")
+            .values("id", "user_id", "user__username", "user__email", "book__title", "return_due")
+            .iterator(chunk_size=options["chunk_size"])
+        )
+
+        users = borrows = 0
+        batch, batch_ids = [], []
+
+        with get_connection(fail_silently=False) as connection:
+            for _, user_rows in groupby(rows, key=itemgetter("user_id")):
+                user_rows = list(user_rows)
+                batch.append(self.build_message(user_rows, now, connection))
+                batch_ids.extend(row["id"] for row in user_rows)
+
+                if len(batch) >= options["batch_size"]:
+                    self.flush(connection, batch, batch_ids, now, options["dry_run"])
+                    users += len(batch)
+                    borrows += len(batch_ids)
+                    batch, batch_ids = [], []
+
+            if batch:
+                self.flush(connection, batch, batch_ids, now, options["dry_run"])
+                users += len(batch)
+                borrows += len(batch_ids)
+
+        self.stdout.write(self.style.SUCCESS(f"Sent reminders to {users} user(s) for {borrows} overdue borrow(s)."))
+
+    def build_message(self, rows, now, connection):
+        lines = [
+            f"- {row['book__title']} (due {row['return_due']:%Y-%m-%d}, {(now - row['return_due']).days} day(s) overdue)"
+            for row in rows
+        ]
+        body = (
+            f"Hello {rows[0]['user__username']},\n\n"
+            f"The following book(s) are overdue:\n\n" + "\n".join(lines) + "\n\n"
+            "Please return them as soon as possible."
+        )
+        return EmailMessage(
+            subject="Overdue book reminder",
+            body=body,
+            from_email=settings.DEFAULT_FROM_EMAIL,
+            to=[rows[0]["user__email"]],
+            connection=connection,
+        )
+
+    def flush(self, connection, messages, borrow_ids, now, dry_run):
+        if dry_run:
+            return
+        connection.send_messages(messages)
+        # Mark only after the batch went out, so a crash resends at most one batch
+        Borrow.objects.filter(id__in=borrow_ids).update(reminder_sent_at=now)
@@ -0,0 +1,23 @@
+# Generated by Django 6.0 on 2026-10-18 09:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0028_book_search_vector'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='upload_error',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='upload_status',
+            field=models.CharField(blank=True, choices=[('pending', 'pending'), ('uploaded', 'uploaded'), ('failed', 'failed')], default='', max_length=10),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 6.0 on 2026-10-18 09:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0030_emailoutbox'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='borrow',
+            name='reminder_sent_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 6.0 on 2026-10-18 09:51
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Min
+from django.utils import timezone
+
+
+def close_duplicate_active_borrows(apps, schema_editor):
+    # Before the unique constraint existed the same book could be borrowed
+    # twice by one user. Keep the oldest active row and return the rest.
+    Borrow = apps.get_model('library', 'Borrow')
+    duplicates = (
+        Borrow.objects.filter(returned=False)
+        .values('user_id', 'book_id')
+        .annotate(keep=Min('id'), n=models.Count('id'))
+        .filter(n__gt=1)
+    )
+    for dup in duplicates:
+        (
+            Borrow.objects
+            .filter(user_id=dup['user_id'], book_id=dup['book_id'], returned=False)
+            .exclude(id=dup['keep'])
+            .update(returned=True, returned_date=timezone.now())
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0031_borrow_reminder_sent_at'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(close_duplicate_active_borrows, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='borrow',
+            index=models.Index(condition=models.Q(('returned', False)), fields=['book'], name='borrow_active_book_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='borrow',
+            index=models.Index(condition=models.Q(('returned', False)), fields=['return_due'], name='borrow_active_due_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='borrow',
+            constraint=models.UniqueConstraint(condition=models.Q(('returned', False)), fields=('user', 'book'), name='borrow_one_active_per_user_book'),
+        ),
+    ]
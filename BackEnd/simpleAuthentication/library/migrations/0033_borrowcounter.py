@@ -0,0 +1,39 @@
+# Generated by Django 6.0 on 2026-10-18 09:52
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def backfill_counters(apps, schema_editor):
+    Borrow = apps.get_model('library', 'Borrow')
+    BorrowCounter = apps.get_model('library', 'BorrowCounter')
+    active = (
+        Borrow.objects.filter(returned=False)
+        .values('user_id')
+        .annotate(n=Count('id'))
+    )
+    BorrowCounter.objects.bulk_create(
+        [BorrowCounter(user_id=row['user_id'], active_borrows=row['n']) for row in active],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0032_borrow_active_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BorrowCounter',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='borrow_counter', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('active_borrows', models.PositiveSmallIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
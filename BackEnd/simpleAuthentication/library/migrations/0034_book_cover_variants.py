@@ -0,0 +1,23 @@
+# Generated by Django 6.0 on 2026-10-18 10:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0033_borrowcounter'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='photo_hash',
+            field=models.CharField(blank=True, default='', editable=False, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='photo_variants',
+            field=models.JSONField(blank=True, default=list, editable=False),
+        ),
+    ]
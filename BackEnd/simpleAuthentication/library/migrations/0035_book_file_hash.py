@@ -0,0 +1,18 @@
+# Generated by Django 6.0 on 2026-10-18 10:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0034_book_cover_variants'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='file_hash',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=64),
+        ),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 6.0 on 2026-10-18 10:08
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0035_book_file_hash'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookStats',
+            fields=[
+                ('borrows', models.PositiveIntegerField(default=0)),
+                ('returns', models.PositiveIntegerField(default=0)),
+                ('overdue_returns', models.PositiveIntegerField(default=0)),
+                ('loan_seconds', models.BigIntegerField(default=0)),
+                ('book', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='library.book')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['-borrows', '-book'], name='bookstats_popular_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='BookDailyStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('borrows', models.PositiveIntegerField(default=0)),
+                ('returns', models.PositiveIntegerField(default=0)),
+                ('overdue_returns', models.PositiveIntegerField(default=0)),
+                ('loan_seconds', models.BigIntegerField(default=0)),
+                ('day', models.DateField()),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_stats', to='library.book')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['day'], name='bookdailystats_day_idx')],
+                'constraints': [models.UniqueConstraint(fields=('book', 'day'), name='bookdailystats_book_day')],
+            },
+        ),
+        migrations.CreateModel(
+            name='UserDailyStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('borrows', models.PositiveIntegerField(default=0)),
+                ('returns', models.PositiveIntegerField(default=0)),
+                ('overdue_returns', models.PositiveIntegerField(default=0)),
+                ('loan_seconds', models.BigIntegerField(default=0)),
+                ('day', models.DateField()),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_stats', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('user', 'day'), name='userdailystats_user_day')],
+            },
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 6.0 on 2026-10-18 10:10
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def backfill_counts(apps, schema_editor):
+    Book = apps.get_model('library', 'Book')
+    Borrow = apps.get_model('library', 'Borrow')
+    active = (
+        Borrow.objects.filter(returned=False)
+        .values('book_id')
+        .annotate(n=Count('id'))
+    )
+    books = [Book(id=row['book_id'], active_borrow_count=row['n']) for row in active]
+    Book.objects.bulk_update(books, ['active_borrow_count'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0036_borrow_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='active_borrow_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(condition=models.Q(('active_borrow_count', 0)), fields=['-created_at', '-id'], name='book_available_created_idx'),
+        ),
+        migrations.RunPython(backfill_counts, migrations.RunPython.noop),
+    ]
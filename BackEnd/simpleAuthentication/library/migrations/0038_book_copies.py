@@ -0,0 +1,43 @@
+# Generated by Django 6.0 on 2026-10-18 10:14
+
+import django.db.models.expressions
+from django.db import migrations, models
+from django.db.models.functions import Greatest
+
+
+def backfill_copies(apps, schema_editor):
+    # Until now any number of readers could hold a title at once; make
+    # sure no book starts out with more loans than copies
+    Book = apps.get_model('library', 'Book')
+    Book.objects.filter(active_borrow_count__gt=1).update(
+        total_copies=Greatest(models.F('active_borrow_count'), 1)
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0037_book_active_borrow_count'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='book',
+            name='book_available_created_idx',
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='total_copies',
+            field=models.PositiveIntegerField(default=1),
+        ),
+        migrations.RunPython(backfill_copies, migrations.RunPython.noop),
+        migrations.AddField(
+            model_name='book',
+            name='available_copies',
+            field=models.GeneratedField(db_persist=True, expression=django.db.models.expressions.CombinedExpression(models.F('total_copies'), '-', models.F('active_borrow_count')), output_field=models.IntegerField()),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(condition=models.Q(('available_copies__gt', 0)), fields=['-created_at', '-id'], name='book_available_created_idx'),
+        ),
+    ]
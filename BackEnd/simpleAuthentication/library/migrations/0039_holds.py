@@ -0,0 +1,32 @@
+# Generated by Django 6.0 on 2026-10-18 10:21
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0038_book_copies'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Hold',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('position', models.PositiveBigIntegerField()),
+                ('status', models.CharField(choices=[('waiting', 'waiting'), ('fulfilled', 'fulfilled'), ('cancelled', 'cancelled')], default='waiting', max_length=10)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('resolved_at', models.DateTimeField(blank=True, null=True)),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='holds', to='library.book')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='holds', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(condition=models.Q(('status', 'waiting')), fields=['book', 'position'], name='hold_waiting_position_idx')],
+                'constraints': [models.UniqueConstraint(fields=('book', 'position'), name='hold_book_position'), models.UniqueConstraint(condition=models.Q(('status', 'waiting')), fields=('user', 'book'), name='hold_one_waiting_per_user_book')],
+            },
+        ),
+    ]
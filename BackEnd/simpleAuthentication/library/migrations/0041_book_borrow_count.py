@@ -0,0 +1,36 @@
+# Generated by Django 6.0 on 2026-10-18 11:10
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def backfill_borrow_count(apps, schema_editor):
+    Book = apps.get_model('library', 'Book')
+    BookStats = apps.get_model('library', 'BookStats')
+    Book.objects.filter(stats__borrows__gt=0).update(
+        borrow_count=Subquery(BookStats.objects.filter(book_id=OuterRef('pk')).values('borrows'))
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0040_catalogue_version'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='bookstats',
+            name='bookstats_popular_idx',
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='borrow_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_borrow_count, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['-borrow_count', '-id'], name='book_popular_idx'),
+        ),
+    ]
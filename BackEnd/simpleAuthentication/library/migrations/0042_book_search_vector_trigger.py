@@ -0,0 +1,48 @@
+# Generated by Django 6.0 on 2026-10-18 16:20
+
+from django.db import migrations
+
+# PostgreSQL keeps Book.search_vector current itself, for every write path
+# (save, update, bulk_create): title > author > description.
+CREATE_TRIGGER = """
+CREATE OR REPLACE FUNCTION library_book_search_vector() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector :=
+        setweight(to_tsvector('english', coalesce(NEW.title, '')), 'A')
+        || setweight(to_tsvector('english', coalesce(NEW.author, '')), 'B')
+        || setweight(to_tsvector('english', coalesce(NEW.description, '')), 'C');
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER library_book_search_vector_trigger
+    BEFORE INSERT OR UPDATE OF title, author, description ON library_book
+    FOR EACH ROW EXECUTE FUNCTION library_book_search_vector();
+"""
+
+DROP_TRIGGER = """
+DROP TRIGGER IF EXISTS library_book_search_vector_trigger ON library_book;
+DROP FUNCTION IF EXISTS library_book_search_vector();
+"""
+
+
+def create_trigger(apps, schema_editor):
+    # search_vector only exists as a tsvector on PostgreSQL
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(CREATE_TRIGGER)
+
+
+def drop_trigger(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(DROP_TRIGGER)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0041_book_borrow_count'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_trigger, drop_trigger),
+    ]
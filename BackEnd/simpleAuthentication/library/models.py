@@ -1,15 +1,31 @@
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
 from django.contrib.auth.models import User
 from django.utils import timezone
 from datetime import timedelta
+import os
 import random
-from supabase import create_client
-from django.conf import settings
 
-supabase = create_client(
-    settings.SUPABASE_URL,
-    settings.SUPABASE_KEY
-)
+from .uploads import hash_upload, schedule_book_upload
+
+UPLOAD_PENDING = 'pending'
+UPLOAD_UPLOADED = 'uploaded'
+UPLOAD_FAILED = 'failed'
+
+UPLOAD_STATUS_CHOICES = [
+    (UPLOAD_PENDING, 'pending'),
+    (UPLOAD_UPLOADED, 'uploaded'),
+    (UPLOAD_FAILED, 'failed'),
+]
+
+def book_file_path(file_hash, original_name):
+    suffix = os.path.splitext(original_name)[1].lower() or '.pdf'
+    return f"books/{file_hash}{suffix}"
+
+def book_photo_path(file_hash, original_name):
+    suffix = os.path.splitext(original_name)[1].lower() or '.jpg'
+    return f"book_photos/{file_hash}{suffix}"
 
 def get_default_due_date():
     return timezone.now() + timedelta(days=14)
@@ -21,59 +37,93 @@ class Book(models.Model):
     photo = models.ImageField(upload_to='book_photos/', blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
     file = models.FileField(upload_to='books/', blank=True, null=True)  # The eBook
-    is_borrowed = models.BooleanField(default=False)
+    file_hash = models.CharField(max_length=64, blank=True, default='', db_index=True, editable=False)  # sha256 of file
+    total_copies = models.PositiveIntegerField(default=1)  # copies the library owns
+    active_borrow_count = models.PositiveIntegerField(default=0, editable=False)  # kept exact by library.borrowing
+    borrow_count = models.PositiveIntegerField(default=0, editable=False)  # all-time borrows, kept by library.stats
+    available_copies = models.GeneratedField(
+        expression=models.F('total_copies') - models.F('active_borrow_count'),
+        output_field=models.IntegerField(),
+        db_persist=True,
+    )
+    search_vector = SearchVectorField(null=True, editable=False)
+    upload_status = models.CharField(max_length=10, choices=UPLOAD_STATUS_CHOICES, blank=True, default='')
+    upload_error = models.TextField(blank=True, default='')
+    photo_hash = models.CharField(max_length=64, blank=True, default='', editable=False)  # sha256 of the cover
+    photo_variants = models.JSONField(blank=True, default=list, editable=False)  # [{width, format, path}]
      
     def save(self, *args, **kwargs):
+        # New files are only hashed here; they are spooled and uploaded in
+        # the background after commit, so the admin request returns right
+        # away and a rolled back save leaves no temp files behind.
+        uploads = []
+        cover = None
 
     # ─────────────────────────────
     # HANDLE FILE UPLOAD (SAFE CHECK)
     # ─────────────────────────────
-        if self.file and hasattr(self.file, "file") and not isinstance(self.file, str):
+        if self.file and not self.file._committed:
 
-            file_obj = self.file.file
+            file_hash = hash_upload(self.file)
 
-            file_name = f"books/{self.file.name}"
+            # Content addressed: identical files share one object and
+            # different files can never overwrite each other
+            file_name = book_file_path(file_hash, self.file.name)
 
-            supabase.storage.from_("media").upload(
-                file_name,
-             file_obj.read(),
-                {
-                 "content-type": "application/pdf",
-                 "upsert": "true"
-             }
-            )
+            uploads.append((file_name, self.file.file, "application/pdf", True))
 
             self.file = file_name  # store path only
+            self.file_hash = file_hash
 
     # ─────────────────────────────
     # HANDLE PHOTO UPLOAD (SAFE CHECK)
     # ─────────────────────────────
-        if self.photo and hasattr(self.photo, "file") and not isinstance(self.photo, str):
+        if self.photo and not self.photo._committed:
+
+            from .covers import image_content_type
 
-            photo_obj = self.photo.file
+            photo_hash = hash_upload(self.photo)
+            cover = book_photo_path(photo_hash, self.photo.name)
 
-            photo_name = f"book_photos/{self.photo.name}"
+            uploads.append((cover, self.photo.file, image_content_type(self.photo), True))
 
-            supabase.storage.from_("media").upload(
-             photo_name,
-                photo_obj.read(),
-                {
-                 "content-type": "image/jpeg",
-                 "upsert": "true"
-              }
-            )
+            self.photo = cover
 
-            self.photo = photo_name
+        if uploads:
+            self.upload_status = UPLOAD_PENDING
+            self.upload_error = ""
+
+        # The counters only change through atomic UPDATEs in borrowing.py
+        # and stats.py; a full save of a stale instance must not undo them.
+        if not self._state.adding and kwargs.get('update_fields') is None and not kwargs.get('force_insert'):
+            kwargs['update_fields'] = [
+                f.name for f in self._meta.concrete_fields
+                if not f.primary_key and not f.generated and f.name not in ('active_borrow_count', 'borrow_count')
+            ]
 
         super().save(*args, **kwargs)
+
+        if uploads:
+            schedule_book_upload(self.pk, uploads, cover)
     
     @property
     def is_borrowed(self):
-        return self.borrows.filter(returned=False).exists()
+        return self.active_borrow_count > 0
 
-    @property
-    def current_borrow(self):
-        return self.borrows.filter(returned=False).first()
+    class Meta:
+        indexes = [
+            # Keyset pagination order for /api/books/
+            models.Index(fields=['-created_at', '-id'], name='book_created_id_idx'),
+            GinIndex(fields=['search_vector'], name='book_search_vector_idx'),
+            # Keyset pagination order for ?sort=popular
+            models.Index(fields=['-borrow_count', '-id'], name='book_popular_idx'),
+            # ?available=1 walks this in catalogue order
+            models.Index(
+                fields=['-created_at', '-id'],
+                condition=models.Q(available_copies__gt=0),
+                name='book_available_created_idx',
+            ),
+        ]
 
     def __str__(self):
         return self.title
@@ -85,6 +135,32 @@ class Borrow(models.Model):
     return_due = models.DateTimeField(default=get_default_due_date)
     returned = models.BooleanField(default=False)
     returned_date = models.DateTimeField(null=True, blank=True)
+    reminder_sent_at = models.DateTimeField(null=True, blank=True)  # last overdue reminder
+
+    class Meta:
+        # Almost every query only looks at active (returned=False) rows,
+        # so all hot-path indexes are partial on that condition.
+        constraints = [
+            # One active borrow per user and book; also serves
+            # (user, returned=False) lookups through its leading column.
+            models.UniqueConstraint(
+                fields=['user', 'book'],
+                condition=models.Q(returned=False),
+                name='borrow_one_active_per_user_book',
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=['book'],
+                condition=models.Q(returned=False),
+                name='borrow_active_book_idx',
+            ),
+            models.Index(
+                fields=['return_due'],
+                condition=models.Q(returned=False),
+                name='borrow_active_due_idx',
+            ),
+        ]
 
     @property
     def is_overdue(self):
@@ -93,6 +169,111 @@ class Borrow(models.Model):
     def __str__(self):
         return f"{self.user.username} borrowed {self.book.title}"
 
+
+HOLD_WAITING = 'waiting'
+HOLD_FULFILLED = 'fulfilled'
+HOLD_CANCELLED = 'cancelled'
+
+HOLD_STATUS_CHOICES = [
+    (HOLD_WAITING, 'waiting'),
+    (HOLD_FULFILLED, 'fulfilled'),
+    (HOLD_CANCELLED, 'cancelled'),
+]
+
+class Hold(models.Model):
+    """
+    A place in a book's FIFO queue. position grows per book and is never
+    reused; the queue is the waiting rows ordered by it.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='holds')
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='holds')
+    position = models.PositiveBigIntegerField()
+    status = models.CharField(max_length=10, choices=HOLD_STATUS_CHOICES, default=HOLD_WAITING)
+    created_at = models.DateTimeField(auto_now_add=True)
+    resolved_at = models.DateTimeField(null=True, blank=True)  # fulfilled or cancelled
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['book', 'position'], name='hold_book_position'),
+            models.UniqueConstraint(
+                fields=['user', 'book'],
+                condition=models.Q(status=HOLD_WAITING),
+                name='hold_one_waiting_per_user_book',
+            ),
+        ]
+        indexes = [
+            # Head of the queue and "how many are ahead of me" are both
+            # range scans on this
+            models.Index(
+                fields=['book', 'position'],
+                condition=models.Q(status=HOLD_WAITING),
+                name='hold_waiting_position_idx',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} holds {self.book_id} at {self.position}"
+
+class BorrowCounter(models.Model):
+    """
+    Number of active borrows per user. Borrowing claims a slot with one
+    conditional UPDATE, which row-locks the counter and enforces the
+    limit without a separate count query.
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='borrow_counter')
+    active_borrows = models.PositiveSmallIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.user_id}: {self.active_borrows} active"
+
+class BorrowStatsCounts(models.Model):
+    """
+    Counters shared by the borrow statistics rollups. Kept current by
+    library.stats from the borrow/return flows; rebuild_borrow_stats
+    recomputes them from Borrow.
+    """
+    borrows = models.PositiveIntegerField(default=0)
+    returns = models.PositiveIntegerField(default=0)
+    overdue_returns = models.PositiveIntegerField(default=0)
+    loan_seconds = models.BigIntegerField(default=0)  # summed over returns
+
+    class Meta:
+        abstract = True
+
+class BookStats(BorrowStatsCounts):
+    """All-time totals per book; borrows is mirrored on Book.borrow_count."""
+    book = models.OneToOneField(Book, on_delete=models.CASCADE, primary_key=True, related_name='stats')
+
+    def __str__(self):
+        return f"{self.book_id}: {self.borrows} borrows"
+
+class BookDailyStats(BorrowStatsCounts):
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='daily_stats')
+    day = models.DateField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['book', 'day'], name='bookdailystats_book_day'),
+        ]
+        indexes = [
+            models.Index(fields=['day'], name='bookdailystats_day_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.book_id} on {self.day}: {self.borrows} borrows"
+
+class UserDailyStats(BorrowStatsCounts):
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='daily_stats')
+    day = models.DateField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'day'], name='userdailystats_user_day'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} on {self.day}: {self.borrows} borrows"
+
 class EmailVerificationCode(models.Model):
     purpose = models.CharField(
     max_length=20,
@@ -129,3 +310,52 @@ class PasswordResetCode(models.Model):
 
     def __str__(self):
         return f"{self.user.email} - {self.code}"
+
+
+OUTBOX_PENDING = 'pending'
+OUTBOX_SENT = 'sent'
+OUTBOX_FAILED = 'failed'
+
+OUTBOX_STATUS_CHOICES = [
+    (OUTBOX_PENDING, 'pending'),
+    (OUTBOX_SENT, 'sent'),
+    (OUTBOX_FAILED, 'failed'),
+]
+
+class EmailOutbox(models.Model):
+    """
+    Durable queue of outgoing emails. Rows are written in the same
+    transaction as the change that triggers them and drained in batches.
+    """
+    subject = models.CharField(max_length=255)
+    message = models.TextField(blank=True)
+    html_message = models.TextField(blank=True, null=True)
+    from_email = models.CharField(max_length=254)
+    recipient_list = models.JSONField(default=list)
+    status = models.CharField(max_length=10, choices=OUTBOX_STATUS_CHOICES, default=OUTBOX_PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='outbox_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.subject} -> {', '.join(self.recipient_list)} ({self.status})"
+
+
+class CatalogueVersion(models.Model):
+    """
+    Single row holding the catalogue cache generation. It lives in the
+    database so a bump from any process (management commands included)
+    reaches every web worker, whatever the cache backend.
+    """
+    version = models.PositiveBigIntegerField(default=0)
+    modified = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"catalogue v{self.version}"
@@ -0,0 +1,70 @@
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+from rest_framework.response import Response
+
+
+class CountedCursorPagination(CursorPagination):
+    """
+    Keyset pagination that also carries the total count on the first
+    page, so clients can show totals and drive infinite scroll. Later
+    pages skip the COUNT(*) and leave the key out; clients keep the
+    total they got first.
+    """
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.count = None
+        if not request.query_params.get(self.cursor_query_param):
+            self.count = queryset.count()
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        payload = {
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        }
+        if self.count is not None:
+            payload = {'count': self.count, **payload}
+        return Response(payload)
+
+    def get_paginated_response_schema(self, schema):
+        response_schema = super().get_paginated_response_schema(schema)
+        # Not required: only the first page carries it
+        response_schema['properties']['count'] = {'type': 'integer', 'example': 123}
+        return response_schema
+
+
+class BookCursorPagination(CountedCursorPagination):
+    """
+    Keyset pagination for the catalogue, newest first.
+    """
+    page_size = 24
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    ordering = ('-created_at', '-id')
+
+
+class PopularCursorPagination(BookCursorPagination):
+    """
+    Most borrowed first (?sort=popular), walking book_popular_idx.
+    """
+    ordering = ('-borrow_count', '-id')
+
+
+class OverdueCursorPagination(CountedCursorPagination):
+    """
+    Most overdue first.
+    """
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+    ordering = ('return_due', 'id')
+
+
+class BookSearchPagination(PageNumberPagination):
+    """
+    Search results are ordered by rank, not by a stable key,
+    so they use plain page numbers.
+    """
+    page_size = 24
+    page_size_query_param = 'page_size'
+    max_page_size = 100
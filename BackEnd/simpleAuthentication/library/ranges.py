@@ -0,0 +1,95 @@
+# ranges.py
+import hashlib
+import mimetypes
+import mmap
+import re
+
+from django.http import FileResponse, HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.utils.http import parse_etags
+
+# ─────────────────────────────────────────────
+# HTTP RANGE RESPONSES
+# ─────────────────────────────────────────────
+# Single byte ranges are sliced out of a memory map, so only the pages a
+# reader asks for are read; each slice is still copied into a bytes chunk.
+# Whole file responses go through FileResponse, which the WSGI server can
+# hand to wsgi.file_wrapper (sendfile() under gunicorn). Both bodies are
+# sync iterators, so these routes belong on the WSGI service: under ASGI
+# Django reads them fully into memory before sending.
+
+RANGE_CHUNK_SIZE = 256 * 1024
+RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+class RangeNotSatisfiable(ValueError):
+    pass
+
+
+def parse_range(header: str, size: int):
+    """
+    Return (start, end) inclusive for a single "bytes=" range, or None to
+    serve the whole file (no header, or a multi-range we don't support).
+    """
+    match = RANGE_RE.match(header.strip()) if header else None
+    if not match:
+        return None
+
+    first, last = match.groups()
+    if not first:
+        # Suffix range: the last N bytes
+        if not last or int(last) == 0:
+            raise RangeNotSatisfiable
+        return max(size - int(last), 0), size - 1
+
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise RangeNotSatisfiable
+    return start, end
+
+
+def _mmap_chunks(path, start, end):
+    with open(path, "rb") as fh, mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        position = start
+        while position <= end:
+            stop = min(position + RANGE_CHUNK_SIZE, end + 1)
+            yield mm[position:stop]
+            position = stop
+
+
+def ranged_file_response(request, path, key: str):
+    """
+    Serve path with Range / If-Range / ETag support. key identifies the
+    stored object (not the local copy) and feeds the ETag.
+    """
+    size = path.stat().st_size
+    etag = '"' + hashlib.md5(f"{key}:{size}".encode()).hexdigest() + '"'
+    content_type = mimetypes.guess_type(key)[0] or "application/octet-stream"
+
+    if etag in parse_etags(request.headers.get("If-None-Match", "")):
+        response = HttpResponseNotModified()
+    else:
+        byte_range = None
+        if_range = request.headers.get("If-Range")
+        # A stale If-Range means the client's pieces are from another
+        # version of the file: send it whole instead
+        if size and (not if_range or if_range == etag):
+            try:
+                byte_range = parse_range(request.headers.get("Range", ""), size)
+            except RangeNotSatisfiable:
+                response = HttpResponse(status=416)
+                response["Content-Range"] = f"bytes */{size}"
+                return response
+
+        if byte_range:
+            start, end = byte_range
+            response = StreamingHttpResponse(_mmap_chunks(path, start, end), status=206, content_type=content_type)
+            response["Content-Range"] = f"bytes {start}-{end}/{size}"
+            response["Content-Length"] = str(end - start + 1)
+        else:
+            response = FileResponse(open(path, "rb"), content_type=content_type)
+
+    response["Accept-Ranges"] = "bytes"
+    response["ETag"] = etag
+    response["Cache-Control"] = "private, no-cache"
+    return response
@@ -1,13 +1,27 @@
 from rest_framework import serializers
 from django.utils import timezone
 from simpleAuthentication import settings
+from .file_access import get_file_url
 from .models import Book, Borrow
 
 
+def public_media_url(path):
+    path = str(path).lstrip("/")
+
+    # If already full URL, return it
+    if path.startswith("http"):
+        return path
+
+    bucket = "media"  # change if your bucket name differs
+
+    return f"{settings.SUPABASE_URL}/storage/v1/object/public/{bucket}/{path}"
+
+
 class BookSerializer(serializers.ModelSerializer):
     is_borrowed = serializers.SerializerMethodField()
     file_url = serializers.SerializerMethodField()
     photo_url = serializers.SerializerMethodField()
+    photo_srcset = serializers.SerializerMethodField()
 
     class Meta:
         model = Book
@@ -17,63 +31,79 @@ class BookSerializer(serializers.ModelSerializer):
             'author',
             'description',
             'photo_url',
+            'photo_srcset',
             'created_at',
             'is_borrowed',
             'file_url'
         ]
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        # Optional ?fields=id,title,... selection passed in by the view
+        requested = self.context.get('fields')
+        if requested:
+            for name in set(self.fields) - set(requested):
+                self.fields.pop(name)
+
     def get_photo_url(self, obj):
         if not obj.photo:
             return None
 
-        photo_path = str(obj.photo).lstrip("/")
+        return public_media_url(obj.photo)
 
-    # If already full URL, return it
-        if photo_path.startswith("http"):
-            return photo_path
+    def get_photo_srcset(self, obj):
+        # {"webp": "<url> 160w, <url> 320w", "jpeg": ...} for <picture>
+        if not obj.photo_variants:
+            return None
 
-        bucket = "media"  # change if your bucket name differs
+        srcset = {}
+        for variant in sorted(obj.photo_variants, key=lambda v: v['width']):
+            entry = f"{public_media_url(variant['path'])} {variant['width']}w"
+            srcset.setdefault(variant['format'], []).append(entry)
+        return {fmt: ', '.join(entries) for fmt, entries in srcset.items()}
 
-        return f"{settings.SUPABASE_URL}/storage/v1/object/public/{bucket}/{photo_path}"
+    def _borrowed_by_user(self, obj):
+        # Views pass the user's active borrows as {book_id: file URL}
+        # so a whole page is resolved with a single query.
+        borrowed = self.context.get('borrowed_books')
+        if borrowed is not None:
+            return obj.id in borrowed
 
-    def get_is_borrowed(self, obj):
         request = self.context.get('request')
         if not request or not request.user.is_authenticated:
             return False
 
         return obj.borrows.filter(
-            user=request.user,
+            user_id=request.user.id,
             returned=False
         ).exists()
 
-    def get_file_url(self, obj):
-        request = self.context.get('request')
-
-        if not request or not request.user.is_authenticated:
-            return None
+    def get_is_borrowed(self, obj):
+        return self._borrowed_by_user(obj)
 
+    def get_file_url(self, obj):
         # Only allow access if borrowed
-        is_borrowed = obj.borrows.filter(
-            user=request.user,
-            returned=False
-        ).exists()
-
-        if not is_borrowed:
+        if not self._borrowed_by_user(obj):
             return None
 
-        if not obj.file:
-            return None
-
-        file_path = str(obj.file).lstrip("/")
-
-        # If already full URL, return it
-        if file_path.startswith("http"):
-            return file_path
-
-        # Build Supabase Storage URL safely
-        bucket = "media"  # change if your bucket name differs
-
-        return f"{settings.SUPABASE_URL}/storage/v1/object/public/{bucket}/{file_path}"
+        request = self.context.get('request')
+        return get_file_url(request.user.id, obj.id, obj.file, request)
+
+    @staticmethod
+    def merge_user_state(books, borrowed):
+        """
+        Fill in is_borrowed/file_url on already serialized, user independent
+        book dicts (e.g. from the catalogue cache).
+        """
+        for book in books:
+            if book.get('id') not in borrowed:
+                continue
+            if 'is_borrowed' in book:
+                book['is_borrowed'] = True
+            if 'file_url' in book:
+                book['file_url'] = borrowed[book['id']]
+        return books
 
 
 class BorrowSerializer(serializers.ModelSerializer):
@@ -99,4 +129,28 @@ class BorrowSerializer(serializers.ModelSerializer):
     def get_is_overdue(self, obj):
         if obj.returned or not obj.return_due:
             return False
-        return timezone.now() > obj.return_due
\ No newline at end of file
+        return timezone.now() > obj.return_due
+
+class OverdueBorrowSerializer(serializers.Serializer):
+    """
+    Serializes the flat values() rows built by OverdueBooksView.
+    """
+    id = serializers.IntegerField(source='book_id')
+    title = serializers.CharField()
+    author = serializers.CharField()
+    return_due = serializers.DateTimeField()
+    days_overdue = serializers.SerializerMethodField()
+    borrowed_by = serializers.CharField()
+
+    def get_days_overdue(self, row):
+        now = self.context.get('now') or timezone.now()
+        return (now - row['return_due']).days
+
+
+class BulkBorrowSerializer(serializers.Serializer):
+    action = serializers.ChoiceField(choices=['borrow', 'return'])
+    book_ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=50
+    )
@@ -1,12 +1,40 @@
 # library/signals.py (create this file if needed)
-from django.db.models.signals import post_save
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 from django.contrib.auth.models import User
 
+from .authentication import evict_cached_user
+from .cache import bump_catalogue_version
+from .events import publish_availability
+from .models import Book
+
 @receiver(post_save, sender=User)
 def prevent_accidental_activation(sender, instance, **kwargs):
     if instance.pk and not instance.is_active:  # new or existing inactive user
         if instance.is_active:  # someone tried to activate it
             print("WARNING: Attempt to activate inactive user blocked!")
             instance.is_active = False
-            instance.save(update_fields=['is_active'])
\ No newline at end of file
+            instance.save(update_fields=['is_active'])
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def evict_authenticated_user(sender, instance, **kwargs):
+    # Deactivation or a password change should not wait for the TTL
+    evict_cached_user(instance.pk)
+
+
+@receiver(post_save, sender=Book)
+@receiver(post_delete, sender=Book)
+def invalidate_catalogue_cache(sender, instance, **kwargs):
+    # Bump after commit so no reader can cache the pre-write rows
+    # under the new version.
+    transaction.on_commit(bump_catalogue_version)
+
+
+@receiver(post_save, sender=Book)
+def announce_stock_change(sender, instance, created, **kwargs):
+    # An edit of total_copies changes availability without a borrow
+    if not created:
+        transaction.on_commit(lambda: publish_availability([instance.pk]))
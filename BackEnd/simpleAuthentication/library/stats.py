@@ -0,0 +1,200 @@
+# stats.py
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import connection, transaction
+from django.db.models import Count, DurationField, ExpressionWrapper, F, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+
+from .models import Book, BookDailyStats, BookStats, Borrow, UserDailyStats
+
+# ─────────────────────────────────────────────
+# BORROW STATISTICS ROLLUPS
+# ─────────────────────────────────────────────
+# Borrow and return flows add to three rollups inside their own
+# transaction: all-time totals per book, and daily counts per book and
+# per user. Reads never touch Borrow. Each increment is a conditional
+# UPDATE; the row is created on first use, like BorrowCounter. All-time
+# borrows are mirrored on Book.borrow_count, so ?sort=popular pages walk
+# an index on Book instead of sorting a join.
+
+STATS_FIELDS = ('borrows', 'returns', 'overdue_returns', 'loan_seconds')
+
+
+def _increment(model, lookup, counts):
+    changes = {name: F(name) + value for name, value in counts.items() if value}
+    if not changes:
+        return
+    if model.objects.filter(**lookup).update(**changes):
+        return
+
+    # First event for this key; racing creators are fine
+    model.objects.bulk_create([model(**lookup)], ignore_conflicts=True)
+    model.objects.filter(**lookup).update(**changes)
+
+
+def _record(user_id, book_id, day, counts):
+    _increment(BookStats, {'book_id': book_id}, counts)
+    _increment(BookDailyStats, {'book_id': book_id, 'day': day}, counts)
+    _increment(UserDailyStats, {'user_id': user_id, 'day': day}, counts)
+
+
+def record_borrows(user_id, book_ids, when):
+    day = timezone.localdate(when)
+    for book_id in book_ids:
+        _record(user_id, book_id, day, {'borrows': 1})
+    Book.objects.filter(pk__in=book_ids).update(borrow_count=F('borrow_count') + 1)
+
+
+def record_returns(borrows):
+    """borrows: returned Borrow objects with returned_date set."""
+    for borrow in borrows:
+        _record(
+            borrow.user_id,
+            borrow.book_id,
+            timezone.localdate(borrow.returned_date),
+            {
+                'returns': 1,
+                'overdue_returns': int(borrow.returned_date > borrow.return_due),
+                'loan_seconds': max(int((borrow.returned_date - borrow.borrow_date).total_seconds()), 0),
+            },
+        )
+
+
+# ─────────────────────────────────────────────
+# READS
+# ─────────────────────────────────────────────
+
+def summarize(row: dict) -> dict:
+    """Replace loan_seconds with the derived loan metrics."""
+    row = dict(row)
+    for name in STATS_FIELDS:
+        row[name] = row.get(name) or 0
+
+    returns = row['returns']
+    loan_seconds = row.pop('loan_seconds')
+    row['avg_loan_days'] = round(loan_seconds / returns / 86400, 1) if returns else None
+    row['overdue_rate'] = round(row['overdue_returns'] / returns, 3) if returns else None
+    return row
+
+
+def window_sums():
+    return {name: Sum(name) for name in STATS_FIELDS}
+
+
+def top_books(since, limit):
+    rows = (
+        BookDailyStats.objects
+        .filter(day__gte=since)
+        .values('book_id', title=F('book__title'), author=F('book__author'))
+        .annotate(**window_sums())
+        .order_by('-borrows', 'book_id')[:limit]
+    )
+    return [summarize(row) for row in rows]
+
+
+def user_window(user_id, since):
+    return summarize(
+        UserDailyStats.objects
+        .filter(user_id=user_id, day__gte=since)
+        .aggregate(**window_sums())
+    )
+
+
+def book_report(book_id, since):
+    totals = BookStats.objects.filter(book_id=book_id).values(*STATS_FIELDS).first() or {}
+    daily = (
+        BookDailyStats.objects
+        .filter(book_id=book_id, day__gte=since)
+        .order_by('day')
+        .values('day', *STATS_FIELDS)
+    )
+    return {
+        'totals': summarize(totals),
+        'daily': [summarize(row) for row in daily],
+    }
+
+
+# ─────────────────────────────────────────────
+# REBUILD
+# ─────────────────────────────────────────────
+
+def _aggregate_borrows(group_field):
+    return (
+        Borrow.objects
+        .annotate(day=TruncDate('borrow_date'))
+        .values(group_field, 'day')
+        .annotate(borrows=Count('id'))
+        .order_by()
+    )
+
+
+def _aggregate_returns(group_field):
+    loan = ExpressionWrapper(F('returned_date') - F('borrow_date'), output_field=DurationField())
+    return (
+        Borrow.objects
+        .filter(returned=True, returned_date__isnull=False)
+        .annotate(day=TruncDate('returned_date'))
+        .values(group_field, 'day')
+        .annotate(
+            returns=Count('id'),
+            overdue_returns=Count('id', filter=Q(returned_date__gt=F('return_due'))),
+            loan=Sum(loan),
+        )
+        .order_by()
+    )
+
+
+def _daily_rows(group_field):
+    rows = defaultdict(lambda: dict.fromkeys(STATS_FIELDS, 0))
+
+    for row in _aggregate_borrows(group_field).iterator():
+        rows[row[group_field], row['day']]['borrows'] = row['borrows']
+
+    for row in _aggregate_returns(group_field).iterator():
+        counts = rows[row[group_field], row['day']]
+        counts['returns'] = row['returns']
+        counts['overdue_returns'] = row['overdue_returns']
+        counts['loan_seconds'] = max(int((row['loan'] or timedelta()).total_seconds()), 0)
+
+    return rows
+
+
+def rebuild_stats(batch_size=5000):
+    """Recompute every rollup from Borrow. Returns rows written per table."""
+    with transaction.atomic():
+        if connection.vendor == 'postgresql':
+            # Hold off borrows and returns so none is missed or counted twice
+            with connection.cursor() as cursor:
+                cursor.execute(f'LOCK TABLE {Borrow._meta.db_table} IN SHARE MODE')
+
+        BookStats.objects.all().delete()
+        BookDailyStats.objects.all().delete()
+        UserDailyStats.objects.all().delete()
+
+        book_days = _daily_rows('book_id')
+        user_days = _daily_rows('user_id')
+
+        totals = defaultdict(lambda: dict.fromkeys(STATS_FIELDS, 0))
+        for (book_id, _), counts in book_days.items():
+            for name, value in counts.items():
+                totals[book_id][name] += value
+
+        BookDailyStats.objects.bulk_create(
+            (BookDailyStats(book_id=book_id, day=day, **counts) for (book_id, day), counts in book_days.items()),
+            batch_size=batch_size,
+        )
+        UserDailyStats.objects.bulk_create(
+            (UserDailyStats(user_id=user_id, day=day, **counts) for (user_id, day), counts in user_days.items()),
+            batch_size=batch_size,
+        )
+        BookStats.objects.bulk_create(
+            (BookStats(book_id=book_id, **counts) for book_id, counts in totals.items()),
+            batch_size=batch_size,
+        )
+        Book.objects.update(borrow_count=Coalesce(
+            Subquery(BookStats.objects.filter(book_id=OuterRef('pk')).values('borrows')), 0,
+        ))
+
+    return {'books': len(totals), 'book_days': len(book_days), 'user_days': len(user_days)}
@@ -0,0 +1,197 @@
+# storage.py
+import hashlib
+import os
+import shutil
+import threading
+import time
+from abc import ABC, abstractmethod
+from pathlib import Path
+from urllib.parse import urlencode
+
+import requests
+from django.conf import settings
+from django.dispatch import receiver
+from django.test.signals import setting_changed
+from django.urls import reverse
+from django.utils.crypto import constant_time_compare, salted_hmac
+from django.utils.module_loading import import_string
+
+# ─────────────────────────────────────────────
+# STORAGE BACKENDS
+# ─────────────────────────────────────────────
+# Book files and covers live in a single "media" bucket. The backend is
+# chosen with LIBRARY_STORAGE_BACKEND so tests and local development can
+# swap Supabase for a plain directory.
+
+BUCKET = "media"
+CHUNK_SIZE = 1024 * 1024
+
+# ─────────────────────────────────────────────
+# SHARED SUPABASE CLIENT
+# ─────────────────────────────────────────────
+# Built on first use rather than at import time, so manage.py commands,
+# migrations and worker boot never pay for the supabase import or the
+# client's HTTP session setup unless they actually touch storage.
+
+_supabase_client = None
+_supabase_lock = threading.Lock()
+
+
+def get_supabase_client():
+    global _supabase_client
+    if _supabase_client is None:
+        with _supabase_lock:
+            if _supabase_client is None:
+                from supabase import create_client
+                _supabase_client = create_client(settings.SUPABASE_URL, settings.SUPABASE_KEY)
+    return _supabase_client
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for chunk in iter(lambda: fh.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class StorageBackend(ABC):
+    """A backend missing any abstract method fails when it is created."""
+
+    @abstractmethod
+    def upload(self, path: str, local_path: str, content_type: str):
+        """Stream the file at local_path to path, replacing any existing object."""
+
+    @abstractmethod
+    def signed_url(self, path: str, expires_in: int) -> str:
+        """Return a URL that grants read access to path for expires_in seconds."""
+
+    @abstractmethod
+    def download(self, path: str, local_path: str):
+        """Stream the object at path into local_path."""
+
+    def local_path(self, path: str) -> Path | None:
+        """The object's location on this machine, if it already has one."""
+        return None
+
+    @abstractmethod
+    def exists(self, path: str) -> bool:
+        """Whether an object is stored at path."""
+
+    @abstractmethod
+    def delete(self, path: str):
+        """Remove the object at path."""
+
+
+class SupabaseStorage(StorageBackend):
+
+    @property
+    def bucket(self):
+        return get_supabase_client().storage.from_(BUCKET)
+
+    def upload(self, path, local_path, content_type):
+        # Passing an open file lets httpx stream the body in chunks
+        # instead of holding the whole PDF in memory.
+        with open(local_path, "rb") as fh:
+            self.bucket.upload(
+                path,
+                fh,
+                {
+                    "content-type": content_type,
+                    "upsert": "true",
+                },
+            )
+
+    def signed_url(self, path, expires_in):
+        result = self.bucket.create_signed_url(path, expires_in)
+        # Key casing differs between storage3 releases
+        return result.get("signedURL") or result["signedUrl"]
+
+    def exists(self, path):
+        return self.bucket.exists(path)
+
+    def delete(self, path):
+        self.bucket.remove([path])
+
+    def download(self, path, local_path):
+        # bucket.download() buffers the whole object; a short lived signed
+        # URL lets us stream it to disk in chunks instead.
+        with requests.get(self.signed_url(path, 60), stream=True, timeout=30) as response:
+            response.raise_for_status()
+            with open(local_path, "wb") as fh:
+                for chunk in response.iter_content(CHUNK_SIZE):
+                    fh.write(chunk)
+
+
+class LocalStorage(StorageBackend):
+
+    def __init__(self, root=None):
+        self.root = Path(root or getattr(settings, "LIBRARY_LOCAL_STORAGE_ROOT", None) or settings.MEDIA_ROOT)
+
+    def path(self, path: str) -> Path:
+        return self.root / path
+
+    def local_path(self, path):
+        return self.path(path)
+
+    def exists(self, path):
+        return self.path(path).is_file()
+
+    def delete(self, path):
+        self.path(path).unlink(missing_ok=True)
+
+    def download(self, path, local_path):
+        with open(self.path(path), "rb") as src, open(local_path, "wb") as dst:
+            shutil.copyfileobj(src, dst, CHUNK_SIZE)
+
+    def upload(self, path, local_path, content_type):
+        target = self.path(path)
+        target.parent.mkdir(parents=True, exist_ok=True)
+
+        # Write to a sibling temp file and rename so readers never
+        # see a half written object.
+        partial = target.with_name(target.name + ".part")
+        with open(local_path, "rb") as src, open(partial, "wb") as dst:
+            shutil.copyfileobj(src, dst, CHUNK_SIZE)
+        os.replace(partial, target)
+
+    # Signed URLs point at the signed-file view, which checks the HMAC
+    # and expiry before streaming the file from root.
+
+    SIGNING_SALT = "library.storage.LocalStorage"
+
+    def signature(self, path: str, expires: int) -> str:
+        return salted_hmac(self.SIGNING_SALT, f"{path}:{expires}", algorithm="sha256").hexdigest()
+
+    def signed_url(self, path, expires_in):
+        expires = int(time.time()) + expires_in
+        query = urlencode({"expires": expires, "signature": self.signature(path, expires)})
+        return f"{reverse('signed-file', args=[path])}?{query}"
+
+    def verify(self, path: str, expires: str, signature: str) -> bool:
+        try:
+            expires = int(expires)
+        except (TypeError, ValueError):
+            return False
+        if expires < time.time():
+            return False
+        return constant_time_compare(self.signature(path, expires), signature or "")
+
+
+_backend = None
+
+
+def get_storage_backend() -> StorageBackend:
+    global _backend
+    if _backend is None:
+        backend_path = getattr(settings, "LIBRARY_STORAGE_BACKEND", "library.storage.SupabaseStorage")
+        _backend = import_string(backend_path)()
+    return _backend
+
+
+@receiver(setting_changed)
+def reset_storage_backend(setting=None, **kwargs):
+    """Forget the cached backend when storage settings change (tests)."""
+    global _backend
+    if setting in (None, "LIBRARY_STORAGE_BACKEND", "LIBRARY_LOCAL_STORAGE_ROOT", "MEDIA_ROOT"):
+        _backend = None
@@ -1,3 +1,1536 @@
-from django.test import TestCase
+import asyncio
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from datetime import timedelta
+from io import BytesIO, StringIO
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core import mail
+from django.core.management import call_command
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection, transaction
+from django.db.models import F
+from django.http import FileResponse
+from django.test import AsyncRequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import NoReverseMatch, reverse
+from django.utils import timezone
+from PIL import Image
+from rest_framework.test import APIClient
+
+from .models import (
+    Book,
+    BookDailyStats,
+    BookStats,
+    Borrow,
+    BorrowCounter,
+    CatalogueVersion,
+    EmailOutbox,
+    HOLD_CANCELLED,
+    HOLD_FULFILLED,
+    HOLD_WAITING,
+    Hold,
+    OUTBOX_FAILED,
+    OUTBOX_PENDING,
+    OUTBOX_SENT,
+    UPLOAD_FAILED,
+    UPLOAD_PENDING,
+    UPLOAD_UPLOADED,
+    UserDailyStats,
+)
+from .async_views import AsyncBookListView, AsyncBorrowedBooksView, AsyncReadBookView, route_view
+from .authentication import clear_user_cache
+from .cache import CATALOGUE_VERSION_KEY
+from .events import InProcessBroker, get_broker
+from .views import BookListView, StrictTokenObtainPairSerializer
+from .borrowing import BORROW_LIMIT, BorrowError, borrow_book, bulk_borrow, bulk_return, return_book
+from .file_cache import evict_file_cache
+from .storage import LocalStorage, StorageBackend
+from .utils import OUTBOX_MAX_ATTEMPTS, drain_outbox, next_outbox_delay, send_email_async
+
+
+class LocalStorageMixin:
+    """
+    Stores files under a fresh temporary LocalStorage root for each test,
+    with uploads run inline instead of on the background executor.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.media_root = self.make_temp_dir()
+        self.use_settings(
+            LIBRARY_STORAGE_BACKEND='library.storage.LocalStorage',
+            LIBRARY_LOCAL_STORAGE_ROOT=self.media_root,
+            LIBRARY_UPLOADS_EAGER=True,
+        )
+
+    def make_temp_dir(self) -> str:
+        path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, path, ignore_errors=True)
+        return path
+
+    def use_settings(self, **settings):
+        overrides = override_settings(**settings)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+
+class AuthenticatedClientMixin:
+    """
+    Starts each test with an empty cache and self.client logged in as
+    self.user, a plain reader account.
+    """
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.user = User.objects.create_user(username='reader', password='pass12345')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+
+class BookListQueryCountTests(AuthenticatedClientMixin, TestCase):
+
+    def _create_books(self, count):
+        with self.captureOnCommitCallbacks(execute=True):
+            books = [Book.objects.create(title=f'Book {i}', author='Author') for i in range(count)]
+        Borrow.objects.create(user=self.user, book=books[0])
+        return books
+
+    def _count_queries(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('books'))
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries), response
+
+    def test_query_count_does_not_grow_with_books(self):
+        self._create_books(2)
+        small, _ = self._count_queries()
+
+        self._create_books(20)
+        large, _ = self._count_queries()
+
+        self.assertEqual(small, large)
+
+    def test_is_borrowed_reflects_current_user(self):
+        books = self._create_books(3)
+        other = User.objects.create_user(username='other', password='pass12345')
+        Borrow.objects.create(user=other, book=books[1])
+
+        _, response = self._count_queries()
+        flags = {b['id']: b['is_borrowed'] for b in response.json()['results']}
+
+        self.assertTrue(flags[books[0].id])
+        self.assertFalse(flags[books[1].id])
+        self.assertFalse(flags[books[2].id])
+
+
+class BookListPaginationTests(AuthenticatedClientMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        for i in range(5):
+            Book.objects.create(title=f'Book {i}', author='Author', description='x' * 500)
+
+    def test_cursor_pages_cover_catalogue_once(self):
+        response = self.client.get(reverse('books'), {'page_size': 2})
+        payload = response.json()
+        self.assertEqual(payload['count'], 5)
+
+        seen = [b['id'] for b in payload['results']]
+        while payload['next']:
+            with CaptureQueriesContext(connection) as ctx:
+                payload = self.client.get(payload['next']).json()
+            # Only the first page is counted
+            self.assertNotIn('count', payload)
+            self.assertFalse(any('COUNT(' in q['sql'] for q in ctx.captured_queries))
+            seen += [b['id'] for b in payload['results']]
+
+        self.assertEqual(len(seen), 5)
+        self.assertEqual(len(set(seen)), 5)
+
+    def test_fields_param_limits_payload(self):
+        response = self.client.get(reverse('books'), {'fields': 'id,title'})
+        book = response.json()['results'][0]
+        self.assertEqual(set(book), {'id', 'title'})
+
+
+@unittest.skipUnless(connection.vendor == 'postgresql', 'needs full-text search')
+class BookSearchTests(AuthenticatedClientMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.django = Book.objects.create(title='Python for Django', author='Ada')
+        Book.objects.create(title='Angular Basics', author='Linus', description='Frontend work')
+
+    def test_prefix_terms_match(self):
+        response = self.client.get(reverse('book-search'), {'q': 'pyth dja'})
+        payload = response.json()
+        self.assertEqual(payload['count'], 1)
+        self.assertEqual(payload['results'][0]['id'], self.django.id)
+
+    def test_empty_query_returns_nothing(self):
+        response = self.client.get(reverse('book-search'), {'q': '  '})
+        self.assertEqual(response.json()['count'], 0)
+
+    def test_vector_follows_queryset_updates(self):
+        # Maintained by the trigger, not by Book.save
+        Book.objects.filter(pk=self.django.pk).update(title='Rust in Action')
+        response = self.client.get(reverse('book-search'), {'q': 'rust'})
+        self.assertEqual([b['id'] for b in response.json()['results']], [self.django.id])
+
+
+class BookListCacheTests(AuthenticatedClientMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.book = Book.objects.create(title='Cached', author='Author')
+
+    def test_second_request_is_served_from_cache(self):
+        self.client.get(reverse('books'))
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(reverse('books'))
+        # Only the per-user borrow lookup remains
+        self.assertEqual(len(ctx.captured_queries), 1)
+
+    def test_book_write_invalidates_cache(self):
+        self.client.get(reverse('books'))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.book.title = 'Renamed'
+            self.book.save()
+
+        response = self.client.get(reverse('books'))
+        self.assertEqual(response.json()['results'][0]['title'], 'Renamed')
+
+    def test_bump_from_another_process_is_seen(self):
+        self.client.get(reverse('books'))
+        # A management command bumps in the database; its cache isn't ours
+        Book.objects.filter(pk=self.book.pk).update(title='Imported')
+        CatalogueVersion.objects.update(version=F('version') + 1)
+        cache.delete(CATALOGUE_VERSION_KEY)  # our copy expires after CATALOGUE_VERSION_TTL
+
+        response = self.client.get(reverse('books'))
+        self.assertEqual(response.json()['results'][0]['title'], 'Imported')
+
+    def test_etag_revalidation(self):
+        response = self.client.get(reverse('books'))
+        etag = response['ETag']
+
+        response = self.client.get(reverse('books'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        Borrow.objects.create(user=self.user, book=self.book)
+        response = self.client.get(reverse('books'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()['results'][0]['is_borrowed'])
+
+
+class BookUploadPipelineTests(LocalStorageMixin, TestCase):
+
+    CONTENT = b'%PDF-1.4 ' + b'x' * 4096
+    FILE_HASH = hashlib.sha256(CONTENT).hexdigest()
+
+    def _create_book(self, name='guide.pdf', content=CONTENT):
+        return Book.objects.create(
+            title='Uploaded',
+            author='Author',
+            file=SimpleUploadedFile(name, content, content_type='application/pdf'),
+        )
+
+    def test_save_defers_upload_until_commit(self):
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            book = self._create_book()
+
+        self.assertEqual(book.upload_status, UPLOAD_PENDING)
+        self.assertEqual(str(book.file), f'books/{self.FILE_HASH}.pdf')
+        self.assertFalse((Path(self.media_root) / str(book.file)).exists())
+        # The upload itself plus the catalogue cache bump
+        self.assertEqual(len(callbacks), 2)
+
+    def test_rolled_back_save_leaves_no_spooled_files(self):
+        spool_dir = self.make_temp_dir()
+        self.use_settings(LIBRARY_UPLOAD_SPOOL_DIR=spool_dir)
+
+        with self.assertRaises(RuntimeError):
+            with transaction.atomic():
+                self._create_book()
+                raise RuntimeError
+        self.assertEqual(os.listdir(spool_dir), [])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self._create_book()
+        self.assertEqual(os.listdir(spool_dir), [])
+
+    def test_incomplete_backend_fails_on_creation(self):
+        class UploadOnly(StorageBackend):
+            def upload(self, path, local_path, content_type):
+                pass
+
+        with self.assertRaises(TypeError):
+            UploadOnly()
+
+    def test_upload_streams_file_to_backend(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            book = self._create_book()
+
+        book.refresh_from_db()
+        self.assertEqual(book.upload_status, UPLOAD_UPLOADED)
+        stored = Path(self.media_root) / f'books/{self.FILE_HASH}.pdf'
+        self.assertEqual(stored.stat().st_size, 4096 + 9)
+        self.assertEqual(book.file_hash, self.FILE_HASH)
+
+    @mock.patch('library.uploads.UPLOAD_BACKOFF_SECONDS', 0)
+    def test_failed_upload_is_recorded(self):
+        with mock.patch.object(LocalStorage, 'upload', side_effect=OSError('bucket down')) as upload:
+            with self.captureOnCommitCallbacks(execute=True):
+                book = self._create_book()
+
+        book.refresh_from_db()
+        self.assertEqual(upload.call_count, 4)
+        self.assertEqual(book.upload_status, UPLOAD_FAILED)
+        self.assertIn('bucket down', book.upload_error)
+
+    def test_identical_files_are_stored_once(self):
+        with mock.patch.object(LocalStorage, 'upload', wraps=LocalStorage().upload) as upload:
+            with self.captureOnCommitCallbacks(execute=True):
+                first = self._create_book('guide.pdf')
+            with self.captureOnCommitCallbacks(execute=True):
+                second = self._create_book('copy-of-guide.pdf')
+
+        second.refresh_from_db()
+        self.assertEqual(upload.call_count, 1)
+        self.assertEqual(str(first.file), str(second.file))
+        self.assertEqual(second.upload_status, UPLOAD_UPLOADED)
+
+    def test_same_name_different_bytes_do_not_collide(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            first = self._create_book('guide.pdf')
+            second = self._create_book('guide.pdf', b'%PDF-1.4 other')
+
+        self.assertNotEqual(str(first.file), str(second.file))
+        self.assertEqual((Path(self.media_root) / str(first.file)).read_bytes(), self.CONTENT)
+
+    def test_backfill_hashes_and_relinks_duplicates(self):
+        for name in ('old-a.pdf', 'old-b.pdf'):
+            path = Path(self.media_root) / 'books' / name
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_bytes(self.CONTENT)
+            book = Book.objects.create(title=name, author='Author')
+            Book.objects.filter(pk=book.pk).update(file=f'books/{name}')
+
+        out = StringIO()
+        call_command('backfill_file_hashes', '--relink', stdout=out)
+
+        self.assertEqual(set(Book.objects.values_list('file_hash', flat=True)), {self.FILE_HASH})
+        self.assertEqual(set(Book.objects.values_list('file', flat=True)), {f'books/{self.FILE_HASH}.pdf'})
+        self.assertEqual(sorted(p.name for p in (Path(self.media_root) / 'books').iterdir()), [f'{self.FILE_HASH}.pdf'])
+        self.assertIn('1 distinct file(s)', out.getvalue())
+
+
+@override_settings(
+    EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend',
+    LIBRARY_EMAIL_EAGER=True,
+)
+class EmailOutboxTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def test_register_queues_email_and_sends_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            response = APIClient().post(reverse('register'), {
+                'first_name': 'Ada',
+                'last_name': 'Lovelace',
+                'username': 'ada',
+                'email': 'ada@example.com',
+                'password': 'An4lytical-Engine',
+                'password2': 'An4lytical-Engine',
+            })
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(EmailOutbox.objects.get().status, OUTBOX_PENDING)
+        self.assertEqual(len(mail.outbox), 0)
+
+        for callback in callbacks:
+            callback()
+
+        self.assertEqual(EmailOutbox.objects.get().status, OUTBOX_SENT)
+        self.assertEqual(mail.outbox[0].to, ['ada@example.com'])
+
+    def test_rolled_back_transaction_drops_email(self):
+        with self.assertRaises(RuntimeError):
+            with transaction.atomic():
+                send_email_async(subject='Hi', message='x', recipient_list=['a@example.com'])
+                raise RuntimeError
+
+        self.assertFalse(EmailOutbox.objects.exists())
+
+    def test_failed_send_is_retried_later(self):
+        with self.captureOnCommitCallbacks(execute=False):
+            send_email_async(subject='Hi', message='x', recipient_list=['a@example.com'])
+
+        with mock.patch('django.core.mail.EmailMultiAlternatives.send', side_effect=OSError('smtp down')):
+            self.assertEqual(drain_outbox(), 1)
+
+        item = EmailOutbox.objects.get()
+        self.assertEqual(item.status, OUTBOX_PENDING)
+        self.assertEqual(item.attempts, 1)
+        self.assertIn('smtp down', item.last_error)
+        # Not due yet, so a second drain does nothing
+        self.assertEqual(drain_outbox(), 0)
+        # ...and the worker sleeps until the retry is due
+        self.assertAlmostEqual(next_outbox_delay(), 120, delta=5)
+
+    def test_connection_failure_counts_as_an_attempt(self):
+        with self.captureOnCommitCallbacks(execute=False):
+            send_email_async(subject='Hi', message='x', recipient_list=['a@example.com'])
+            send_email_async(subject='Last try', message='x', recipient_list=['b@example.com'])
+        EmailOutbox.objects.filter(subject='Last try').update(attempts=OUTBOX_MAX_ATTEMPTS - 1)
+
+        with mock.patch('library.utils.get_connection', side_effect=OSError('smtp unreachable')):
+            self.assertEqual(drain_outbox(), 2)
+
+        retried = EmailOutbox.objects.get(subject='Hi')
+        self.assertEqual((retried.status, retried.attempts), (OUTBOX_PENDING, 1))
+        self.assertIn('smtp unreachable', retried.last_error)
+        self.assertAlmostEqual(next_outbox_delay(), 120, delta=5)
+        self.assertEqual(EmailOutbox.objects.get(subject='Last try').status, OUTBOX_FAILED)
+
+    def test_batch_is_claimed_before_sending(self):
+        with self.captureOnCommitCallbacks(execute=False):
+            send_email_async(subject='Hi', message='x', recipient_list=['a@example.com'])
+
+        def send(*args, **kwargs):
+            # Leased while in flight: another drainer would skip it
+            item = EmailOutbox.objects.get()
+            self.assertGreater(item.next_attempt_at, timezone.now() + timedelta(minutes=5))
+            self.assertEqual(drain_outbox(), 0)
+            return 1
+
+        with mock.patch('django.core.mail.EmailMultiAlternatives.send', side_effect=send):
+            self.assertEqual(drain_outbox(), 1)
+
+        self.assertEqual(EmailOutbox.objects.get().status, OUTBOX_SENT)
+        self.assertIsNone(next_outbox_delay())
+
+
+@override_settings(EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend')
+class OverdueReminderCommandTests(TestCase):
+
+    def setUp(self):
+        past = timezone.now() - timedelta(days=3)
+        for name in ('ada', 'linus'):
+            user = User.objects.create_user(username=name, email=f'{name}@example.com', password='pass12345')
+            for i in range(2):
+                book = Book.objects.create(title=f'{name} book {i}', author='Author')
+                Borrow.objects.create(user=user, book=book, return_due=past)
+
+        # Not overdue, must not be mentioned
+        on_time = Book.objects.create(title='On time', author='Author')
+        Borrow.objects.create(user=User.objects.get(username='ada'), book=on_time)
+
+    def test_one_message_per_user(self):
+        call_command('send_overdue_reminders', batch_size=1, stdout=StringIO())
+
+        self.assertEqual(sorted(m.to[0] for m in mail.outbox), ['ada@example.com', 'linus@example.com'])
+        ada = next(m for m in mail.outbox if m.to == ['ada@example.com'])
+        self.assertIn('ada book 0', ada.body)
+        self.assertIn('ada book 1', ada.body)
+        self.assertNotIn('On time', ada.body)
+
+    def test_rerun_does_not_double_send(self):
+        call_command('send_overdue_reminders', stdout=StringIO())
+        call_command('send_overdue_reminders', stdout=StringIO())
+        self.assertEqual(len(mail.outbox), 2)
+
+
+class OverdueBooksViewTests(TestCase):
+
+    def setUp(self):
+        self.staff = User.objects.create_user(username='staff', password='pass12345', is_staff=True)
+        self.client = APIClient()
+        self.client.force_authenticate(self.staff)
+
+    def _seed(self, users, start=0):
+        now = timezone.now()
+        for u in range(start, start + users):
+            user = User.objects.create_user(username=f'user{u}', password='pass12345')
+            for days in (2, 10, 40):
+                book = Book.objects.create(title=f'Book {u}-{days}', author='Author')
+                Borrow.objects.create(user=user, book=book, return_due=now - timedelta(days=days))
+
+    def _get(self, **params):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('overdue-books'), params)
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries), response.json()
+
+    def test_rows_and_query_count_are_constant(self):
+        self._seed(1)
+        small, payload = self._get()
+        self.assertEqual(payload['count'], 3)
+        row = payload['results'][0]
+        self.assertEqual(row['borrowed_by'], 'user0')
+        self.assertEqual(row['days_overdue'], 40)
+
+        self._seed(5, start=1)
+        large, _ = self._get()
+        self.assertEqual(small, large)
+
+    def test_summary_buckets(self):
+        self._seed(2)
+        _, summary = self._get(summary=1)
+        self.assertEqual(summary['total'], 6)
+        self.assertEqual(summary['buckets'], {'0-7': 2, '8-30': 2, '31+': 2})
+        self.assertEqual([u['count'] for u in summary['users']], [3, 3])
+
+    def test_summary_is_two_queries_and_limits_users(self):
+        self._seed(3)
+        with mock.patch('library.views.OverdueBooksView.SUMMARY_TOP_USERS', 2):
+            queries, summary = self._get(summary=1)
+        self.assertEqual(summary['total'], 9)
+        self.assertEqual(len(summary['users']), 2)
+        self.assertEqual(set(summary['users'][0]), {'user_id', 'username', 'count'})
+
+        self._seed(3, start=3)
+        self.assertEqual(self._get(summary=1)[0], queries)
+
+    def test_summary_bucket_edges_match_days_overdue(self):
+        now = timezone.now()
+        user = User.objects.create_user(username='edge', password='pass12345')
+        for days in (7, 8, 30, 31):
+            book = Book.objects.create(title=f'Edge {days}', author='Author')
+            Borrow.objects.create(user=user, book=book, return_due=now - timedelta(days=days, hours=1))
+
+        _, summary = self._get(summary=1)
+        self.assertEqual(summary['buckets'], {'0-7': 1, '8-30': 2, '31+': 1})
+
+    def test_regular_user_sees_only_own_rows(self):
+        self._seed(2)
+        self.client.force_authenticate(User.objects.get(username='user1'))
+        _, payload = self._get()
+        self.assertEqual({r['borrowed_by'] for r in payload['results']}, {'user1'})
+
+
+class BorrowConstraintTests(AuthenticatedClientMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.book = Book.objects.create(title='Only one', author='Author')
+
+    def test_second_active_borrow_is_rejected(self):
+        url = reverse('borrow-book', args=[self.book.id])
+        self.assertEqual(self.client.post(url).status_code, 201)
+
+        response = self.client.post(url)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Borrow.objects.filter(returned=False).count(), 1)
+
+    def test_returned_borrows_do_not_block_reborrowing(self):
+        Borrow.objects.create(user=self.user, book=self.book, returned=True)
+        url = reverse('borrow-book', args=[self.book.id])
+        self.assertEqual(self.client.post(url).status_code, 201)
+
+
+class BorrowLimitTests(AuthenticatedClientMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.books = [Book.objects.create(title=f'Book {i}', author='Author') for i in range(BORROW_LIMIT + 1)]
+
+    def _borrow(self, book):
+        return self.client.post(reverse('borrow-book', args=[book.id]))
+
+    def test_limit_is_enforced(self):
+        for book in self.books[:BORROW_LIMIT]:
+            self.assertEqual(self._borrow(book).status_code, 201)
+
+        self.assertEqual(self._borrow(self.books[-1]).status_code, 403)
+        self.assertEqual(BorrowCounter.objects.get(user=self.user).active_borrows, BORROW_LIMIT)
+
+    def test_return_frees_a_slot(self):
+        for book in self.books[:BORROW_LIMIT]:
+            self._borrow(book)
+
+        response = self.client.post(reverse('return-book', args=[self.books[0].id]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self._borrow(self.books[-1]).status_code, 201)
+
+    def test_counter_is_seeded_from_existing_borrows(self):
+        for book in self.books[:BORROW_LIMIT]:
+            Borrow.objects.create(user=self.user, book=book)
+
+        self.assertEqual(self._borrow(self.books[-1]).status_code, 403)
+
+    def test_duplicate_does_not_consume_a_slot(self):
+        self._borrow(self.books[0])
+        self.assertEqual(self._borrow(self.books[0]).status_code, 400)
+        self.assertEqual(BorrowCounter.objects.get(user=self.user).active_borrows, 1)
+
+
+@unittest.skipUnless(connection.vendor == 'postgresql', 'needs row-level locking')
+class ConcurrentBorrowTests(TransactionTestCase):
+
+    def test_limit_holds_under_concurrent_borrows(self):
+        user = User.objects.create_user(username='racer', password='pass12345')
+        books = [Book.objects.create(title=f'Book {i}', author='Author') for i in range(12)]
+        barrier = threading.Barrier(len(books) * 2)
+
+        def worker(book):
+            barrier.wait()
+            try:
+                borrow_book(user, book.id)
+            except BorrowError:
+                pass
+            finally:
+                connection.close()
+
+        # Every book is requested twice at the same moment
+        threads = [threading.Thread(target=worker, args=(b,)) for b in books for _ in range(2)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        active = Borrow.objects.filter(user=user, returned=False)
+        self.assertEqual(active.count(), BORROW_LIMIT)
+        self.assertEqual(active.values('book').distinct().count(), BORROW_LIMIT)
+        self.assertEqual(BorrowCounter.objects.get(user=user).active_borrows, BORROW_LIMIT)
+
+    def test_copies_hold_under_concurrent_borrows(self):
+        users = [User.objects.create_user(username=f'racer{i}', password='pass12345') for i in range(12)]
+        book = Book.objects.create(title='Bestseller', author='Author', total_copies=3)
+        barrier = threading.Barrier(len(users))
+        outcomes = []
+
+        def worker(user):
+            barrier.wait()
+            try:
+                borrow_book(user, book.id)
+                outcomes.append(201)
+            except BorrowError as e:
+                outcomes.append(e.status_code)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker, args=(u,)) for u in users]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        book.refresh_from_db()
+        self.assertEqual(sorted(outcomes), [201] * 3 + [409] * 9)
+        self.assertEqual(Borrow.objects.filter(book=book, returned=False).count(), 3)
+        self.assertEqual((book.active_borrow_count, book.available_copies), (3, 0))
+
+
+class BulkBorrowTests(AuthenticatedClientMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.books = [Book.objects.create(title=f'Book {i}', author='Author') for i in range(5)]
+
+    def _bulk(self, action, ids):
+        response = self.client.post(reverse('bulk-borrow'), {'action': action, 'book_ids': ids}, format='json')
+        self.assertEqual(response.status_code, 200)
+        return {r['book_id']: r['status'] for r in response.json()['results']}
+
+    def test_bulk_borrow_respects_limit(self):
+        ids = [b.id for b in self.books[:4]] + [999999]
+        statuses = self._bulk('borrow', ids)
+
+        self.assertEqual([statuses[i] for i in ids], [201, 201, 201, 403, 404])
+        self.assertEqual(Borrow.objects.filter(user=self.user, returned=False).count(), 3)
+        self.assertEqual(BorrowCounter.objects.get(user=self.user).active_borrows, 3)
+
+    def test_bulk_return(self):
+        ids = [b.id for b in self.books[:3]]
+        self._bulk('borrow', ids)
+
+        statuses = self._bulk('return', ids + [self.books[4].id])
+        self.assertEqual([statuses[i] for i in ids], [200, 200, 200])
+        self.assertEqual(statuses[self.books[4].id], 400)
+        self.assertEqual(BorrowCounter.objects.get(user=self.user).active_borrows, 0)
+
+    def test_invalid_action_is_rejected(self):
+        response = self.client.post(reverse('bulk-borrow'), {'action': 'steal', 'book_ids': [1]}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+
+class TokenAuthenticationTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        clear_user_cache()
+        self.user = User.objects.create_user(username='reader', password='pass12345', is_staff=True)
+        Book.objects.create(title='Book', author='Author')
+        response = APIClient().post(reverse('token_obtain_pair'), {'username': 'reader', 'password': 'pass12345'})
+        self.access = response.json()['access']
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.access}')
+
+    def _user_queries(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return [q for q in ctx.captured_queries if 'FROM "auth_user"' in q['sql']]
+
+    def test_stateless_views_skip_user_query(self):
+        self.assertEqual(self._user_queries(reverse('books')), [])
+        self.assertEqual(self._user_queries(reverse('borrowed-books')), [])
+
+    def test_full_user_views_hit_cache_after_first_request(self):
+        self.assertEqual(len(self._user_queries(reverse('overdue-books'))), 1)
+        self.assertEqual(self._user_queries(reverse('overdue-books')), [])
+
+    def test_default_views_load_user_every_request(self):
+        self.assertEqual(len(self._user_queries(reverse('borrow-export'))), 1)
+        self.assertEqual(len(self._user_queries(reverse('borrow-export'))), 1)
+
+    def test_deactivation_evicts_cached_user(self):
+        self._user_queries(reverse('overdue-books'))
+        self.user.is_active = False
+        self.user.save()
+
+        response = self.client.get(reverse('overdue-books'))
+        self.assertEqual(response.status_code, 401)
+
+
+class SignedFileUrlTests(LocalStorageMixin, AuthenticatedClientMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.book = Book.objects.create(
+                title='Signed',
+                author='Author',
+                file=SimpleUploadedFile('signed.pdf', b'%PDF-1.4 secret', content_type='application/pdf'),
+            )
+        Borrow.objects.create(user=self.user, book=self.book)
+
+    def _read_url(self):
+        response = self.client.get(reverse('read-book', args=[self.book.id]))
+        self.assertEqual(response.status_code, 200)
+        return response.json()['url']
+
+    def test_signed_url_serves_file(self):
+        response = APIClient().get(self._read_url())
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), b'%PDF-1.4 secret')
+
+    def test_tampered_or_expired_url_is_rejected(self):
+        url = self._read_url()
+        self.assertEqual(APIClient().get(url.replace('signature=', 'signature=0')).status_code, 403)
+
+        with mock.patch('library.storage.time.time', return_value=time.time() + 3600):
+            self.assertEqual(APIClient().get(url).status_code, 403)
+
+    def test_repeat_reads_reuse_the_signature(self):
+        with mock.patch.object(LocalStorage, 'signed_url', wraps=LocalStorage().signed_url) as sign:
+            first = self._read_url()
+            second = self._read_url()
+            page = self.client.get(reverse('books')).json()
+
+        self.assertEqual(first, second)
+        self.assertEqual(page['results'][0]['file_url'], first)
+        self.assertEqual(sign.call_count, 1)
+
+
+class BookStreamTests(LocalStorageMixin, AuthenticatedClientMixin, TestCase):
+
+    CONTENT = b'%PDF-1.4 ' + bytes(range(256)) * 64
+
+    def setUp(self):
+        super().setUp()
+        self.cache_root = self.make_temp_dir()
+        self.use_settings(LIBRARY_FILE_CACHE_DIR=self.cache_root)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.book = Book.objects.create(
+                title='Streamed',
+                author='Author',
+                file=SimpleUploadedFile('stream.pdf', self.CONTENT, content_type='application/pdf'),
+            )
+        Borrow.objects.create(user=self.user, book=self.book)
+        self.url = reverse('stream-book', args=[self.book.id])
+
+    def _body(self, response):
+        return b''.join(response.streaming_content)
+
+    def test_whole_file_advertises_ranges(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertEqual(self._body(response), self.CONTENT)
+
+    def test_byte_ranges(self):
+        size = len(self.CONTENT)
+
+        response = self.client.get(self.url, HTTP_RANGE='bytes=10-19')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f'bytes 10-19/{size}')
+        self.assertEqual(self._body(response), self.CONTENT[10:20])
+
+        response = self.client.get(self.url, HTTP_RANGE='bytes=-5')
+        self.assertEqual(self._body(response), self.CONTENT[-5:])
+
+        response = self.client.get(self.url, HTTP_RANGE=f'bytes={size}-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], f'bytes */{size}')
+
+    def test_if_range_and_etag(self):
+        etag = self.client.get(self.url)['ETag']
+
+        response = self.client.get(self.url, HTTP_RANGE='bytes=0-3', HTTP_IF_RANGE=etag)
+        self.assertEqual(response.status_code, 206)
+
+        response = self.client.get(self.url, HTTP_RANGE='bytes=0-3', HTTP_IF_RANGE='"stale"')
+        self.assertEqual(response.status_code, 200)
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_responses_stream_for_wsgi(self):
+        # Sync bodies: WSGI sends ranges chunk by chunk and hands whole files
+        # to its file_wrapper, where ASGI would buffer both in memory
+        with mock.patch('library.ranges.RANGE_CHUNK_SIZE', 100):
+            response = self.client.get(self.url, HTTP_RANGE='bytes=0-999')
+            self.assertFalse(response.is_async)
+            chunks = iter(response.streaming_content)
+            self.assertEqual(next(chunks), self.CONTENT[:100])
+            self.assertEqual(b''.join(chunks), self.CONTENT[100:1000])
+
+        response = self.client.get(self.url)
+        self.assertFalse(response.is_async)
+        self.assertIsInstance(response, FileResponse)
+        response.close()
+        with self.assertRaises(NoReverseMatch):
+            reverse('stream-book', args=[self.book.id], urlconf='simpleAuthentication.events_urls')
+
+    def test_requires_active_borrow(self):
+        Borrow.objects.filter(user=self.user).update(returned=True)
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+
+    def test_missing_local_file_is_unavailable(self):
+        LocalStorage().path(str(self.book.file)).unlink()
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 503)
+
+    def test_remote_files_are_cached_and_evicted(self):
+        with mock.patch.object(LocalStorage, 'local_path', return_value=None), \
+                mock.patch.object(LocalStorage, 'download', wraps=LocalStorage().download) as download:
+            self.client.get(self.url, HTTP_RANGE='bytes=0-9')
+            response = self.client.get(self.url, HTTP_RANGE='bytes=20-29')
+            self.assertEqual(self._body(response), self.CONTENT[20:30])
+            self.assertEqual(download.call_count, 1)
+
+            # A budget smaller than two files keeps only the newest one
+            with override_settings(LIBRARY_FILE_CACHE_MAX_BYTES=len(self.CONTENT) + 1):
+                old = Path(self.cache_root) / 'old.pdf'
+                old.write_bytes(self.CONTENT)
+                os.utime(old, (0, 0))
+                evict_file_cache()
+
+        self.assertFalse(old.exists())
+        self.assertEqual(len(list(Path(self.cache_root).iterdir())), 1)
+
+
+class CoverVariantTests(LocalStorageMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+
+    def _png(self, color='red', size=(800, 1200)):
+        buffer = BytesIO()
+        Image.new('RGBA', size, color).save(buffer, 'PNG')
+        return SimpleUploadedFile('cover.jpg', buffer.getvalue(), content_type='image/jpeg')
+
+    def _create_book(self, **kwargs):
+        with self.captureOnCommitCallbacks(execute=True):
+            book = Book.objects.create(title='Covered', author='Author', photo=self._png(**kwargs))
+        book.refresh_from_db()
+        return book
+
+    def test_variants_are_built_and_exposed(self):
+        book = self._create_book()
+
+        self.assertEqual(len(book.photo_hash), 64)
+        self.assertEqual(
+            sorted((v['width'], v['format']) for v in book.photo_variants),
+            [(w, f) for w in (160, 320, 640) for f in ('jpeg', 'webp')],
+        )
+        with Image.open(Path(self.media_root) / f'book_covers/{book.photo_hash}/160.webp') as thumb:
+            self.assertEqual(thumb.size, (160, 240))
+
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user(username='reader', password='pass12345'))
+        srcset = client.get(reverse('books')).json()['results'][0]['photo_srcset']
+        self.assertIn('160.webp 160w', srcset['webp'])
+        self.assertIn('640.jpeg 640w', srcset['jpeg'])
+
+    def test_real_content_type_is_detected(self):
+        with mock.patch.object(LocalStorage, 'upload', wraps=LocalStorage().upload) as upload:
+            self._create_book()
+
+        self.assertEqual(upload.call_args_list[0].args[2], 'image/png')
+
+    def test_identical_cover_is_not_encoded_again(self):
+        first = self._create_book()
+        with mock.patch('library.covers.render_cover_variants') as render:
+            second = self._create_book()
+
+        render.assert_not_called()
+        self.assertEqual(second.photo_variants, first.photo_variants)
+
+    def test_small_covers_are_not_upscaled(self):
+        book = self._create_book(size=(100, 150))
+        self.assertEqual({v['width'] for v in book.photo_variants}, {100})
+
+
+class ImportBooksCommandTests(LocalStorageMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.source = Path(self.make_temp_dir())
+
+        (self.source / 'a.pdf').write_bytes(b'%PDF-1.4 a')
+        (self.source / 'b.pdf').write_bytes(b'%PDF-1.4 b')
+        Image.new('RGB', (40, 60), 'blue').save(self.source / 'cover.png')
+
+        self.manifest = self.source / 'books.csv'
+        self.manifest.write_text(
+            'title,author,description,file,photo\n'
+            'One,Ann,First,a.pdf,cover.png\n'
+            'Two,Bob,,b.pdf,\n'
+            'Three,Cat,,a.pdf,\n'
+            'Four,Dan,,,\n'
+            'Five,Eve,,missing.pdf,\n'
+        )
+
+    def _import(self, *args):
+        call_command('import_books', str(self.manifest), '--batch-size', '2', *args, stdout=StringIO(), stderr=StringIO())
+
+    def test_imports_rows_and_uploads_each_file_once(self):
+        with mock.patch.object(LocalStorage, 'upload', wraps=LocalStorage().upload) as upload:
+            self._import()
+
+        self.assertEqual(Book.objects.count(), 4)
+        one = Book.objects.get(title='One')
+        self.assertEqual(one.upload_status, UPLOAD_UPLOADED)
+        cover_hash = hashlib.sha256((self.source / 'cover.png').read_bytes()).hexdigest()
+        self.assertEqual(str(one.photo), f'book_photos/{cover_hash}.png')
+        self.assertEqual(str(Book.objects.get(title='Three').file), str(one.file))
+        self.assertEqual(Book.objects.get(title='Four').upload_status, '')
+        # a.pdf, b.pdf and the cover; the second a.pdf is deduplicated
+        self.assertEqual(upload.call_count, 3)
+        self.assertFalse(Path(f'{self.manifest}.checkpoint').exists())
+
+    def test_killed_import_resumes_without_duplicates(self):
+        from library.management.commands.import_books import Command
+
+        original = Command.write_checkpoint
+        calls = []
+
+        def die_on_second(self, *args):
+            calls.append(args)
+            if len(calls) == 2:
+                raise RuntimeError('killed')
+            original(self, *args)
+
+        with mock.patch.object(Command, 'write_checkpoint', die_on_second):
+            with self.assertRaises(RuntimeError):
+                self._import()
+        self.assertEqual(Book.objects.count(), 4)
+
+        self._import()
+        self.assertEqual(
+            sorted(Book.objects.values_list('title', flat=True)),
+            ['Four', 'One', 'Three', 'Two'],
+        )
+
+    def test_covers_with_the_same_name_do_not_overwrite_each_other(self):
+        for folder, color in (('a', 'red'), ('b', 'green')):
+            (self.source / folder).mkdir()
+            Image.new('RGB', (40, 60), color).save(self.source / folder / 'cover.png')
+        self.manifest.write_text(
+            'title,author,description,file,photo\n'
+            'Red,Ann,,,a/cover.png\n'
+            'Green,Bob,,,b/cover.png\n'
+        )
+        self._import()
+
+        red, green = Book.objects.get(title='Red'), Book.objects.get(title='Green')
+        self.assertNotEqual(str(red.photo), str(green.photo))
+        storage = LocalStorage()
+        with Image.open(storage.path(str(red.photo))) as image:
+            self.assertEqual(image.getpixel((0, 0)), (255, 0, 0))
+        with Image.open(storage.path(str(green.photo))) as image:
+            self.assertEqual(image.getpixel((0, 0)), (0, 128, 0))
+
+    def test_malformed_lines_count_as_failed_and_checkpoint_advances(self):
+        self.manifest = self.source / 'books.jsonl'
+        self.manifest.write_text(
+            '{"title": "One", "author": "Ann"}\n'
+            '{"title": "Two", broken\n'
+            '["not", "an", "object"]\n'
+            '{"title": "Four", "author": "Dan"}\n'
+        )
+        stdout = StringIO()
+        call_command('import_books', str(self.manifest), '--batch-size', '2', stdout=stdout, stderr=StringIO())
+
+        self.assertEqual(sorted(Book.objects.values_list('title', flat=True)), ['Four', 'One'])
+        self.assertIn('2 row(s) failed', stdout.getvalue())
+        self.assertFalse(Path(f'{self.manifest}.checkpoint').exists())
+
+
+class BorrowExportTests(TestCase):
+
+    def setUp(self):
+        self.staff = User.objects.create_user(username='staff', password='pass12345', is_staff=True)
+        self.reader = User.objects.create_user(username='reader', password='pass12345')
+        book = Book.objects.create(title='Dune', author='Herbert')
+        other = Book.objects.create(title='Emma', author='Austen')
+        now = timezone.now()
+        Borrow.objects.create(user=self.reader, book=book, borrow_date=now - timedelta(days=40), returned=True)
+        Borrow.objects.create(user=self.reader, book=other, borrow_date=now - timedelta(days=2))
+        self.client = APIClient()
+        self.client.force_authenticate(self.staff)
+
+    def _export(self, **params):
+        response = self.client.get(reverse('borrow-export'), params)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode()
+
+    def test_staff_only(self):
+        client = APIClient()
+        client.force_authenticate(self.reader)
+        self.assertEqual(client.get(reverse('borrow-export')).status_code, 403)
+
+    def test_ndjson_rows_are_joined(self):
+        rows = [json.loads(line) for line in self._export().splitlines()]
+        self.assertEqual([r['title'] for r in rows], ['Dune', 'Emma'])
+        self.assertEqual(rows[0]['username'], 'reader')
+        self.assertTrue(rows[0]['returned'])
+
+    def test_csv_and_date_range(self):
+        since = (timezone.now() - timedelta(days=7)).date().isoformat()
+        lines = self._export(format='csv', **{'from': since}).splitlines()
+        self.assertTrue(lines[0].startswith('id,user_id,username,book_id,title'))
+        self.assertEqual(len(lines), 2)
+        self.assertIn('Emma', lines[1])
+
+    def test_invalid_parameters(self):
+        self.assertEqual(self.client.get(reverse('borrow-export'), {'format': 'xml'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('borrow-export'), {'from': 'yesterday'}).status_code, 400)
+
+    def test_command_matches_endpoint(self):
+        out = StringIO()
+        call_command('export_borrows', stdout=out)
+        self.assertEqual(out.getvalue(), self._export())
+
+    def test_streams_row_chunks_without_buffering(self):
+        # Sync iterator, so WSGI writes each chunk as it is produced (ASGI
+        # would buffer it); the events URLconf doesn't route exports at all
+        with mock.patch('library.exports.EXPORT_FLUSH_BYTES', 1):
+            response = self.client.get(reverse('borrow-export'))
+            self.assertFalse(response.is_async)
+            chunks = iter(response.streaming_content)
+            self.assertEqual(json.loads(next(chunks))['title'], 'Dune')
+            self.assertEqual(json.loads(next(chunks))['title'], 'Emma')
+        with self.assertRaises(NoReverseMatch):
+            reverse('borrow-export', urlconf='simpleAuthentication.events_urls')
+
+
+class BorrowStatsTests(AuthenticatedClientMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.other = User.objects.create_user(username='other', password='pass12345')
+        self.books = [Book.objects.create(title=f'Book {i}', author='Author', total_copies=2) for i in range(3)]
+
+    def _borrow(self, user, book):
+        return borrow_book(user, book.id)
+
+    def test_borrow_and_return_update_rollups(self):
+        self._borrow(self.user, self.books[0])
+        self._borrow(self.other, self.books[0])
+        self._borrow(self.user, self.books[1])
+        Borrow.objects.filter(user=self.user, book=self.books[0]).update(
+            borrow_date=timezone.now() - timedelta(days=20),
+            return_due=timezone.now() - timedelta(days=6),
+        )
+        return_book(self.user, self.books[0].id)
+
+        stats = BookStats.objects.get(book=self.books[0])
+        self.assertEqual((stats.borrows, stats.returns, stats.overdue_returns), (2, 1, 1))
+        self.assertAlmostEqual(stats.loan_seconds / 86400, 20, places=2)
+        self.assertEqual(UserDailyStats.objects.get(user=self.user).borrows, 2)
+
+    def test_rebuild_matches_incremental(self):
+        self._borrow(self.user, self.books[0])
+        self._borrow(self.other, self.books[1])
+        return_book(self.user, self.books[0].id)
+
+        def snapshot():
+            return {
+                'books': sorted(BookStats.objects.values_list('book_id', 'borrows', 'returns', 'overdue_returns')),
+                'book_days': sorted(BookDailyStats.objects.values_list('book_id', 'day', 'borrows', 'returns')),
+                'user_days': sorted(UserDailyStats.objects.values_list('user_id', 'day', 'borrows', 'returns')),
+                'borrow_counts': sorted(Book.objects.values_list('id', 'borrow_count')),
+            }
+
+        incremental = snapshot()
+        call_command('rebuild_borrow_stats', stdout=StringIO())
+        self.assertEqual(snapshot(), incremental)
+
+    def test_sort_popular(self):
+        self._borrow(self.user, self.books[1])
+        self._borrow(self.other, self.books[1])
+        self._borrow(self.user, self.books[2])
+
+        response = self.client.get(reverse('books'), {'sort': 'popular', 'page_size': 2})
+        ids = [b['id'] for b in response.json()['results']]
+        self.assertEqual(ids, [self.books[1].id, self.books[2].id])
+
+        rest = self.client.get(response.json()['next']).json()['results']
+        self.assertEqual([b['id'] for b in rest], [self.books[0].id])
+
+        # Ordered by the indexed column alone, no join to the rollups
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(reverse('books'), {'sort': 'popular', 'page_size': 2, 'v': 2})
+        sql = ' '.join(q['sql'] for q in ctx.captured_queries)
+        self.assertIn('ORDER BY "library_book"."borrow_count" DESC', sql)
+        self.assertNotIn('library_bookstats', sql)
+
+    def test_stats_endpoints_read_only_rollups(self):
+        self._borrow(self.user, self.books[0])
+        return_book(self.user, self.books[0].id)
+
+        with CaptureQueriesContext(connection) as ctx:
+            data = self.client.get(reverse('stats')).json()
+        self.assertFalse(any('"library_borrow"' in q['sql'] for q in ctx.captured_queries))
+        self.assertEqual(data['top_books'][0]['book_id'], self.books[0].id)
+        self.assertEqual(data['top_books'][0]['overdue_rate'], 0)
+        self.assertEqual(data['me']['borrows'], 1)
+
+        report = self.client.get(reverse('book-stats', args=[self.books[0].id])).json()
+        self.assertEqual(report['totals']['returns'], 1)
+        self.assertEqual(len(report['daily']), 1)
+
+
+class ActiveBorrowCountTests(AuthenticatedClientMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.other = User.objects.create_user(username='other', password='pass12345')
+        self.books = [Book.objects.create(title=f'Book {i}', author='Author', total_copies=2) for i in range(3)]
+
+    def counts(self):
+        return [Book.objects.get(pk=b.pk).active_borrow_count for b in self.books]
+
+    def test_borrow_and_return_keep_count(self):
+        borrow_book(self.user, self.books[0].id)
+        borrow_book(self.other, self.books[0].id)
+        bulk_borrow(self.user, [self.books[1].id, self.books[2].id])
+        self.assertEqual(self.counts(), [2, 1, 1])
+        self.assertTrue(Book.objects.get(pk=self.books[0].pk).is_borrowed)
+
+        return_book(self.other, self.books[0].id)
+        bulk_return(self.user, [self.books[0].id, self.books[1].id])
+        self.assertEqual(self.counts(), [0, 0, 1])
+
+    def test_stale_save_does_not_clobber_count(self):
+        stale = Book.objects.get(pk=self.books[0].pk)
+        borrow_book(self.user, self.books[0].id)
+        stale.title = 'Renamed'
+        stale.save()
+        self.assertEqual(self.counts()[0], 1)
+
+    def test_available_filter(self):
+        borrow_book(self.user, self.books[0].id)
+        borrow_book(self.user, self.books[1].id)
+        borrow_book(self.other, self.books[1].id)
+        response = self.client.get(reverse('books'), {'available': '1'})
+        ids = {b['id'] for b in response.json()['results']}
+        self.assertEqual(ids, {self.books[0].id, self.books[2].id})
+
+    def test_reconcile_repairs_drift(self):
+        borrow_book(self.user, self.books[0].id)
+        Book.objects.filter(pk=self.books[0].pk).update(active_borrow_count=5)
+        Book.objects.filter(pk=self.books[1].pk).update(active_borrow_count=2)
+
+        out = StringIO()
+        call_command('reconcile_availability', '--dry-run', stdout=out)
+        self.assertIn('2 book(s) drifted', out.getvalue())
+        self.assertEqual(self.counts(), [5, 2, 0])
+
+        call_command('reconcile_availability', stdout=StringIO())
+        self.assertEqual(self.counts(), [1, 0, 0])
+
+    def test_reconcile_repairs_borrow_counters(self):
+        for book in self.books:
+            borrow_book(self.user, book.id)
+        extra = Book.objects.create(title='Extra', author='Author')
+        # Closed in the admin: a plain save, no counter bookkeeping
+        borrow = Borrow.objects.get(user=self.user, book=self.books[0])
+        borrow.returned = True
+        borrow.save()
+        with self.assertRaises(BorrowError):
+            borrow_book(self.user, extra.id)
+
+        out = StringIO()
+        call_command('reconcile_availability', '--dry-run', stdout=out)
+        self.assertIn(f'user {self.user.id}: stored 3, actual 2', out.getvalue())
+
+        call_command('reconcile_availability', stdout=StringIO())
+        self.assertEqual(BorrowCounter.objects.get(user=self.user).active_borrows, 2)
+        borrow_book(self.user, extra.id)
+
+
+class BookCopyTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.users = [User.objects.create_user(username=f'reader{i}', password='pass12345') for i in range(3)]
+        self.book = Book.objects.create(title='Bestseller', author='Author', total_copies=2)
+        self.client = APIClient()
+
+    def _borrow(self, user):
+        self.client.force_authenticate(user)
+        return self.client.post(reverse('borrow-book', args=[self.book.id]))
+
+    def test_last_copy_and_return(self):
+        self.assertEqual(self._borrow(self.users[0]).status_code, 201)
+        self.assertEqual(self._borrow(self.users[1]).status_code, 201)
+
+        response = self._borrow(self.users[2])
+        self.assertEqual(response.status_code, 409)
+        self.assertFalse(Borrow.objects.filter(user=self.users[2]).exists())
+        self.assertFalse(BorrowCounter.objects.filter(user=self.users[2], active_borrows__gt=0).exists())
+
+        return_book(self.users[0], self.book.id)
+        self.assertEqual(Book.objects.get(pk=self.book.pk).available_copies, 1)
+        self.assertEqual(self._borrow(self.users[2]).status_code, 201)
+
+    def test_bulk_borrow_reports_missing_stock(self):
+        other = Book.objects.create(title='Other', author='Author')
+        borrow_book(self.users[0], self.book.id)
+        borrow_book(self.users[1], self.book.id)
+
+        results = bulk_borrow(self.users[2], [self.book.id, other.id])
+        self.assertEqual([r['status'] for r in results], [409, 201])
+        self.assertEqual(Book.objects.get(pk=other.pk).available_copies, 0)
+
+    def test_admin_edits_adjust_stock(self):
+        borrow_book(self.users[0], self.book.id)
+        book = Book.objects.get(pk=self.book.pk)
+        book.total_copies = 5
+        book.save()
+        book = Book.objects.get(pk=self.book.pk)
+        self.assertEqual((book.active_borrow_count, book.available_copies), (1, 4))
+
+
+@override_settings(
+    EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend',
+    LIBRARY_EMAIL_EAGER=True,
+)
+class HoldQueueTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.owner = User.objects.create_user(username='owner', password='pass12345', email='owner@example.com')
+        self.waiters = [
+            User.objects.create_user(username=f'waiter{i}', password='pass12345', email=f'waiter{i}@example.com')
+            for i in range(3)
+        ]
+        self.book = Book.objects.create(title='Bestseller', author='Author')
+        borrow_book(self.owner, self.book.id)
+        self.client = APIClient()
+
+    def _hold(self, user, method='post'):
+        self.client.force_authenticate(user)
+        return getattr(self.client, method)(reverse('book-hold', args=[self.book.id]))
+
+    def test_positions_are_fifo(self):
+        positions = [self._hold(u).json()['position'] for u in self.waiters]
+        self.assertEqual(positions, [1, 2, 3])
+        self.assertEqual(self._hold(self.waiters[0]).status_code, 400)
+
+        self.assertEqual(self._hold(self.waiters[0], 'delete').status_code, 204)
+        self.assertEqual(Hold.objects.get(user=self.waiters[0]).status, HOLD_CANCELLED)
+        self.assertEqual(self._hold(self.waiters[2], 'get').json()['position'], 2)
+        self.assertEqual(self._hold(self.waiters[0], 'get').status_code, 404)
+
+    def test_no_hold_while_a_copy_is_free(self):
+        return_book(self.owner, self.book.id)
+        self.assertEqual(self._hold(self.waiters[0]).status_code, 409)
+        self.assertEqual(self._hold(self.owner).status_code, 409)
+
+    def test_return_promotes_next_holder(self):
+        for user in self.waiters[:2]:
+            self._hold(user)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.force_authenticate(self.owner)
+            response = self.client.post(reverse('return-book', args=[self.book.id]))
+        self.assertEqual(response.status_code, 200)
+
+        first, second = Hold.objects.order_by('position')
+        self.assertEqual((first.status, second.status), (HOLD_FULFILLED, HOLD_WAITING))
+        self.assertTrue(Borrow.objects.filter(user=self.waiters[0], book=self.book, returned=False).exists())
+        self.assertEqual(Book.objects.get(pk=self.book.pk).available_copies, 0)
+        self.assertEqual(BorrowCounter.objects.get(user=self.waiters[0]).active_borrows, 1)
+        self.assertEqual(self._hold(self.waiters[1], 'get').json()['position'], 1)
+        self.assertEqual([m.to for m in mail.outbox], [['waiter0@example.com']])
+
+    def test_holder_at_limit_keeps_place(self):
+        others = [Book.objects.create(title=f'Other {i}', author='Author') for i in range(BORROW_LIMIT)]
+        for other in others:
+            borrow_book(self.waiters[0], other.id)
+        self._hold(self.waiters[0])
+        self._hold(self.waiters[1])
+
+        return_book(self.owner, self.book.id)
+        self.assertEqual(
+            dict(Hold.objects.values_list('user__username', 'status')),
+            {'waiter0': HOLD_WAITING, 'waiter1': HOLD_FULFILLED},
+        )
+
+    def _fill_slots(self, user):
+        others = [Book.objects.create(title=f'{user.username} other {i}', author='Author') for i in range(BORROW_LIMIT)]
+        for other in others:
+            borrow_book(user, other.id)
+        return others
+
+    def test_walk_in_cannot_jump_the_queue(self):
+        self._fill_slots(self.waiters[0])
+        self._hold(self.waiters[0])
+        return_book(self.owner, self.book.id)
+        # Passed over: the only holder is at the limit
+        self.assertEqual(Book.objects.get(pk=self.book.pk).available_copies, 1)
+
+        with self.assertRaises(BorrowError) as ctx:
+            borrow_book(self.waiters[1], self.book.id)
+        self.assertEqual(ctx.exception.status_code, 409)
+        results = bulk_borrow(self.waiters[1], [self.book.id])
+        self.assertEqual(results[0]['status'], 409)
+        # ...but may join it
+        self.assertEqual(self._hold(self.waiters[1]).status_code, 201)
+
+    def test_freed_slot_gets_the_passed_over_copy(self):
+        others = self._fill_slots(self.waiters[0])
+        self._hold(self.waiters[0])
+        return_book(self.owner, self.book.id)
+
+        return_book(self.waiters[0], others[0].id)
+        self.assertEqual(Hold.objects.get(user=self.waiters[0]).status, HOLD_FULFILLED)
+        self.assertTrue(Borrow.objects.filter(user=self.waiters[0], book=self.book, returned=False).exists())
+        self.assertEqual(Book.objects.get(pk=self.book.pk).available_copies, 0)
+
+    def test_first_holder_with_a_slot_may_borrow_directly(self):
+        self._fill_slots(self.waiters[0])
+        self._hold(self.waiters[0])
+        self._hold(self.waiters[1])
+        self._hold(self.waiters[2])
+        # Hand the copy back outside the return flow, as if promotion missed it
+        Book.objects.filter(pk=self.book.pk).update(active_borrow_count=0)
+
+        with self.assertRaises(BorrowError):
+            borrow_book(self.waiters[2], self.book.id)
+        borrow_book(self.waiters[1], self.book.id)
+        self.assertEqual(Hold.objects.get(user=self.waiters[1]).status, HOLD_FULFILLED)
+
+    def test_cancel_offers_a_free_copy_to_the_next_holder(self):
+        self._fill_slots(self.waiters[0])
+        self._hold(self.waiters[0])
+        self._hold(self.waiters[1])
+        Book.objects.filter(pk=self.book.pk).update(active_borrow_count=0)
+
+        self._hold(self.waiters[0], 'delete')
+        self.assertEqual(Hold.objects.get(user=self.waiters[1]).status, HOLD_FULFILLED)
+
+    def test_bulk_return_promotes(self):
+        self._hold(self.waiters[0])
+        bulk_return(self.owner, [self.book.id])
+        self.assertEqual(Hold.objects.get().status, HOLD_FULFILLED)
+
+    def test_head_of_queue_uses_position_index(self):
+        # Promotion reads only the head of the queue, however long it is
+        User.objects.bulk_create([User(username=f'bulk{i}') for i in range(200)])
+        Hold.objects.bulk_create(
+            Hold(user=user, book=self.book, position=i + 1)
+            for i, user in enumerate(User.objects.filter(username__startswith='bulk'))
+        )
+        with CaptureQueriesContext(connection) as ctx:
+            return_book(self.owner, self.book.id)
+        hold_reads = [q['sql'] for q in ctx.captured_queries if 'FROM "library_hold"' in q['sql']]
+        self.assertTrue(all('LIMIT' in sql for sql in hold_reads))
+        self.assertEqual(Hold.objects.filter(status=HOLD_FULFILLED).count(), 1)
+
+
+class AvailabilityEventsTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='reader', password='pass12345')
+        self.book = Book.objects.create(title='Bestseller', author='Author', total_copies=2)
+        response = APIClient().post(reverse('token_obtain_pair'), {'username': 'reader', 'password': 'pass12345'})
+        self.token = response.json()['access']
+        self.url = reverse('availability-events')
+
+    def test_deltas_are_coalesced_per_book(self):
+        async def scenario():
+            broker = InProcessBroker()
+            subscription = broker.subscribe()
+            publisher = threading.Thread(target=lambda: [
+                broker.publish({'book_id': book_id, 'available': n, 'total': 3})
+                for n in range(3) for book_id in (1, 2)
+            ])
+            publisher.start()
+            publisher.join()
+            batch = await subscription.next_batch(1)
+            idle = await subscription.next_batch(0.01)
+            broker.unsubscribe(subscription)
+            return batch, idle, broker.has_audience()
+
+        batch, idle, audience = asyncio.run(scenario())
+        self.assertEqual(sorted((e['book_id'], e['available']) for e in batch), [(1, 2), (2, 2)])
+        self.assertEqual(idle, [])
+        self.assertFalse(audience)
+
+    def test_borrow_publishes_after_commit(self):
+        broker = get_broker()
+        with mock.patch.object(broker, 'has_audience', return_value=True), \
+                mock.patch.object(broker, 'publish') as publish:
+            with self.captureOnCommitCallbacks(execute=False) as callbacks:
+                borrow_book(self.user, self.book.id)
+            publish.assert_not_called()
+
+            for callback in callbacks:
+                callback()
+        publish.assert_called_once_with({'book_id': self.book.id, 'available': 1, 'total': 2})
+
+    def test_needs_asgi_and_a_token(self):
+        self.assertEqual(self.client.get(self.url).status_code, 503)
+
+        async def unauthenticated():
+            return await self.async_client.get(self.url, {'token': 'nope'})
+
+        self.assertEqual(asyncio.run(unauthenticated()).status_code, 401)
+
+    async def test_stream_delivers_deltas(self):
+        response = await self.async_client.get(self.url, headers={'Authorization': f'Bearer {self.token}'})
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        chunks = aiter(response.streaming_content)
+        self.assertTrue((await anext(chunks)).startswith(b'retry:'))
+
+        # The stream subscribes when it starts; publish as a commit would
+        pending = asyncio.ensure_future(anext(chunks))
+        await asyncio.sleep(0)
+        get_broker().publish({'book_id': self.book.id, 'available': 1, 'total': 2})
+        chunk = await asyncio.wait_for(pending, 5)
+
+        self.assertTrue(chunk.startswith(b'event: availability\n'))
+        self.assertIn(f'"book_id":{self.book.id},"available":1'.encode(), chunk)
+        # A client disconnect cancels the pending read, like the ASGI handler does
+        pending = asyncio.ensure_future(anext(chunks))
+        await asyncio.sleep(0)
+        pending.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await pending
+        self.assertFalse(get_broker().has_audience())
+
+    async def test_stream_ends_when_the_token_expires(self):
+        token = StrictTokenObtainPairSerializer.get_token(self.user).access_token
+        token.set_exp(lifetime=timedelta(seconds=1))
+        # EventSource can't set headers, so this view alone takes ?token=
+        response = await self.async_client.get(self.url, {'token': str(token)})
+
+        chunks = [chunk async for chunk in response.streaming_content]
+        self.assertTrue(chunks[0].startswith(b'retry:'))
+        self.assertTrue(chunks[-1].startswith(b'event: expired\n'))
+        self.assertFalse(get_broker().has_audience())
+
+
+class AsyncReadViewTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='reader', password='pass12345')
+        self.books = [Book.objects.create(title=f'Book {i}', author='Author') for i in range(3)]
+        Book.objects.filter(pk=self.books[0].pk).update(file='https://example.com/book.pdf')
+        borrow_book(self.user, self.books[0].id)
+        borrow_book(self.user, self.books[2].id)
+
+        response = APIClient().post(reverse('token_obtain_pair'), {'username': 'reader', 'password': 'pass12345'})
+        self.headers = {'Authorization': f"Bearer {response.json()['access']}"}
+        self.factory = AsyncRequestFactory()
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=self.headers['Authorization'])
+
+    async def call(self, view, path, headers=None, **kwargs):
+        request = self.factory.get(path, headers={**self.headers, **(headers or {})})
+        return await view.as_view()(request, **kwargs)
+
+    async def test_book_list_matches_sync_view(self):
+        url = reverse('books') + '?page_size=2'
+        # A miss is built by the sync view; the next call is served from cache
+        miss = await self.call(AsyncBookListView, url)
+        miss.render()
+        hit = await self.call(AsyncBookListView, url)
+        expected = await sync_to_async(self.client.get)(url)
+
+        self.assertEqual(json.loads(miss.content), expected.json())
+        self.assertEqual(json.loads(hit.content), expected.json())
+        self.assertEqual(hit['ETag'], expected['ETag'])
+        self.assertEqual((await self.call(AsyncBookListView, url, {'If-None-Match': hit['ETag']})).status_code, 304)
+
+    async def test_borrowed_books_match_sync_view(self):
+        url = reverse('borrowed-books')
+        response = await self.call(AsyncBorrowedBooksView, url)
+        expected = await sync_to_async(self.client.get)(url)
+        self.assertEqual(json.loads(response.content), expected.json())
+        self.assertEqual(len(expected.json()), 2)
+
+    async def test_read_book(self):
+        def read(book):
+            return self.call(AsyncReadBookView, reverse('read-book', args=[book.id]), book_id=book.id)
+
+        response = await read(self.books[0])
+        self.assertEqual(json.loads(response.content), {'url': 'https://example.com/book.pdf'})
+        self.assertEqual((await read(self.books[1])).status_code, 403)
+        self.assertEqual((await read(self.books[2])).status_code, 404)
+        self.assertEqual(
+            (await self.call(AsyncReadBookView, '/api/books/999999/read/', book_id=999999)).status_code,
+            404,
+        )
+
+    async def test_requires_token(self):
+        request = self.factory.get(reverse('borrowed-books'))
+        self.assertEqual((await AsyncBorrowedBooksView.as_view()(request)).status_code, 401)
+
+    async def test_query_token_is_rejected(self):
+        token = self.headers['Authorization'].split()[1]
+        request = self.factory.get(reverse('books'), {'token': token})
+        self.assertEqual((await AsyncBookListView.as_view()(request)).status_code, 401)
+
+    def test_routes_are_selectable(self):
+        with override_settings(LIBRARY_ASYNC_ROUTES=['books']):
+            self.assertIs(route_view('books', BookListView, AsyncBookListView).view_class, AsyncBookListView)
+        self.assertIs(route_view('books', BookListView, AsyncBookListView).view_class, BookListView)
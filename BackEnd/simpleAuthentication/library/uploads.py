@@ -0,0 +1,181 @@
+# uploads.py
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from .storage import get_storage_backend
+
+logger = logging.getLogger(__name__)
+
+# ─────────────────────────────────────────────
+# BACKGROUND UPLOAD PIPELINE
+# ─────────────────────────────────────────────
+# Book.save() only hashes new files. Once the transaction commits they
+# are spooled to local disk chunk by chunk, and the actual upload to the
+# storage backend runs on a small thread pool with retry and exponential
+# backoff; the outcome is recorded in Book.upload_status. A save that
+# rolls back never spools anything, so nothing is left on disk.
+
+UPLOAD_ATTEMPTS = 4
+UPLOAD_BACKOFF_SECONDS = 1.0
+
+_executor = None
+_executor_lock = threading.Lock()
+_pending = set()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, "LIBRARY_UPLOAD_WORKERS", 2),
+                thread_name_prefix="book-upload",
+            )
+        return _executor
+
+
+def hash_upload(field_file) -> str:
+    """SHA-256 of an uploaded file, read in chunks."""
+    digest = hashlib.sha256()
+    for chunk in field_file.chunks():
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+def spool_upload(field_file) -> str:
+    """
+    Copy an uploaded file to a temp file in chunks and return its path.
+    Never reads the whole file into memory; a partial copy is removed.
+    """
+    spool_dir = getattr(settings, "LIBRARY_UPLOAD_SPOOL_DIR", None)
+    fd, tmp_path = tempfile.mkstemp(prefix="book-upload-", dir=spool_dir)
+    try:
+        with os.fdopen(fd, "wb") as out:
+            for chunk in field_file.chunks():
+                out.write(chunk)
+    except BaseException:
+        _remove_spooled([tmp_path])
+        raise
+    return tmp_path
+
+
+def _remove_spooled(paths):
+    for path in paths:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def _spool_book_upload(book_id, uploads):
+    """Spooled copies of uploads, or None (recorded on the book) on failure."""
+    from .models import Book, UPLOAD_FAILED
+
+    spooled = []
+    try:
+        for storage_path, source, content_type, content_addressed in uploads:
+            spooled.append((storage_path, spool_upload(source), content_type, content_addressed))
+    except Exception as e:
+        logger.exception(f"Spooling failed for book {book_id}: {e}")
+        _remove_spooled([local_path for _, local_path, _, _ in spooled])
+        Book.objects.filter(pk=book_id).update(upload_status=UPLOAD_FAILED, upload_error=str(e)[:1000])
+        return None
+    return spooled
+
+
+def schedule_book_upload(book_id: int, uploads: list[tuple[str, object, str, bool]], cover: str | None = None):
+    """
+    Upload (storage path, uploaded file, content type, content addressed)
+    tuples for a book once the surrounding transaction commits. Content
+    addressed paths are immutable, so they are skipped when the object
+    already exists. cover is the storage path of a new cover photo to
+    build resized variants from.
+    """
+    eager = getattr(settings, "LIBRARY_UPLOADS_EAGER", False)
+
+    def start():
+        # Spooled in the request thread: the uploaded files only live as
+        # long as the request
+        spooled = _spool_book_upload(book_id, uploads)
+        if spooled is None:
+            return
+        cover_path = next((local for path, local, _, _ in spooled if path == cover), None)
+
+        if eager:
+            run_book_upload(book_id, spooled, cover_path)
+            return
+        future = _get_executor().submit(_run_in_worker, book_id, spooled, cover_path)
+        _pending.add(future)
+        future.add_done_callback(_pending.discard)
+
+    transaction.on_commit(start)
+
+
+def wait_for_pending_uploads(timeout: float | None = None):
+    """Block until every scheduled upload has finished."""
+    wait(list(_pending), timeout=timeout)
+
+
+def upload_with_retry(storage_path, local_path, content_type, content_addressed=False):
+    backend = get_storage_backend()
+    delay = UPLOAD_BACKOFF_SECONDS
+
+    for attempt in range(1, UPLOAD_ATTEMPTS + 1):
+        try:
+            if content_addressed and backend.exists(storage_path):
+                logger.info(f"{storage_path} already stored; skipping upload")
+                return
+            backend.upload(storage_path, local_path, content_type)
+            return
+        except Exception as e:
+            if attempt == UPLOAD_ATTEMPTS:
+                raise
+            logger.warning(f"Upload attempt {attempt} failed for {storage_path}: {e}; retrying in {delay:.0f}s")
+            time.sleep(delay)
+            delay *= 2
+
+
+def _run_in_worker(book_id, uploads, cover=None):
+    try:
+        run_book_upload(book_id, uploads, cover)
+    finally:
+        # Worker threads get their own DB connection; don't leak it
+        connection.close()
+
+
+def _build_cover_variants(book_id, cover):
+    # Pillow is only imported by the workers that actually resize covers
+    from .covers import build_cover_variants
+
+    try:
+        build_cover_variants(book_id, cover)
+    except Exception as e:
+        # The original is stored; clients fall back to photo_url
+        logger.exception(f"Cover variants failed for book {book_id}: {e}")
+
+
+def run_book_upload(book_id, uploads, cover=None):
+    from .models import Book, UPLOAD_FAILED, UPLOAD_UPLOADED
+
+    try:
+        for storage_path, local_path, content_type, content_addressed in uploads:
+            upload_with_retry(storage_path, local_path, content_type, content_addressed)
+    except Exception as e:
+        logger.exception(f"Upload failed for book {book_id}: {e}")
+        Book.objects.filter(pk=book_id).update(upload_status=UPLOAD_FAILED, upload_error=str(e)[:1000])
+    else:
+        logger.info(f"Uploaded {len(uploads)} file(s) for book {book_id}")
+        Book.objects.filter(pk=book_id).update(upload_status=UPLOAD_UPLOADED, upload_error="")
+
+        if cover:
+            _build_cover_variants(book_id, cover)
+    finally:
+        _remove_spooled([local_path for _, local_path, _, _ in uploads])
@@ -2,21 +2,42 @@
 import threading
 import logging
 import uuid
-from django.core.mail import send_mail
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.core.mail import EmailMultiAlternatives, get_connection
 from django.conf import settings
-from supabase import create_client
+from django.db import connection, transaction
+from django.utils import timezone
 
-logger = logging.getLogger(__name__)
+from .models import EmailOutbox, OUTBOX_FAILED, OUTBOX_PENDING, OUTBOX_SENT
 
-# Initialize Supabase client
-supabase = create_client(
-    settings.SUPABASE_URL,
-    settings.SUPABASE_KEY
-)
+from .storage import BUCKET, get_supabase_client
+
+logger = logging.getLogger(__name__)
 
 # ─────────────────────────────────────────────
 # EMAIL SENDER
 # ─────────────────────────────────────────────
+# Emails go through a database outbox: send_email_async only inserts a
+# row, inside whatever transaction the caller has open, so a crash or
+# restart can't lose a message. After commit a single background worker
+# drains the outbox in batches, then sleeps until the next retry is due;
+# `manage.py drain_email_outbox` runs the same loop as a standalone
+# process and picks up whatever a restarted web worker left behind.
+# A batch is claimed by pushing next_attempt_at out by a lease in a short
+# transaction, and sent outside it: no row locks are held during SMTP,
+# and rows of a sender that dies mid-batch come due again after the lease.
+
+OUTBOX_BATCH_SIZE = 50
+OUTBOX_MAX_ATTEMPTS = 5
+OUTBOX_LEASE = timedelta(minutes=10)
+
+_outbox_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="email-outbox")
+_outbox_lock = threading.Lock()
+_outbox_wakeup = threading.Event()
+_outbox_running = False
+
 
 def send_email_async(
     subject: str,
@@ -26,8 +47,8 @@ def send_email_async(
     from_email: str | None = None,
 ):
     """
-    Send email asynchronously using Django's send_mail.
-    Works with Resend via Anymail.
+    Queue an email in the outbox; it is sent once the current
+    transaction commits. Works with Resend via Anymail.
     """
     from_email = from_email or settings.DEFAULT_FROM_EMAIL
 
@@ -35,22 +56,149 @@ def send_email_async(
         logger.error("No from_email provided and DEFAULT_FROM_EMAIL not set")
         return
 
-    def _send():
-        try:
-            send_mail(
-                subject=subject,
-                message=message,
-                html_message=html_message,
-                from_email=from_email,
-                recipient_list=recipient_list,
-                fail_silently=False,
-            )
-            logger.info(f"Email sent: {subject} to {recipient_list}")
-        except Exception as e:
-            logger.exception(f"Email failed: {subject} to {recipient_list} - {e}")
+    EmailOutbox.objects.create(
+        subject=subject,
+        message=message,
+        html_message=html_message,
+        from_email=from_email,
+        recipient_list=list(recipient_list),
+    )
+    transaction.on_commit(wake_outbox_worker)
+
+
+def wake_outbox_worker():
+    if getattr(settings, "LIBRARY_EMAIL_EAGER", False):
+        drain_outbox()
+        return
+
+    global _outbox_running
+    with _outbox_lock:
+        _outbox_wakeup.set()
+        if _outbox_running:
+            return
+        _outbox_running = True
+    _outbox_executor.submit(_outbox_worker)
+
+
+def _outbox_worker():
+    global _outbox_running
+    try:
+        while True:
+            _outbox_wakeup.clear()
+            delay = None
+            try:
+                while drain_outbox():
+                    pass
+                delay = next_outbox_delay()
+            except Exception as e:
+                logger.exception(f"Email outbox drain failed: {e}")
+
+            with _outbox_lock:
+                # Rows committed while we were draining set the event again
+                if delay is None and not _outbox_wakeup.is_set():
+                    _outbox_running = False
+                    return
+
+            # Sleep until a retry is due, or until a new email is queued
+            connection.close()
+            _outbox_wakeup.wait(delay)
+    finally:
+        connection.close()
+
+
+def next_outbox_delay() -> float | None:
+    """Seconds until the next pending email is due, or None if none is."""
+    next_at = (
+        EmailOutbox.objects
+        .filter(status=OUTBOX_PENDING)
+        .order_by('next_attempt_at')
+        .values_list('next_attempt_at', flat=True)
+        .first()
+    )
+    if next_at is None:
+        return None
+    return max((next_at - timezone.now()).total_seconds(), 0)
+
+
+def drain_outbox(batch_size: int = OUTBOX_BATCH_SIZE) -> int:
+    """
+    Send one batch of due emails over a single connection.
+    Returns how many rows were processed.
+    """
+    now = timezone.now()
+
+    with transaction.atomic():
+        # skip_locked lets several drainers share the table safely
+        batch = list(
+            EmailOutbox.objects
+            .select_for_update(skip_locked=True)
+            .filter(status=OUTBOX_PENDING, next_attempt_at__lte=now)
+            .order_by('next_attempt_at', 'id')[:batch_size]
+        )
+        if not batch:
+            return 0
+
+        # Claim: other drainers skip these rows until the lease runs out
+        EmailOutbox.objects.filter(pk__in=[item.pk for item in batch]).update(next_attempt_at=now + OUTBOX_LEASE)
+
+    try:
+        mail_connection = get_connection(fail_silently=False)
+        mail_connection.open()
+    except Exception as e:
+        # No connection, nothing sent: still an attempt for every claimed
+        # row, so a broken mail server can't retry them forever
+        for item in batch:
+            item.attempts += 1
+            _record_failure(item, e)
+            _save_attempt(item)
+        return len(batch)
+
+    try:
+        for item in batch:
+            _deliver(item, mail_connection)
+    finally:
+        mail_connection.close()
+
+    return len(batch)
+
+
+def _deliver(item, mail_connection):
+    email = EmailMultiAlternatives(
+        subject=item.subject,
+        body=item.message,
+        from_email=item.from_email,
+        to=item.recipient_list,
+        connection=mail_connection,
+    )
+    if item.html_message:
+        email.attach_alternative(item.html_message, "text/html")
+
+    item.attempts += 1
+    try:
+        email.send()
+    except Exception as e:
+        _record_failure(item, e)
+    else:
+        item.status = OUTBOX_SENT
+        item.sent_at = timezone.now()
+        logger.info(f"Email sent: {item.subject} to {item.recipient_list}")
+
+    _save_attempt(item)
+
+
+def _record_failure(item, error):
+    """Back off, or give up once the row is out of attempts."""
+    item.last_error = str(error)[:1000]
+    if item.attempts >= OUTBOX_MAX_ATTEMPTS:
+        item.status = OUTBOX_FAILED
+        logger.exception(f"Email failed permanently: {item.subject} to {item.recipient_list} - {error}")
+    else:
+        item.next_attempt_at = timezone.now() + timedelta(minutes=2 ** item.attempts)
+        logger.warning(f"Email failed, will retry: {item.subject} to {item.recipient_list} - {error}")
+
 
-    thread = threading.Thread(target=_send, daemon=True)
-    thread.start()
+def _save_attempt(item):
+    item.save(update_fields=['attempts', 'status', 'sent_at', 'next_attempt_at', 'last_error'])
 
 
 # ─────────────────────────────────────────────
@@ -65,7 +213,7 @@ def upload_file(file):
     filename = f"{uuid.uuid4()}_{file.name}"
 
     # Upload file
-    supabase.storage.from_("media").upload(
+    get_supabase_client().storage.from_(BUCKET).upload(
         filename,
         file.read(),
         {"content-type": file.content_type}
@@ -1,32 +1,67 @@
 # views.py
 from datetime import timedelta
 import random
+import re
 
 from django.contrib.auth.models import User
 from django.contrib.auth.password_validation import validate_password
 from django.core.exceptions import ValidationError
 from django.db import transaction
-from django.http import FileResponse, HttpResponseForbidden
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db.models import Count, F, Q
+from django.http import FileResponse, HttpResponseForbidden, StreamingHttpResponse
 from django.shortcuts import get_object_or_404 , redirect
 from django.utils import timezone
 from django.utils.encoding import smart_str
+from django.utils.http import http_date, parse_etags
 from django.utils.decorators import method_decorator
 from django.views.decorators.csrf import csrf_exempt
 
 import requests
 from rest_framework import status, serializers
 from rest_framework.generics import ListAPIView
-from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.permissions import AllowAny, IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 from rest_framework_simplejwt.views import TokenObtainPairView
-from rest_framework_simplejwt.tokens import RefreshToken
 
 from django.conf import settings
+from .authentication import CachedJWTAuthentication, StatelessJWTAuthentication
+from .borrowing import (
+    BorrowError,
+    borrow_book,
+    bulk_borrow,
+    bulk_return,
+    cancel_hold,
+    get_hold,
+    place_hold,
+    queue_position,
+    return_book,
+)
+from .cache import (
+    catalogue_etag,
+    catalogue_page_key,
+    get_catalogue_modified,
+    get_catalogue_page,
+    get_catalogue_version,
+    set_catalogue_page,
+)
+from .exports import EXPORT_FORMATS, export_rows, parse_export_bound, stream_export
+from .file_access import get_file_url, get_file_urls
+from .file_cache import get_local_file
 from .utils import send_email_async
 from .models import Book, Borrow, EmailVerificationCode
-from .serializers import BookSerializer, BorrowSerializer
+from .pagination import (
+    BookCursorPagination,
+    BookSearchPagination,
+    OverdueCursorPagination,
+    PopularCursorPagination,
+)
+from .ranges import ranged_file_response
+from .stats import book_report, top_books, user_window
+from .storage import LocalStorage, get_storage_backend
+from .serializers import BookSerializer, BorrowSerializer, BulkBorrowSerializer, OverdueBorrowSerializer
 from .throttles import OTPThrottle
 
 from django.shortcuts import redirect
@@ -45,7 +80,7 @@ def google_login_redirect(request):
     # User authenticated successfully
     if user.is_authenticated:
 
-        refresh = RefreshToken.for_user(user)
+        refresh = StrictTokenObtainPairSerializer.get_token(user)
 
         access_token = str(refresh.access_token)
         refresh_token = str(refresh)
@@ -63,6 +98,17 @@ def google_login_redirect(request):
 # ──────────────────────────────────────────────────────────────
 class StrictTokenObtainPairSerializer(TokenObtainPairSerializer):
 
+    @classmethod
+    def get_token(cls, user):
+        token = super().get_token(user)
+
+        # Lets StatelessJWTAuthentication build request.user without a query
+        token['username'] = user.username
+        token['is_staff'] = user.is_staff
+        token['is_active'] = user.is_active
+
+        return token
+
     def validate(self, attrs):
 
         username = attrs.get("username")
@@ -91,75 +137,261 @@ class BorrowBookView(APIView):
     permission_classes = [IsAuthenticated]
 
     def post(self, request, book_id):
-        user = request.user
-        book = get_object_or_404(Book, id=book_id)
+        try:
+            borrow = borrow_book(request.user, book_id)
+        except BorrowError as e:
+            return Response({'error': e.message}, status=e.status_code)
 
-        if Borrow.objects.filter(user=user, book=book, returned=False).exists():
-            return Response({'error': 'You already borrowed this book.'}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({
+            'message': f'You have borrowed "{borrow.book.title}".',
+            'borrow_date': borrow.borrow_date,
+            'return_due': borrow.return_due
+        }, status=status.HTTP_201_CREATED)
 
-        if Borrow.objects.filter(user=user, returned=False).count() >= 3:
-            return Response({'error': 'Borrow limit reached. Max 3 books.'}, status=status.HTTP_403_FORBIDDEN)
 
-        borrow_date = timezone.now()
-        return_due = borrow_date + timedelta(days=14)
+class ReturnBookView(APIView):
+    permission_classes = [IsAuthenticated]
 
-        Borrow.objects.create(user=user, book=book, borrow_date=borrow_date, return_due=return_due)
+    def post(self, request, book_id):
+        try:
+            borrow = return_book(request.user, book_id)
+        except BorrowError as e:
+            return Response({'error': e.message}, status=e.status_code)
 
         return Response({
-            'message': f'You have borrowed "{book.title}".',
-            'borrow_date': borrow_date,
-            'return_due': return_due
-        }, status=status.HTTP_201_CREATED)
+            'message': f'You have successfully returned "{borrow.book.title}".',
+            'returned_date': borrow.returned_date
+        }, status=status.HTTP_200_OK)
 
 
-class ReturnBookView(APIView):
+class HoldView(APIView):
+    """
+    The caller's place in a book's hold queue. POST joins the queue (only
+    while no copy is free or others already wait), DELETE leaves it. When
+    a copy comes back the first holder gets it borrowed for them and an
+    email.
+    """
     permission_classes = [IsAuthenticated]
 
+    @staticmethod
+    def describe(hold):
+        return {
+            'book_id': hold.book_id,
+            'position': queue_position(hold),
+            'queued_at': hold.created_at,
+        }
+
+    def get(self, request, book_id):
+        try:
+            hold = get_hold(request.user, book_id)
+        except BorrowError as e:
+            return Response({'error': e.message}, status=e.status_code)
+        return Response(self.describe(hold))
+
     def post(self, request, book_id):
-        user = request.user
-        book = get_object_or_404(Book, id=book_id)
-        borrow = Borrow.objects.filter(user=user, book=book, returned=False).first()
+        try:
+            hold = place_hold(request.user, book_id)
+        except BorrowError as e:
+            return Response({'error': e.message}, status=e.status_code)
+        return Response(self.describe(hold), status=status.HTTP_201_CREATED)
+
+    def delete(self, request, book_id):
+        try:
+            cancel_hold(request.user, book_id)
+        except BorrowError as e:
+            return Response({'error': e.message}, status=e.status_code)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class BulkBorrowView(APIView):
+    """
+    Borrow or return several books in one request and one transaction.
+    Body: {"action": "borrow" | "return", "book_ids": [1, 2, 3]}
+    Each book gets its own result with the status the single-book
+    endpoint would have returned.
+    """
+    permission_classes = [IsAuthenticated]
 
-        if not borrow:
-            return Response({'error': 'You have not borrowed this book or it has already been returned'}, status=status.HTTP_400_BAD_REQUEST)
+    def post(self, request):
+        serializer = BulkBorrowSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response({'error': serializer.errors}, status=status.HTTP_400_BAD_REQUEST)
 
-        borrow.returned = True
-        borrow.returned_date = timezone.now()
-        borrow.save()
+        action = serializer.validated_data['action']
+        book_ids = serializer.validated_data['book_ids']
 
-        return Response({
-            'message': f'You have successfully returned "{book.title}".',
-            'returned_date': borrow.returned_date
-        }, status=status.HTTP_200_OK)
+        if action == 'borrow':
+            results = bulk_borrow(request.user, book_ids)
+        else:
+            results = bulk_return(request.user, book_ids)
+
+        return Response({'action': action, 'results': results}, status=status.HTTP_200_OK)
 
 
 class BorrowedBooksView(ListAPIView):
+    authentication_classes = [StatelessJWTAuthentication]
     permission_classes = [IsAuthenticated]
     serializer_class = BorrowSerializer
 
     def get_queryset(self):
-        return Borrow.objects.filter(user=self.request.user, returned=False)
+        return Borrow.objects.filter(user_id=self.request.user.id, returned=False).select_related('book')
 
 
 class BookListView(ListAPIView):
+    """
+    The user independent part of each page is cached under the current
+    catalogue version (bumped by Book signals); the caller's own borrow
+    flags are merged in per request with a single query.
+    """
+    authentication_classes = [StatelessJWTAuthentication]
     permission_classes = [IsAuthenticated]
     serializer_class = BookSerializer
-    queryset = Book.objects.all()
+    pagination_class = BookCursorPagination
+
+    # ?sort= choices and the keyset pagination that implements each
+    SORTS = {
+        'newest': BookCursorPagination,
+        'popular': PopularCursorPagination,
+    }
+    # Popularity and availability move with every borrow, which doesn't
+    # bump the catalogue version, so those pages only live briefly
+    VOLATILE_PAGE_TTL = 5 * 60
+
+    def get_sort(self):
+        if not self.SORTS:
+            return None
+        sort = self.request.query_params.get('sort')
+        return sort if sort in self.SORTS else 'newest'
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        sort = self.get_sort()
+        if sort:
+            self.pagination_class = self.SORTS[sort]
+
+    def get_queryset(self):
+        queryset = Book.objects.all()
+
+        # Served by the partial index on available_copies > 0
+        if self.wants_available():
+            queryset = queryset.filter(available_copies__gt=0)
+
+        # List screens can skip the heavy description text entirely
+        fields = self.get_requested_fields()
+        if fields and 'description' not in fields:
+            queryset = queryset.defer('description')
+        if fields and 'photo_srcset' not in fields:
+            queryset = queryset.defer('photo_variants')
+
+        return queryset
+
+    def wants_available(self):
+        return self.request.query_params.get('available') in ('1', 'true')
+
+    def get_requested_fields(self):
+        raw = self.request.query_params.get('fields')
+        if not raw:
+            return None
+        return [f.strip() for f in raw.split(',') if f.strip()]
 
     def get_serializer_context(self):
         context = super().get_serializer_context()
-        context.update({"request": self.request})
+        context.update({
+            "request": self.request,
+            "fields": self.get_requested_fields(),
+            # Serialize as nobody's borrows; merge_user_state fills them in
+            "borrowed_books": {},
+        })
         return context
 
+    def get_borrowed_books(self):
+        return dict(
+            Borrow.objects
+            .filter(user_id=self.request.user.id, returned=False)
+            .values_list('book_id', 'book__file')
+        )
+
+    def build_catalogue_page(self):
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        if page is None:
+            return self.get_serializer(queryset, many=True).data
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data).data
+
+    def list(self, request, *args, **kwargs):
+        version = get_catalogue_version()
+        page_key = catalogue_page_key(version, request)
+
+        data = get_catalogue_page(page_key)
+        if data is None:
+            data = self.build_catalogue_page()
+            if self.get_sort() == 'popular' or self.wants_available():
+                set_catalogue_page(page_key, data, self.VOLATILE_PAGE_TTL)
+            else:
+                set_catalogue_page(page_key, data)
+
+        borrowed = get_file_urls(request.user.id, self.get_borrowed_books(), request)
+        # Signed URLs are part of the tag, so a re-signed URL is never
+        # hidden behind a 304
+        etag = catalogue_etag(page_key, borrowed)
+
+        if etag in parse_etags(request.headers.get('If-None-Match', '')):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            books = data['results'] if isinstance(data, dict) else data
+            BookSerializer.merge_user_state(books, borrowed)
+            response = Response(data)
+
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(get_catalogue_modified())
+        # Always revalidate; the ETag makes that a cheap 304
+        response['Cache-Control'] = 'private, no-cache'
+        return response
+
+
+class BookSearchView(BookListView):
+    """
+    Ranked full-text search over title, author and description.
+    Every term is prefix matched, so "pyth dja" finds "Python for Django".
+    """
+    pagination_class = BookSearchPagination
+    SORTS = {}
+
+    def get_search_terms(self):
+        query = self.request.query_params.get('q', '')
+        # Keep only word characters so user input can't break the tsquery
+        return re.findall(r'\w+', query)[:10]
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        terms = self.get_search_terms()
+
+        if not terms:
+            return queryset.none()
+
+        query = SearchQuery(
+            ' & '.join(f'{term}:*' for term in terms),
+            search_type='raw',
+            config='english'
+        )
+        return (
+            queryset
+            .filter(search_vector=query)
+            .annotate(rank=SearchRank(F('search_vector'), query))
+            .order_by('-rank', '-id')
+        )
+
 
 class ReadBookView(APIView):
+    authentication_classes = [StatelessJWTAuthentication]
     permission_classes = [IsAuthenticated]
 
     def get(self, request, book_id):
-        book = get_object_or_404(Book, id=book_id)
+        book = get_object_or_404(Book.objects.only('id', 'file'), id=book_id)
 
         if not Borrow.objects.filter(
-            user=request.user,
+            user_id=request.user.id,
             book=book,
             returned=False
         ).exists():
@@ -168,49 +400,212 @@ class ReadBookView(APIView):
         if not book.file:
             return Response({"error": "Book file not available"}, status=404)
 
-        file_path = str(book.file).lstrip("/")
+        file_url = get_file_url(request.user.id, book.id, book.file, request)
+        return Response({"url": file_url})
 
-        # if already full URL
-        if file_path.startswith("http"):
-            file_url = file_path
-        else:
-            file_url = (
-                f"{settings.SUPABASE_URL}"
-                f"/storage/v1/object/public/media/{file_path}"
-            )
-            print("FILE PATH:", file_path)
-            print("SUPABASE FINAL URL:", file_url)
 
-        return Response({"url": file_url})
+class BookStreamView(APIView):
+    """
+    Byte-range access to a borrowed book, so PDF viewers can fetch pages
+    on demand. Served from the local file cache.
+    """
+    authentication_classes = [StatelessJWTAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, book_id):
+        book = get_object_or_404(Book.objects.only('id', 'file'), id=book_id)
+
+        if not Borrow.objects.filter(
+            user_id=request.user.id,
+            book=book,
+            returned=False
+        ).exists():
+            return HttpResponseForbidden("You must borrow this book to read it.")
+
+        if not book.file:
+            return Response({"error": "Book file not available"}, status=404)
+
+        key = str(book.file).lstrip("/")
+        try:
+            local = get_local_file(key)
+        except (OSError, requests.RequestException):
+            return Response({"error": "Book file not available"}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+
+        return ranged_file_response(request, local, key)
+
+
+class SignedFileView(APIView):
+    """
+    Serves files for LocalStorage signed URLs. The signature is the only
+    credential, so no token is required.
+    """
+    authentication_classes = []
+    permission_classes = [AllowAny]
+
+    def get(self, request, path):
+        backend = get_storage_backend()
+        if not isinstance(backend, LocalStorage):
+            return Response(status=status.HTTP_404_NOT_FOUND)
+
+        if not backend.verify(path, request.query_params.get('expires'), request.query_params.get('signature')):
+            return Response({"error": "Link is invalid or has expired."}, status=status.HTTP_403_FORBIDDEN)
 
-class OverdueBooksView(APIView):
+        target = backend.path(path)
+        if not target.is_file():
+            return Response(status=status.HTTP_404_NOT_FOUND)
+
+        return ranged_file_response(request, target, path)
+
+class StatsView(APIView):
+    """
+    Most borrowed books over the last ?days= (default 30) and the
+    caller's own borrowing in that window. Reads only the rollups.
+    """
+    authentication_classes = [StatelessJWTAuthentication]
     permission_classes = [IsAuthenticated]
 
+    def get_window(self, request):
+        try:
+            days = int(request.query_params.get('days', 30))
+        except ValueError:
+            days = 30
+        days = min(max(days, 1), 365)
+        return days, timezone.localdate() - timedelta(days=days - 1)
+
     def get(self, request):
-        now = timezone.now()
+        days, since = self.get_window(request)
+        try:
+            limit = min(max(int(request.query_params.get('limit', 10)), 1), 100)
+        except ValueError:
+            limit = 10
+
+        return Response({
+            'window_days': days,
+            'top_books': top_books(since, limit),
+            'me': user_window(request.user.id, since),
+        })
+
+
+class BookStatsView(StatsView):
+    """All-time totals for one book plus its daily series for ?days=."""
+
+    def get(self, request, book_id):
+        if not Book.objects.filter(id=book_id).exists():
+            return Response({"error": "Book not found"}, status=status.HTTP_404_NOT_FOUND)
+
+        days, since = self.get_window(request)
+        return Response({'book_id': book_id, 'window_days': days, **book_report(book_id, since)})
+
+
+class BorrowExportView(APIView):
+    """
+    Staff only: stream borrow history joined to book and user as NDJSON
+    (default) or CSV. ?from= / ?to= bound borrow_date, [from, to).
+    """
+    permission_classes = [IsAdminUser]
 
+    def perform_content_negotiation(self, request, force=False):
+        # ?format= picks the export format, not a DRF renderer
+        return super().perform_content_negotiation(request, force=True)
+
+    def get(self, request):
+        fmt = request.query_params.get('format', 'ndjson')
+        if fmt not in EXPORT_FORMATS:
+            return Response({"error": f"format must be one of {', '.join(EXPORT_FORMATS)}"}, status=400)
+
+        try:
+            start = parse_export_bound(request.query_params.get('from'), 'from')
+            end = parse_export_bound(request.query_params.get('to'), 'to')
+        except ValueError as e:
+            return Response({"error": str(e)}, status=400)
+
+        response = StreamingHttpResponse(
+            stream_export(fmt, export_rows(start, end)),
+            content_type=EXPORT_FORMATS[fmt],
+        )
+        filename = f"borrows-{timezone.now():%Y%m%d-%H%M%S}.{fmt}"
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+
+
+class OverdueBooksView(ListAPIView):
+    """
+    Paginated overdue borrows as flat rows (one joined query per page).
+    ?summary=1 returns days-overdue buckets and the top per-user counts
+    instead: one aggregate query and one limited grouped query.
+    """
+    authentication_classes = [CachedJWTAuthentication]
+    permission_classes = [IsAuthenticated]
+    serializer_class = OverdueBorrowSerializer
+    pagination_class = OverdueCursorPagination
+
+    SUMMARY_TOP_USERS = 100
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        self.now = timezone.now()
+
+    def get_overdue(self):
         overdue = Borrow.objects.filter(
             returned=False,
-            return_due__lt=now
+            return_due__lt=self.now
         )
 
         # Normal users only see their books
-        if not request.user.is_staff:
-            overdue = overdue.filter(user=request.user)
-
-        data = [
-            {
-                'id': b.book.id,
-                'title': b.book.title,
-                'author': b.book.author,
-                'return_due': b.return_due,
-                'days_overdue': (now - b.return_due).days,
-                'borrowed_by': b.user.username
-            }
-            for b in overdue
-        ]
-
-        return Response(data)
+        if not self.request.user.is_staff:
+            overdue = overdue.filter(user=self.request.user)
+
+        return overdue
+
+    def get_queryset(self):
+        return self.get_overdue().values(
+            'id',
+            'book_id',
+            'return_due',
+            title=F('book__title'),
+            author=F('book__author'),
+            borrowed_by=F('user__username'),
+        )
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['now'] = self.now
+        return context
+
+    def list(self, request, *args, **kwargs):
+        if request.query_params.get('summary') in ('1', 'true'):
+            return Response(self.get_summary())
+        return super().list(request, *args, **kwargs)
+
+    def get_summary(self):
+        # Same whole days as days_overdue: 0-7 days means due less than
+        # 8 days ago, 31+ means due at least 31 days ago
+        eight_days_ago = self.now - timedelta(days=8)
+        thirty_one_days_ago = self.now - timedelta(days=31)
+        overdue = self.get_overdue()
+
+        totals = overdue.aggregate(
+            total=Count('id'),
+            days_0_7=Count('id', filter=Q(return_due__gt=eight_days_ago)),
+            days_8_30=Count('id', filter=Q(return_due__lte=eight_days_ago, return_due__gt=thirty_one_days_ago)),
+            days_31_plus=Count('id', filter=Q(return_due__lte=thirty_one_days_ago)),
+        )
+        top_users = (
+            overdue
+            .values('user_id', username=F('user__username'))
+            .annotate(count=Count('id'))
+            .order_by('-count', 'user_id')[:self.SUMMARY_TOP_USERS]
+        )
+
+        return {
+            'total': totals['total'],
+            'buckets': {
+                '0-7': totals['days_0_7'],
+                '8-30': totals['days_8_30'],
+                '31+': totals['days_31_plus'],
+            },
+            'users': list(top_users),
+        }
     
 # ──────────────────────────────────────────────────────────────
 # USER REGISTRATION & EMAIL VERIFICATION
@@ -344,17 +739,19 @@ class PasswordResetRequestView(APIView):
             return Response({'error': 'Email is required'}, status=status.HTTP_400_BAD_REQUEST)
         user = User.objects.filter(email=email).first()
         if user:
-            EmailVerificationCode.objects.filter(user=user).delete()
-            code = ''.join(str(random.randint(0, 9)) for _ in range(6))
-            expires_at = timezone.now() + timedelta(minutes=15)
-            EmailVerificationCode.objects.create(user=user, code=code, expires_at=expires_at)
-            send_email_async(
-                subject='Password Reset Code',
-                message=f'Your password reset code is: {code}\nValid for 15 minutes.',
-                from_email=settings.EMAIL_HOST_USER,
-                recipient_list=[email],
-                
-            )
+            # Code and outbox email commit together or not at all
+            with transaction.atomic():
+                EmailVerificationCode.objects.filter(user=user).delete()
+                code = ''.join(str(random.randint(0, 9)) for _ in range(6))
+                expires_at = timezone.now() + timedelta(minutes=15)
+                EmailVerificationCode.objects.create(user=user, code=code, expires_at=expires_at)
+                send_email_async(
+                    subject='Password Reset Code',
+                    message=f'Your password reset code is: {code}\nValid for 15 minutes.',
+                    from_email=settings.EMAIL_HOST_USER,
+                    recipient_list=[email],
+                    
+                )
         return Response({'message': 'If the email exists, a reset code has been sent.'})
 
 
@@ -0,0 +1,10 @@
+from django.urls import path
+
+from library.async_views import AvailabilityEventsView
+
+# URLconf of the ASGI events service (see Procfile / render.yaml). It
+# serves only the live availability stream; everything else, streaming
+# exports and book ranges included, stays on the WSGI web service.
+urlpatterns = [
+    path('api/events/availability/', AvailabilityEventsView.as_view(), name='availability-events'),
+]
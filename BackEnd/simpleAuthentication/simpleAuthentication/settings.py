@@ -4,8 +4,9 @@ Django settings for simpleAuthentication project.
 
 from pathlib import Path
 import os
+import tempfile
 import dj_database_url
-from decouple import config
+from decouple import Csv, config
 
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -34,6 +35,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'rest_framework',
     'rest_framework_simplejwt',
     'corsheaders',
@@ -68,7 +70,8 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
-ROOT_URLCONF = 'simpleAuthentication.urls'
+# The ASGI events service sets simpleAuthentication.events_urls
+ROOT_URLCONF = config('ROOT_URLCONF', default='simpleAuthentication.urls')
 
 TEMPLATES = [
     {
@@ -99,6 +102,38 @@ DATABASES = {
     )
 }
 
+# ──────────────────────────────────────────────────────────────
+# CACHE
+# ──────────────────────────────────────────────────────────────
+# Local memory by default; set REDIS_URL to share the catalogue
+# cache between workers.
+REDIS_URL = config("REDIS_URL", default=None)
+
+if REDIS_URL:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+            "LOCATION": "library",
+        }
+    }
+
+# Live availability events (/api/events/availability/) reach every
+# worker through Redis pub/sub when it is configured
+LIBRARY_EVENTS_BACKEND = (
+    "library.events.RedisBroker" if REDIS_URL else "library.events.InProcessBroker"
+)
+
+# Route names (see urls.py) served by the async views in
+# library.async_views instead of the DRF ones; only worth it under ASGI
+LIBRARY_ASYNC_ROUTES = config("LIBRARY_ASYNC_ROUTES", default="", cast=Csv())
+
 # ──────────────────────────────────────────────────────────────
 # AUTH PASSWORD VALIDATORS
 # ──────────────────────────────────────────────────────────────
@@ -122,9 +157,25 @@ STATIC_ROOT = BASE_DIR / 'staticfiles'
 STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 
 
+MEDIA_URL = '/media/'
+MEDIA_ROOT = BASE_DIR / 'media'
+
+
 SUPABASE_URL = config("SUPABASE_URL")
 SUPABASE_KEY = config("SUPABASE_KEY")
 
+# Where Book files and covers are uploaded. Use library.storage.LocalStorage
+# to keep everything under MEDIA_ROOT (tests, offline development).
+LIBRARY_STORAGE_BACKEND = config("LIBRARY_STORAGE_BACKEND", default="library.storage.SupabaseStorage")
+LIBRARY_UPLOAD_WORKERS = config("LIBRARY_UPLOAD_WORKERS", default=2, cast=int)
+# Processes that resize cover photos into thumbnails
+LIBRARY_COVER_WORKERS = config("LIBRARY_COVER_WORKERS", default=2, cast=int)
+# Lifetime in seconds of the signed URLs handed out for book files
+LIBRARY_FILE_URL_TTL = config("LIBRARY_FILE_URL_TTL", default=900, cast=int)
+# Local LRU cache of book files for /api/books/<id>/stream/
+LIBRARY_FILE_CACHE_DIR = config("LIBRARY_FILE_CACHE_DIR", default=os.path.join(tempfile.gettempdir(), "library-book-cache"))
+LIBRARY_FILE_CACHE_MAX_BYTES = config("LIBRARY_FILE_CACHE_MAX_BYTES", default=2 * 1024 ** 3, cast=int)
+
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
@@ -160,6 +211,8 @@ SIMPLE_JWT = {
     "ACCESS_TOKEN_LIFETIME": timedelta(minutes=30),
     "REFRESH_TOKEN_LIFETIME": timedelta(days=7),
     "ROTATE_REFRESH_TOKENS": True,
+    # Reads the username / is_staff / is_active claims added at login
+    "TOKEN_USER_CLASS": "library.authentication.LibraryTokenUser",
     #"USER_AUTHENTICATION_RULE": "library.auth_rules.active_user_only",
 }
 
@@ -228,6 +281,8 @@ DEFAULT_FROM_EMAIL = "support@practicalcodingpdfs.com"
 # ──────────────────────────────────────────────────────────────
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
+        # Loads the user on every request; read-only views opt in to the
+        # stateless or cached classes in library.authentication
         'rest_framework_simplejwt.authentication.JWTAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
@@ -241,6 +296,10 @@ REST_FRAMEWORK = {
 
 APPEND_SLASH = True
 
+# In-process cache of authenticated users (CachedJWTAuthentication)
+LIBRARY_AUTH_USER_CACHE_TTL = config("LIBRARY_AUTH_USER_CACHE_TTL", default=30, cast=int)
+LIBRARY_AUTH_USER_CACHE_SIZE = 1024
+
 # ──────────────────────────────────────────────────────────────
 # SECURITY
 # ──────────────────────────────────────────────────────────────
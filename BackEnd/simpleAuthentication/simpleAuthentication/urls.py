@@ -5,16 +5,31 @@ from rest_framework_simplejwt.views import TokenRefreshView
 from django.http import JsonResponse
 
 from simpleAuthentication import settings
+from library.async_views import (
+    AsyncBookListView,
+    AsyncBorrowedBooksView,
+    AsyncReadBookView,
+    AvailabilityEventsView,
+    route_view,
+)
 from library.views import (
     RegisterView,
     BookListView,
+    BookSearchView,
+    BookStatsView,
+    BookStreamView,
     BorrowBookView,
     BorrowedBooksView,
+    BorrowExportView,
+    BulkBorrowView,
+    HoldView,
     StrictTokenObtainPairView,
     OverdueBooksView,
     ChangePasswordView,
     ReadBookView,
     ReturnBookView,
+    StatsView,
+    SignedFileView,
     VerifyEmailView,
     ResendVerificationCodeView,
     PasswordResetRequestView,
@@ -43,13 +58,21 @@ urlpatterns = [
     path('accounts/', include('allauth.urls')),
 
     # BOOKS
-    path('api/books/', BookListView.as_view(), name='books'),
+    path('api/books/', route_view('books', BookListView, AsyncBookListView), name='books'),
+    path('api/books/search/', BookSearchView.as_view(), name='book-search'),
     path('api/books/<int:book_id>/borrow/', BorrowBookView.as_view(), name='borrow-book'),
-    path('api/books/<int:book_id>/read/', ReadBookView.as_view(), name='read-book'),
+    path('api/books/<int:book_id>/read/', route_view('read-book', ReadBookView, AsyncReadBookView), name='read-book'),
     path('api/books/<int:book_id>/return/', ReturnBookView.as_view(), name='return-book'),
+    path('api/books/<int:book_id>/hold/', HoldView.as_view(), name='book-hold'),
+    path('api/books/<int:book_id>/stream/', BookStreamView.as_view(), name='stream-book'),
+    path('api/books/<int:book_id>/stats/', BookStatsView.as_view(), name='book-stats'),
+    path('api/stats/', StatsView.as_view(), name='stats'),
+    path('api/events/availability/', AvailabilityEventsView.as_view(), name='availability-events'),
+    path('api/files/<path:path>', SignedFileView.as_view(), name='signed-file'),
 
     # USER BOOKS
-    path('api/borrowed/', BorrowedBooksView.as_view(), name='borrowed-books'),
+    path('api/borrowed/', route_view('borrowed-books', BorrowedBooksView, AsyncBorrowedBooksView), name='borrowed-books'),
+    path('api/borrows/bulk/', BulkBorrowView.as_view(), name='bulk-borrow'),
     path('api/overdue/', OverdueBooksView.as_view(), name='overdue-books'),
 
     # PASSWORD
@@ -62,6 +85,7 @@ urlpatterns = [
     path('api/resend-verification-email/', ResendVerificationCodeView.as_view(), name='resend-verification-email'),
 
     # ADMIN
+    path('api/admin/borrows/export/', BorrowExportView.as_view(), name='borrow-export'),
     path('admin/', admin.site.urls),
 ]
 
@@ -4,8 +4,8 @@ import { MatTableModule } from '@angular/material/table';
 import { MatButtonModule } from '@angular/material/button';
 import { MatSnackBar } from '@angular/material/snack-bar';
 import { HeaderComponent } from '../header/header';
-import { LibraryService, Book } from '../../services/library';
-import { Observable, BehaviorSubject, switchMap, map } from 'rxjs';
+import { LibraryService, Book, BookPage } from '../../services/library';
+import { Observable, BehaviorSubject, Subject, EMPTY, switchMap, map, expand, scan, take, tap } from 'rxjs';
 import { AuthService } from '../../services/auth';
 import { PdfReaderComponent } from '../pdf-reader/pdf-reader.component';
 import { HostListener } from '@angular/core';
@@ -31,6 +31,12 @@ export class BookListComponent {
 
   private refreshTrigger = new BehaviorSubject<number>(0);
 
+  private loadMore$ = new Subject<void>();
+
+  hasMoreBooks = false;
+
+  totalBooks = 0;
+
   books$: Observable<{ [key: string]: Book[] }>;
 
   readingBookUrl: string | null = null;
@@ -45,7 +51,29 @@ export class BookListComponent {
 
     this.books$ = this.refreshTrigger.asObservable().pipe(
 
-      switchMap(() => this.libraryService.getBooks()),
+      // Start from the first cursor page on every refresh and fetch the
+      // next page only when the user scrolls near the bottom.
+      switchMap(() => this.libraryService.getBooks().pipe(
+
+        expand((page: BookPage) => page.next
+          ? this.loadMore$.pipe(
+              take(1),
+              switchMap(() => this.libraryService.getBooks({ cursorUrl: page.next }))
+            )
+          : EMPTY
+        ),
+
+        tap((page: BookPage) => {
+          // Only the first page carries the total
+          if (page.count !== undefined) {
+            this.totalBooks = page.count;
+          }
+          this.hasMoreBooks = !!page.next;
+        }),
+
+        scan((books: Book[], page: BookPage) => books.concat(page.results), [] as Book[])
+
+      )),
 
       map((books: Book[]) => {
 
@@ -171,6 +199,9 @@ export class BookListComponent {
   }
 
   onImageError(event: any) {
+    // srcset and <source> win over src, so drop them before falling back
+    event.target.closest('picture')?.querySelectorAll('source').forEach((s: Element) => s.remove());
+    event.target.removeAttribute('srcset');
     event.target.src = 'https://via.placeholder.com/120x180?text=No+Cover';
   }
   
@@ -181,6 +212,13 @@ export class BookListComponent {
   @HostListener('window:scroll', [])
 onScroll() {
   this.showScrollTop = window.scrollY > 300;
+
+  const nearBottom =
+    window.innerHeight + window.scrollY >= document.body.offsetHeight - 600;
+
+  if (nearBottom && this.hasMoreBooks) {
+    this.loadMore$.next();
+  }
 }
 
 }
\ No newline at end of file
@@ -1,6 +1,6 @@
 import { Injectable } from '@angular/core';
-import { HttpClient } from '@angular/common/http';
-import { Observable } from 'rxjs';
+import { HttpClient, HttpParams } from '@angular/common/http';
+import { Observable, map } from 'rxjs';
 import { environment } from '../../environments/environment';
 
 export interface Book {
@@ -9,10 +9,68 @@ export interface Book {
   author: string;
   description?: string; // ← added description
   photo_url?: string;        // URL of the book cover
+  photo_srcset?: { webp?: string; jpeg?: string } | null;  // resized cover variants
   is_borrowed?: boolean; // borrowed status
   file_url?: string;     // link to read the book
 }
 
+export interface BookPage {
+  count?: number;              // total books, on the first page only
+  next: string | null;         // cursor URL for the next page
+  previous: string | null;
+  results: Book[];
+}
+
+export interface OverdueSummary {
+  total: number;
+  buckets: { [range: string]: number };   // '0-7', '8-30', '31+' days overdue
+  users: { user_id: number; username: string; count: number }[];
+}
+
+export interface BulkBorrowResult {
+  book_id: number;
+  status: number;              // what the single-book endpoint would return
+  message?: string;
+  error?: string;
+  borrow_date?: string;
+  return_due?: string;
+  returned_date?: string;
+}
+
+export interface BookQuery {
+  cursorUrl?: string | null;   // full `next` URL from the previous page
+  pageSize?: number;
+  fields?: string[];           // e.g. ['id', 'title'] to skip description
+  sort?: 'newest' | 'popular';
+  available?: boolean;         // only books nobody has out right now
+}
+
+export interface AvailabilityDelta {
+  book_id: number;
+  available: number;           // copies free right now
+  total: number;
+}
+
+export interface BookHold {
+  book_id: number;
+  position: number;            // 1 = next in line
+  queued_at: string;
+}
+
+export interface BookStatsRow {
+  borrows: number;
+  returns: number;
+  overdue_returns: number;
+  avg_loan_days: number | null;
+  overdue_rate: number | null;
+}
+
+export interface LibraryStats {
+  window_days: number;
+  top_books: (BookStatsRow & { book_id: number; title: string; author: string })[];
+  me: BookStatsRow;
+}
+
 @Injectable({
   providedIn: 'root'
 })
@@ -22,8 +80,36 @@ export class LibraryService {
   constructor(private http: HttpClient) {}
 
   // Books
-  getBooks(): Observable<Book[]> {
-    return this.http.get<Book[]>(`${this.baseUrl}/api/books/`);   
+  getBooks(query: BookQuery = {}): Observable<BookPage> {
+    if (query.cursorUrl) {
+      return this.http.get<BookPage>(query.cursorUrl);
+    }
+
+    let params = new HttpParams();
+    if (query.pageSize) {
+      params = params.set('page_size', query.pageSize);
+    }
+    if (query.fields?.length) {
+      params = params.set('fields', query.fields.join(','));
+    }
+    if (query.sort) {
+      params = params.set('sort', query.sort);
+    }
+    if (query.available) {
+      params = params.set('available', 1);
+    }
+
+    return this.http.get<BookPage>(`${this.baseUrl}/api/books/`, { params });
+  }
+
+  searchBooks(q: string, page = 1): Observable<BookPage> {
+    const params = new HttpParams().set('q', q).set('page', page);
+    return this.http.get<BookPage>(`${this.baseUrl}/api/books/search/`, { params });
+  }
+
+  getStats(days = 30): Observable<LibraryStats> {
+    const params = new HttpParams().set('days', days);
+    return this.http.get<LibraryStats>(`${this.baseUrl}/api/stats/`, { params });
   }
 
   borrowBook(bookId: number) {
@@ -34,6 +120,52 @@ export class LibraryService {
     return this.http.post(`${this.baseUrl}/api/books/${bookId}/return/`, {});
   }
 
+  // Live availability (Server-Sent Events). EventSource can't send
+  // headers, so the access token goes in the query string.
+  availabilityUpdates(token: string): Observable<AvailabilityDelta[]> {
+    return new Observable<AvailabilityDelta[]>(subscriber => {
+      const url = `${environment.eventsUrl}/api/events/availability/?token=${encodeURIComponent(token)}`;
+      const source = new EventSource(url);
+      source.addEventListener('availability', event =>
+        subscriber.next(JSON.parse((event as MessageEvent).data))
+      );
+      // The server ends the stream when the token expires; resubscribe
+      // with a refreshed token
+      source.addEventListener('expired', () => {
+        source.close();
+        subscriber.complete();
+      });
+      // EventSource reconnects on its own; only a refused stream is final
+      source.onerror = () => {
+        if (source.readyState === EventSource.CLOSED) {
+          subscriber.error(new Error('Live updates unavailable'));
+        }
+      };
+      return () => source.close();
+    });
+  }
+
+  // Hold queue: only joinable while every copy is out (borrow gives 409)
+  getHold(bookId: number): Observable<BookHold> {
+    return this.http.get<BookHold>(`${this.baseUrl}/api/books/${bookId}/hold/`);
+  }
+
+  placeHold(bookId: number): Observable<BookHold> {
+    return this.http.post<BookHold>(`${this.baseUrl}/api/books/${bookId}/hold/`, {});
+  }
+
+  cancelHold(bookId: number) {
+    return this.http.delete(`${this.baseUrl}/api/books/${bookId}/hold/`);
+  }
+
+  // Borrow or return several books in one request / one transaction
+  bulkBorrow(bookIds: number[], action: 'borrow' | 'return') {
+    return this.http.post<{ action: string; results: BulkBorrowResult[] }>(
+      `${this.baseUrl}/api/borrows/bulk/`,
+      { action, book_ids: bookIds }
+    );
+  }
+
   getBorrowedBooks() {
     return this.http.get<any[]>(`${this.baseUrl}/api/borrowed/`);   // ← added /
   }
@@ -43,7 +175,15 @@ export class LibraryService {
 }
 
   getOverdueBooks() {
-    return this.http.get<any[]>(`${this.baseUrl}/api/overdue/`);   // ← added /
+    // The endpoint is cursor paginated; the first page (most overdue) is
+    // all a regular user ever has.
+    return this.http.get<{ count: number; results: any[] }>(`${this.baseUrl}/api/overdue/`).pipe(
+      map((page) => page.results)
+    );
+  }
+
+  getOverdueSummary() {
+    return this.http.get<OverdueSummary>(`${this.baseUrl}/api/overdue/`, { params: { summary: 1 } });
   }
 
   // Password Reset
@@ -1,4 +1,6 @@
 export const environment = {
   production: true,
-  apiUrl: 'https://online-library-tum.onrender.com'
+  apiUrl: 'https://online-library-tum.onrender.com',
+  // ASGI service for the live availability stream
+  eventsUrl: 'https://online-library-events.onrender.com'
 };
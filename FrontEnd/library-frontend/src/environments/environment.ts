@@ -1,4 +1,6 @@
 export const environment = {
   production: false,
-  apiUrl: 'http://localhost:8000'
+  apiUrl: 'http://localhost:8000',
+  // ASGI service for the live availability stream
+  eventsUrl: 'http://localhost:8001'
 };